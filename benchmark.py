@@ -0,0 +1,500 @@
+"""
+Benchmark reproducible del pipeline de audio.
+
+Genera audio sintético determinístico (voz sintética + ruido de fondo + tramos clipeados) en
+varias duraciones, formatos, sample rates y canales, y mide:
+  - tiempos por etapa de procesar_audio_core (timings_ms) y RSS pico, cada caso en un proceso
+    nuevo para que el pico no arrastre lo del caso anterior;
+  - analizar_audio por separado (mediana de N repeticiones);
+  - requests end-to-end contra la app en proceso (TestClient) a varios niveles de concurrencia.
+  - (--dsp) la cadena DSP en NumPy contra la de ffmpeg: tiempos y diferencias de loudness y picos.
+  - (--parity) el análisis NumPy contra el de pydub en buffers de largo impar.
+
+El resultado es un JSON (stdout o --out) para comparar corridas en el tiempo.
+
+Uso:
+    python benchmark.py --preset quick --out bench.json
+    python benchmark.py --durations 10,300 --formats wav,mp3 --concurrency 1,4 --no-http
+    python benchmark.py --dsp --no-cases --no-http   # cadena NumPy vs ffmpeg
+    python benchmark.py --parity --no-cases --no-http   # análisis NumPy vs pydub (sale 1 si difieren)
+    DSP_PARALLEL_WORKERS=4 python benchmark.py --dsp --no-cases --no-http --durations 600   # + por segmentos
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Antes de importar main: sin cache (cada request procesa), sin retención ni métricas en DB
+os.environ.setdefault("CACHE_ENABLED", "0")
+os.environ.setdefault("RETENTION_ENABLED", "0")
+os.environ.setdefault("ENABLE_DB_METRICS", "0")
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE_DIR))
+
+PRESETS = {
+    "quick": {"durations": [10, 60], "rates": [44100], "channels": [1, 2], "formats": ["wav", "mp3"]},
+    "full": {"durations": [10, 60, 300, 900], "rates": [44100, 48000], "channels": [1, 2], "formats": ["wav", "mp3", "m4a"]},
+}
+
+# Codificación de cada formato de prueba (wav se escribe directo con el módulo wave)
+CODECS = {
+    "mp3": ["-c:a", "libmp3lame", "-b:a", "128k"],
+    "m4a": ["-c:a", "aac", "-b:a", "128k"],
+    "flac": ["-c:a", "flac"],
+    "ogg": ["-c:a", "libvorbis", "-q:a", "4"],
+}
+
+
+# =========================
+#   AUDIO SINTÉTICO
+# =========================
+def sintetizar(dur_s: float, sr: int, ch: int, seed: int) -> np.ndarray:
+    """
+    Voz sintética: armónicos sobre un f0 que se mueve lento, envolvente silábica (~4 Hz) y pausas
+    al azar; más ruido de fondo grave y dos tramos saturados para que el detector de clip tenga
+    trabajo. Devuelve int16 con forma (n, ch). Mismo seed -> mismas muestras.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(dur_s * sr)
+    t = np.arange(n) / sr
+
+    f0 = 150.0 + 35.0 * np.sin(2 * np.pi * 0.27 * t) + 10.0 * np.sin(2 * np.pi * 1.3 * t)
+    fase = 2 * np.pi * np.cumsum(f0) / sr
+    voz = np.zeros(n)
+    for k in range(1, 9):
+        voz += np.sin(k * fase) / k
+
+    silabas = 0.5 * (1 - np.cos(2 * np.pi * 4.0 * t))
+    # Pausas: bloques de 0.5 s en silencio con probabilidad 0.2
+    bloque = int(0.5 * sr)
+    gate = np.repeat(rng.random(n // bloque + 1) > 0.2, bloque)[:n].astype(np.float64)
+
+    ruido = np.cumsum(rng.standard_normal(n))
+    ruido -= np.convolve(ruido, np.ones(256) / 256, mode="same")  # saca la deriva del random walk
+    ruido *= 0.004 / (np.std(ruido) or 1.0)
+
+    x = 0.18 * voz * silabas * gate + ruido
+    for centro in (0.3, 0.7):
+        a = int(centro * n)
+        b = min(n, a + int(0.2 * sr))
+        x[a:b] *= 6.0
+    x = np.clip(x, -1.0, 1.0)
+
+    canales = [x]
+    for c in range(1, ch):
+        # Otro canal: copia levemente retrasada y atenuada (como un par estéreo real)
+        canales.append(0.9 * np.roll(x, 11 * c))
+    return (np.stack(canales, axis=1) * 32767).astype("<i2")
+
+
+def escribir_caso(directory: Path, dur_s: float, sr: int, ch: int, fmt: str, seed: int) -> Optional[Path]:
+    """Escribe el audio del caso en el formato pedido; None si el formato necesita ffmpeg y no hay."""
+    pcm = sintetizar(dur_s, sr, ch, seed)
+    path = directory / f"bench_{int(dur_s)}s_{sr}_{ch}ch.{fmt}"
+    if fmt == "wav":
+        with wave.open(str(path), "wb") as w:
+            w.setnchannels(ch)
+            w.setsampwidth(2)
+            w.setframerate(sr)
+            w.writeframes(pcm.tobytes())
+        return path
+    if shutil.which("ffmpeg") is None or fmt not in CODECS:
+        return None
+    cmd = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "s16le", "-ar", str(sr), "-ac", str(ch), "-i", "pipe:0",
+        *CODECS[fmt], str(path),
+    ]
+    subprocess.run(cmd, input=pcm.tobytes(), check=True, capture_output=True)
+    return path
+
+
+# =========================
+#   CASOS (un proceso por caso)
+# =========================
+def _preparar_main(workdir: Path):
+    """Importa main apuntando media/ a un directorio temporal (no ensucia el media/ real)."""
+    import main
+
+    main.ORIGINAL_DIR = workdir / "original"
+    main.PROCESSED_DIR = workdir / "processed"
+    main.REPORT_DIR = workdir / "reports"
+    for d in (main.ORIGINAL_DIR, main.PROCESSED_DIR, main.REPORT_DIR):
+        d.mkdir(parents=True, exist_ok=True)
+    return main
+
+
+def _proc_status_mb(campo: str) -> Optional[float]:
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for linea in f:
+                if linea.startswith(campo + ":"):
+                    return round(int(linea.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _reset_pico() -> bool:
+    """Reinicia VmHWM (Linux). ru_maxrss no sirve acá: sobrevive al fork+exec del spawn."""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _rss_actual_mb() -> Optional[float]:
+    return _proc_status_mb("VmRSS")
+
+
+def _rss_pico_mb() -> float:
+    pico = _proc_status_mb("VmHWM")
+    if pico is not None:
+        return pico
+    # Sin /proc (macOS): ru_maxrss en bytes (KB en Linux)
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024, 1)
+
+
+def _correr_caso(path_str: str, workdir_str: str, mode: str, repeats: int) -> Dict[str, Any]:
+    """Corre en un proceso recién creado: procesar_audio_core una vez + analizar_audio N veces."""
+    main = _preparar_main(Path(workdir_str))
+    path = Path(path_str)
+    pico_exacto = _reset_pico()
+    rss_inicio = _rss_actual_mb()
+
+    t0 = time.perf_counter()
+    _, analisis = main.procesar_audio_core(path, mode)
+    total_ms = (time.perf_counter() - t0) * 1000.0
+    rss_core = _rss_pico_mb()
+
+    audio = main.AudioSegment.from_file(path)
+    tiempos = []
+    for _ in range(max(1, repeats)):
+        t1 = time.perf_counter()
+        main.analizar_audio(audio, original_path=path)
+        tiempos.append((time.perf_counter() - t1) * 1000.0)
+
+    return {
+        "total_ms": round(total_ms, 1),
+        "timings_ms": analisis.get("timings_ms"),
+        "dsp_backend": analisis.get("dsp_backend"),
+        "analizar_audio_ms": {
+            "median": round(statistics.median(tiempos), 2),
+            "min": round(min(tiempos), 2),
+            "repeats": len(tiempos),
+        },
+        # Solo el proceso Python; ffmpeg corre aparte y no entra en la cuenta
+        "rss_mb": {
+            "baseline": rss_inicio,
+            "peak_core": rss_core,
+            "peak_exact": pico_exacto,
+        },
+        "quality_score": analisis.get("quality_score"),
+        "clip_detectado": analisis.get("clip_detectado"),
+    }
+
+
+def bench_casos(args, workdir: Path) -> List[Dict[str, Any]]:
+    resultados = []
+    ctx = multiprocessing.get_context("spawn")
+    seed = args.seed
+    for dur in args.durations:
+        for sr in args.rates:
+            for ch in args.channels:
+                for fmt in args.formats:
+                    caso = {"duration_s": dur, "sample_rate": sr, "channels": ch, "format": fmt, "seed": seed}
+                    path = escribir_caso(workdir, dur, sr, ch, fmt, seed)
+                    if path is None:
+                        resultados.append({**caso, "skipped": "ffmpeg no disponible para este formato"})
+                        continue
+                    caso["input_bytes"] = path.stat().st_size
+                    print(f"[bench] {path.name} ...", file=sys.stderr)
+                    try:
+                        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as ex:
+                            caso.update(ex.submit(_correr_caso, str(path), str(workdir), args.mode, args.repeats).result())
+                    except Exception as e:
+                        caso["error"] = f"{type(e).__name__}: {e}"
+                    resultados.append(caso)
+                    path.unlink(missing_ok=True)
+    return resultados
+
+
+# =========================
+#   HTTP END-TO-END
+# =========================
+def _percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    orden = sorted(valores)
+    k = min(len(orden) - 1, max(0, int(round(p / 100.0 * (len(orden) - 1)))))
+    return round(orden[k], 1)
+
+
+def bench_http(args, workdir: Path) -> List[Dict[str, Any]]:
+    try:
+        from fastapi.testclient import TestClient
+    except Exception as e:  # TestClient necesita httpx
+        return [{"skipped": f"TestClient no disponible: {e}"}]
+
+    main = _preparar_main(workdir)
+    path = escribir_caso(workdir, args.http_duration, 44100, 2, "wav", args.seed)
+    payload = path.read_bytes()
+    resultados = []
+
+    with TestClient(main.app) as client:
+        def un_request(i: int):
+            t0 = time.perf_counter()
+            r = client.post(
+                "/process",
+                files={"file": (f"bench_{i}.wav", payload, "audio/wav")},
+                data={"modo": args.mode, "lang": "es"},
+            )
+            return r.status_code, (time.perf_counter() - t0) * 1000.0
+
+        for nivel in args.concurrency:
+            n = max(args.http_requests, nivel)
+            print(f"[bench] HTTP concurrencia={nivel} requests={n} ...", file=sys.stderr)
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=nivel) as ex:
+                respuestas = list(ex.map(un_request, range(n)))
+            wall_s = time.perf_counter() - t0
+
+            ok = [ms for code, ms in respuestas if code == 200]
+            codigos: Dict[str, int] = {}
+            for code, _ in respuestas:
+                codigos[str(code)] = codigos.get(str(code), 0) + 1
+            resultados.append({
+                "concurrency": nivel,
+                "requests": n,
+                "status_codes": codigos,
+                "throughput_rps": round(len(ok) / wall_s, 3) if wall_s > 0 else None,
+                "latency_ms": {
+                    "p50": _percentil(ok, 50),
+                    "p95": _percentil(ok, 95),
+                    "max": round(max(ok), 1) if ok else None,
+                },
+            })
+    path.unlink(missing_ok=True)
+    return resultados
+
+
+# =========================
+#   DSP: NumPy vs ffmpeg
+# =========================
+def _medir_salida(main, audio) -> Dict[str, Any]:
+    m = main.metricas_audio(
+        audio, ventanas=False,
+        loudness=main.nuevo_medidor(audio.frame_rate, audio.channels, audio.sample_width),
+    )
+    return {
+        "lufs": round(m["lufs"], 2) if m.get("lufs") is not None else None,
+        "true_peak_dbtp": round(m["true_peak_db"], 2) if "true_peak_db" in m else None,
+        "peak_dbfs": round(m["peak_db"], 2),
+        "nivel_dbfs": round(m["nivel_dbfs"], 2),
+    }
+
+
+def bench_dsp(args, workdir: Path) -> List[Dict[str, Any]]:
+    """La misma entrada por la cadena de ffmpeg (pipe) y por la de NumPy: tiempos y diferencias de nivel."""
+    main = _preparar_main(workdir)
+    resultados = []
+    for dur in args.durations:
+        for sr in args.rates:
+            for ch in args.channels:
+                caso: Dict[str, Any] = {"duration_s": dur, "sample_rate": sr, "channels": ch, "seed": args.seed}
+                print(f"[bench] DSP {dur}s {sr} Hz {ch} ch ...", file=sys.stderr)
+                x = sintetizar(dur, sr, ch, args.seed)
+                audio = main.recortar_bordes(main.AudioSegment(data=x.tobytes(), sample_width=2, frame_rate=sr, channels=ch))
+                del x
+
+                t0 = time.perf_counter()
+                salida, _ = main._dsp_numpy(audio, main.Etapas(), main.FADE_OUT_MS, main.CEILING_DBFS)
+                caso["numpy"] = {"ms": round((time.perf_counter() - t0) * 1000.0, 1), **_medir_salida(main, salida)}
+                segmentos = main.segmentos_dsp(audio)
+                if segmentos:
+                    # DSP_PARALLEL_WORKERS: la misma cadena repartida en segmentos (incluye arrancar el pool)
+                    t0 = time.perf_counter()
+                    salida, _ = main._dsp_numpy(audio, main.Etapas(), main.FADE_OUT_MS, main.CEILING_DBFS, segmentos)
+                    caso["numpy_parallel"] = {
+                        "segments": segmentos, "ms": round((time.perf_counter() - t0) * 1000.0, 1),
+                        **_medir_salida(main, salida),
+                    }
+                try:
+                    t0 = time.perf_counter()
+                    salida = main.ffmpeg_dsp_pipe(audio, workdir / "dsp_ffmpeg.wav", main.FADE_OUT_MS, main.CEILING_DBFS)
+                    caso["ffmpeg"] = {"ms": round((time.perf_counter() - t0) * 1000.0, 1), **_medir_salida(main, salida)}
+                    if segmentos:
+                        t0 = time.perf_counter()
+                        salida = main.ffmpeg_dsp_segmentado(audio, segmentos, main.FADE_OUT_MS, main.CEILING_DBFS)
+                        caso["ffmpeg_parallel"] = {
+                            "segments": segmentos, "ms": round((time.perf_counter() - t0) * 1000.0, 1),
+                            **_medir_salida(main, salida),
+                        }
+                except FileNotFoundError:
+                    caso["ffmpeg"] = {"skipped": "ffmpeg no disponible"}
+                    resultados.append(caso)
+                    continue
+                finally:
+                    (workdir / "dsp_ffmpeg.wav").unlink(missing_ok=True)
+                # NumPy - ffmpeg (en dB); alimiter agrega attack ms de latencia, así que se compara por nivel
+                caso["delta_db"] = {
+                    k: round(caso["numpy"][k] - caso["ffmpeg"][k], 2)
+                    for k in ("lufs", "true_peak_dbtp", "peak_dbfs", "nivel_dbfs")
+                    if caso["numpy"][k] is not None and caso["ffmpeg"][k] is not None
+                }
+                resultados.append(caso)
+    return resultados
+
+
+# =========================
+#   PARIDAD: análisis NumPy vs pydub
+# =========================
+# Colas en frames que dejan la última ventana de 200 ms parcial y un len() en ms redondeado
+# para arriba o para abajo (pydub rellena o recorta esa ventana)
+PARIDAD_COLAS = (0, 1, 17, 23, 24, 25, 47, 123, 4411)
+# "Dentro del redondeo": los niveles salen de un RMS entero, así que solo cabe ruido de float
+PARIDAD_TOLERANCIA_DB = 0.01
+
+
+def paridad_analisis(args) -> Dict[str, Any]:
+    """_metricas_numpy contra _metricas_pydub sobre buffers de largo impar (mismas muestras)."""
+    import main
+
+    casos = []
+    for sr in sorted(set(args.rates) | {48000, 22050}):
+        for ch in args.channels:
+            base = sintetizar(3.0, sr, ch, args.seed)
+            for cola in PARIDAD_COLAS:
+                x = base[: 2 * sr + cola]
+                audio = main.AudioSegment(data=x.tobytes(), sample_width=2, frame_rate=sr, channels=ch)
+                a = main._metricas_numpy(audio)
+                b = main._metricas_pydub(audio)
+                caso: Dict[str, Any] = {"sample_rate": sr, "channels": ch, "frames": len(x), "dur_ms": b["dur_ms"]}
+                caso["ventanas"] = [len(a["niveles"]), len(b["niveles"])]
+                diffs = [abs(a[k] - b[k]) for k in ("nivel_dbfs", "peak_db")]
+                if len(a["niveles"]) == len(b["niveles"]):
+                    diffs += [abs(u - v) for u, v in zip(a["niveles"], b["niveles"])]
+                caso["max_diff_db"] = round(max(diffs), 4)
+                caso["ok"] = (
+                    a["dur_ms"] == b["dur_ms"]
+                    and len(a["niveles"]) == len(b["niveles"])
+                    and caso["max_diff_db"] <= PARIDAD_TOLERANCIA_DB
+                    and abs(a["peak_ratio"] - b["peak_ratio"]) < 1e-9
+                    and abs(a["clip_ratio"] - b["clip_ratio"]) < 1e-9
+                )
+                if not caso["ok"]:
+                    print(f"[bench] Paridad falló: {caso}", file=sys.stderr)
+                casos.append(caso)
+    return {"ok": all(c["ok"] for c in casos), "tolerance_db": PARIDAD_TOLERANCIA_DB, "cases": casos}
+
+
+# =========================
+#   META + CLI
+# =========================
+def _version_ffmpeg() -> Optional[str]:
+    try:
+        out = subprocess.run(["ffmpeg", "-version"], capture_output=True, check=True, timeout=10).stdout
+        return out.decode("utf-8", "replace").splitlines()[0]
+    except (OSError, subprocess.SubprocessError, IndexError):
+        return None
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=BASE_DIR, capture_output=True, check=True, timeout=10).stdout
+        return out.decode().strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def meta() -> Dict[str, Any]:
+    claves = (
+        "ANALYSIS_ENGINE", "FFMPEG_MODE", "DSP_BACKEND", "PROCESSING_MODE", "EXEC_BACKEND",
+        "STREAMING_MIN_DURATION_S", "STREAM_BLOCK_S", "JOB_WORKERS", "PROCESS_WORKERS",
+        "DSP_PARALLEL_WORKERS", "DSP_PARALLEL_MIN_S",
+    )
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "ffmpeg": _version_ffmpeg(),
+        "env": {k: os.environ[k] for k in claves if k in os.environ},
+    }
+
+
+def _lista(tipo):
+    return lambda s: [tipo(x) for x in s.split(",") if x.strip()]
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark reproducible del pipeline de audio.")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick")
+    parser.add_argument("--durations", type=_lista(float), help="Duraciones en segundos (ej. 10,60,300)")
+    parser.add_argument("--rates", type=_lista(int), help="Sample rates (ej. 44100,48000)")
+    parser.add_argument("--channels", type=_lista(int), help="Canales (ej. 1,2)")
+    parser.add_argument("--formats", type=_lista(str), help=f"wav y/o {','.join(CODECS)}")
+    parser.add_argument("--mode", default="LAPTOP_CELULAR", choices=["LAPTOP_CELULAR", "MICROFONO_EXTERNO"])
+    parser.add_argument("--repeats", type=int, default=3, help="Repeticiones de analizar_audio por caso")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--concurrency", type=_lista(int), default=[1, 2, 4])
+    parser.add_argument("--http-requests", type=int, default=8, help="Requests por nivel de concurrencia")
+    parser.add_argument("--http-duration", type=float, default=30.0, help="Duración del audio de los requests HTTP")
+    parser.add_argument("--no-cases", action="store_true", help="Saltar los casos por etapa")
+    parser.add_argument("--no-http", action="store_true", help="Saltar el benchmark HTTP")
+    parser.add_argument("--dsp", action="store_true", help="Comparar la cadena DSP en NumPy contra ffmpeg")
+    parser.add_argument("--parity", action="store_true", help="Comparar el análisis NumPy con el de pydub (sale 1 si difieren)")
+    parser.add_argument("--out", type=Path, help="Archivo JSON de salida (por defecto stdout)")
+    args = parser.parse_args(argv)
+
+    preset = PRESETS[args.preset]
+    for k in ("durations", "rates", "channels", "formats"):
+        if getattr(args, k) is None:
+            setattr(args, k, preset[k])
+
+    resultado: Dict[str, Any] = {
+        "meta": meta(),
+        "params": {k: v for k, v in vars(args).items() if k != "out"},
+    }
+    with tempfile.TemporaryDirectory(prefix="podcasterapp_bench_") as tmp:
+        workdir = Path(tmp)
+        if not args.no_cases:
+            resultado["cases"] = bench_casos(args, workdir)
+        if not args.no_http:
+            resultado["http"] = bench_http(args, workdir)
+        if args.dsp:
+            resultado["dsp"] = bench_dsp(args, workdir)
+        if args.parity:
+            resultado["parity"] = paridad_analisis(args)
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False, default=str)
+    if args.out:
+        args.out.write_text(texto + "\n", encoding="utf-8")
+        print(f"[bench] Resultados en {args.out}", file=sys.stderr)
+    else:
+        print(texto)
+    return 1 if args.parity and not resultado["parity"]["ok"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
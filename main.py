@@ -1,21 +1,45 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, BackgroundTasks
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi import FastAPI, Form, HTTPException, Request, BackgroundTasks
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
 from fastapi import Response
 
 from pathlib import Path
-from typing import Dict, Any, Tuple, Optional
+from typing import Dict, Any, Tuple, Optional, Callable, Awaitable
+import argparse
 import time
 
 import sys
+import io
+import math
+import random
 import types
 import os
+import re
 import logging
 import hashlib
+import gzip
+import mimetypes
+import stat
 import uuid
+import wave
+import zipfile
 import subprocess
 import tempfile
+import json
+import heapq
+import bisect
+import asyncio
+import threading
+import multiprocessing
+import cProfile
+import pstats
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError, CancelledError
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from html import escape as html_escape
 
 # --------------------------------------
@@ -35,6 +59,26 @@ except ImportError:
 
 from pydub import AudioSegment, effects
 
+# python-multipart se importa como python_multipart desde 0.0.13 (antes, como multipart)
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+    from python_multipart.exceptions import MultipartParseError
+except ImportError:
+    from multipart.multipart import MultipartParser, parse_options_header  # type: ignore
+    from multipart.exceptions import MultipartParseError  # type: ignore
+
+# NumPy es opcional: si no está, el análisis usa el camino pydub original.
+try:
+    import numpy as np  # type: ignore
+except ImportError:
+    np = None  # type: ignore
+
+# brotli es opcional: sin él los assets estáticos solo se precomprimen con gzip.
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None  # type: ignore
+
 # =========================
 #   LOGGING
 # =========================
@@ -90,6 +134,7 @@ CREATE TABLE IF NOT EXISTS request_metrics (
   input_bytes BIGINT,
   output_bytes BIGINT,
   report_bytes BIGINT,
+  output_formats JSONB,
 
   duration_original_s DOUBLE PRECISION,
   duration_processed_s DOUBLE PRECISION,
@@ -103,22 +148,29 @@ CREATE TABLE IF NOT EXISTS request_metrics (
 );
 """
 
-INSERT_SQL = """
-INSERT INTO request_metrics (
-  id, mode, client_ip_hash, user_agent,
-  input_filename, input_bytes, output_bytes, report_bytes,
-  duration_original_s, duration_processed_s,
-  processing_ms,
-  quality_score, snr_db, sala_indice, clip_detectado
-) VALUES (
-  %(id)s, %(mode)s, %(client_ip_hash)s, %(user_agent)s,
-  %(input_filename)s, %(input_bytes)s, %(output_bytes)s, %(report_bytes)s,
-  %(duration_original_s)s, %(duration_processed_s)s,
-  %(processing_ms)s,
-  %(quality_score)s, %(snr_db)s, %(sala_indice)s, %(clip_detectado)s
-);
+# Columnas agregadas después de crear la tabla (instalaciones existentes)
+MIGRATIONS_SQL = """
+ALTER TABLE request_metrics ADD COLUMN IF NOT EXISTS output_formats JSONB;
 """
 
+METRICS_COLUMNS = (
+    "id", "mode", "client_ip_hash", "user_agent",
+    "input_filename", "input_bytes", "output_bytes", "report_bytes", "output_formats",
+    "duration_original_s", "duration_processed_s",
+    "processing_ms",
+    "quality_score", "snr_db", "sala_indice", "clip_detectado",
+)
+
+
+def insert_metrics_sql(n_rows: int) -> str:
+    """INSERT multi-fila con placeholders %s (sirve igual para psycopg y psycopg2)."""
+    fila = "(" + ", ".join(["%s"] * len(METRICS_COLUMNS)) + ")"
+    return (
+        f"INSERT INTO request_metrics ({', '.join(METRICS_COLUMNS)}) VALUES "
+        + ", ".join([fila] * n_rows)
+        + " ON CONFLICT (id) DO NOTHING;"
+    )
+
 def _anonymize_ip(ip: Optional[str]) -> Optional[str]:
     if not ip:
         return None
@@ -126,28 +178,27 @@ def _anonymize_ip(ip: Optional[str]) -> Optional[str]:
     return h[:16]
 
 
+def _connect_db():
+    """Conexión autocommit con el driver disponible."""
+    if db_driver == "psycopg2" and psycopg2 is not None:
+        conn = psycopg2.connect(DATABASE_URL)
+        conn.autocommit = True
+        return conn
+    if db_driver == "psycopg" and psycopg is not None:
+        return psycopg.connect(DATABASE_URL, autocommit=True)
+    raise RuntimeError("No hay driver de Postgres disponible.")
+
+
 def _exec_sql(sql: str, params: Optional[dict] = None) -> None:
     if not db_metrics_ready():
         return
     try:
-        if db_driver == "psycopg2":
-            if psycopg2 is None:
-                return
-            conn = psycopg2.connect(DATABASE_URL)
-            conn.autocommit = True
-            try:
-                with conn.cursor() as cur:
-                    cur.execute(sql, params)
-            finally:
-                conn.close()
-
-        elif db_driver == "psycopg":
-            if psycopg is None:
-                return
-            with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
-                with conn.cursor() as cur:
-                    cur.execute(sql, params)
-
+        conn = _connect_db()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+        finally:
+            conn.close()
     except Exception as e:
         logger.warning(f"[DB_METRICS] Error ejecutando SQL: {e}")
 
@@ -158,11 +209,352 @@ def init_db() -> None:
             logger.warning("[DB_METRICS] ENABLE_DB_METRICS=1 pero no hay driver instalado (psycopg2/psycopg).")
         return
     _exec_sql(CREATE_TABLE_SQL)
+    _exec_sql(MIGRATIONS_SQL)
     logger.info("[DB_METRICS] Tabla request_metrics lista.")
 
 
+# Filas por INSERT y máximo tiempo que una fila espera en el buffer
+METRICS_BATCH_SIZE = max(1, int(os.getenv("METRICS_BATCH_SIZE", "50")))
+METRICS_FLUSH_INTERVAL_S = float(os.getenv("METRICS_FLUSH_INTERVAL_S", "5"))
+# Si la DB no responde, el buffer no crece más que esto: se descartan las filas más viejas
+METRICS_BUFFER_MAX = max(1, int(os.getenv("METRICS_BUFFER_MAX", "5000")))
+
+
+class MetricsWriter:
+    """
+    Escribe request_metrics desde un hilo propio con una conexión persistente (se reabre
+    si falla) e INSERTs multi-fila al llegar a batch_size filas o cada flush_interval_s.
+    record_metrics solo encola: nunca abre conexiones en el camino del request.
+    connect es inyectable para probar contra un Postgres local o un stand-in.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        batch_size: int = METRICS_BATCH_SIZE,
+        flush_interval_s: float = METRICS_FLUSH_INTERVAL_S,
+        buffer_max: int = METRICS_BUFFER_MAX,
+    ):
+        self._connect = connect
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.buffer_max = buffer_max
+
+        self._buf: deque = deque()
+        self._cond = threading.Condition()
+        self._conn = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = False
+        self._backoff_s = 0.0
+
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.errors = 0
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stop = False
+            self._thread = threading.Thread(target=self._run, name="metrics-writer", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, payload: Dict[str, Any]) -> None:
+        row = tuple(payload.get(c) for c in METRICS_COLUMNS)
+        with self._cond:
+            self._buf.append(row)
+            self._descartar_exceso()
+            if len(self._buf) >= self.batch_size:
+                self._cond.notify()
+
+    def _descartar_exceso(self) -> None:
+        while len(self._buf) > self.buffer_max:
+            self._buf.popleft()
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._backoff_s > 0:
+                    # DB caída: esperar el backoff completo aunque el buffer esté lleno
+                    deadline = time.monotonic() + self._backoff_s
+                    while not self._stop and deadline > time.monotonic():
+                        self._cond.wait(timeout=deadline - time.monotonic())
+                elif not self._stop and len(self._buf) < self.batch_size:
+                    self._cond.wait(timeout=self.flush_interval_s)
+                stop = self._stop
+            self.flush()
+            if stop:
+                break
+        self._cerrar_conexion()
+
+    def flush(self) -> int:
+        """Vacía el buffer en lotes; si la DB falla, devuelve las filas al buffer. Devuelve filas escritas."""
+        escritas = 0
+        while True:
+            with self._cond:
+                if not self._buf:
+                    break
+                lote = [self._buf.popleft() for _ in range(min(self.batch_size, len(self._buf)))]
+            try:
+                self._insertar(lote)
+            except Exception as e:
+                self._cerrar_conexion()
+                logger.warning(f"[DB_METRICS] Flush falló ({len(lote)} filas en espera): {e}")
+                # Contadores bajo el lock: stats() los lee desde los hilos de los requests
+                with self._cond:
+                    self.errors += 1
+                    self._backoff_s = min(60.0, max(1.0, self._backoff_s * 2))
+                    self._buf.extendleft(reversed(lote))
+                    self._descartar_exceso()
+                break
+            with self._cond:
+                self._backoff_s = 0.0
+                self.batches += 1
+                self.written += len(lote)
+            escritas += len(lote)
+        return escritas
+
+    def _insertar(self, lote: list) -> None:
+        if self._conn is None:
+            self._conn = self._connect()
+        params = [v for row in lote for v in row]
+        with self._conn.cursor() as cur:
+            cur.execute(insert_metrics_sql(len(lote)), params)
+
+    def _cerrar_conexion(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Flush final (shutdown). Lo que no se pudo escribir queda contado como descartado."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=timeout)
+        else:
+            self.flush()
+            self._cerrar_conexion()
+        with self._cond:
+            if self._buf:
+                logger.warning(f"[DB_METRICS] {len(self._buf)} filas sin escribir al cerrar.")
+                self.dropped += len(self._buf)
+                self._buf.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "buffered": len(self._buf),
+                "written": self.written,
+                "batches": self.batches,
+                "dropped": self.dropped,
+                "errors": self.errors,
+            }
+
+
+_metrics_writer = MetricsWriter(_connect_db)
+
+
 def record_metrics(payload: dict) -> None:
-    _exec_sql(INSERT_SQL, payload)
+    if not db_metrics_ready():
+        return
+    _metrics_writer.enqueue(payload)
+
+# =========================
+#   MÉTRICAS EN PROCESO (/metrics, formato Prometheus)
+# =========================
+class _Metrica:
+    tipo = "untyped"
+
+    def __init__(self, nombre: str, ayuda: str, etiqueta: Optional[str] = None):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiqueta = etiqueta
+        self._lock = threading.Lock()
+
+    def _labels(self, valor: Optional[str], extra: str = "") -> str:
+        partes = []
+        if self.etiqueta is not None:
+            partes.append(f'{self.etiqueta}="{valor or ""}"')
+        if extra:
+            partes.append(extra)
+        return "{" + ",".join(partes) + "}" if partes else ""
+
+    def cabecera(self) -> list[str]:
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str, etiqueta: Optional[str] = None):
+        super().__init__(nombre, ayuda, etiqueta)
+        self._valores: Dict[Optional[str], float] = {}
+
+    def inc(self, label: Optional[str] = None, n: float = 1.0) -> None:
+        with self._lock:
+            self._valores[label] = self._valores.get(label, 0.0) + n
+
+    def exponer(self) -> list[str]:
+        with self._lock:
+            valores = dict(self._valores)
+        return self.cabecera() + [f"{self.nombre}{self._labels(k)} {v:g}" for k, v in sorted(valores.items(), key=lambda kv: kv[0] or "")]
+
+
+class Histograma(_Metrica):
+    """Buckets fijos; observar() es un bisect + tres sumas bajo lock (costo despreciable por request)."""
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, buckets: Tuple[float, ...], etiqueta: Optional[str] = None):
+        super().__init__(nombre, ayuda, etiqueta)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Optional[str], list] = {}  # label -> [cuentas por bucket..., +Inf], suma
+
+    def observar(self, valor: float, label: Optional[str] = None) -> None:
+        i = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(label)
+            if serie is None:
+                serie = self._series[label] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][i] += 1
+            serie[1] += valor
+
+    def exponer(self) -> list[str]:
+        with self._lock:
+            series = {k: (list(v[0]), v[1]) for k, v in self._series.items()}
+        out = self.cabecera()
+        for label, (cuentas, suma) in sorted(series.items(), key=lambda kv: kv[0] or ""):
+            acumulado = 0
+            for le, n in zip((*(f"{b:g}" for b in self.buckets), "+Inf"), cuentas):
+                acumulado += n
+                lbl = self._labels(label, 'le="' + le + '"')
+                out.append(f"{self.nombre}_bucket{lbl} {acumulado}")
+            out.append(f"{self.nombre}_sum{self._labels(label)} {suma:g}")
+            out.append(f"{self.nombre}_count{self._labels(label)} {acumulado}")
+        return out
+
+
+class RegistroMetricas:
+    """Métricas propias + valores que se leen de otros componentes (admisión, cache...) recién al exponer."""
+
+    def __init__(self):
+        self._metricas: list = []
+        self._lecturas: list[Tuple[str, str, Callable[[], Dict[Optional[str], float]], Optional[str], str]] = []
+
+    def agregar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def leer(
+        self,
+        nombre: str,
+        ayuda: str,
+        fn: Callable[[], Dict[Optional[str], float]],
+        etiqueta: Optional[str] = None,
+        tipo: str = "gauge",
+    ) -> None:
+        self._lecturas.append((nombre, ayuda, fn, etiqueta, tipo))
+
+    def exponer(self) -> str:
+        lineas: list[str] = []
+        for m in self._metricas:
+            lineas += m.exponer()
+        for nombre, ayuda, fn, etiqueta, tipo in self._lecturas:
+            try:
+                valores = fn()
+            except Exception as e:
+                logger.warning(f"[METRICS] No se pudo leer {nombre}: {e}")
+                continue
+            lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+            for k, v in valores.items():
+                lbl = f'{{{etiqueta}="{k}"}}' if etiqueta is not None else ""
+                lineas.append(f"{nombre}{lbl} {float(v):g}")
+        return "\n".join(lineas) + "\n"
+
+
+_registro = RegistroMetricas()
+_m_etapa_s = _registro.agregar(Histograma(
+    "podcasterapp_stage_seconds", "Duración de cada etapa del procesamiento.",
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300), etiqueta="stage",
+))
+_m_request_s = _registro.agregar(Histograma(
+    "podcasterapp_request_seconds", "Tiempo total de un request de procesamiento (upload incluido).",
+    (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600), etiqueta="path",
+))
+_m_input_bytes = _registro.agregar(Histograma(
+    "podcasterapp_input_bytes", "Tamaño de los uploads.",
+    tuple(float(2 ** k) for k in range(16, 29, 2)),
+))
+_m_input_dur_s = _registro.agregar(Histograma(
+    "podcasterapp_input_duration_seconds", "Duración del audio original.",
+    (5, 15, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200),
+))
+_m_backend = _registro.agregar(Contador(
+    "podcasterapp_dsp_backend_total", "Jobs procesados por backend DSP.", etiqueta="backend",
+))
+_m_fallback = _registro.agregar(Contador(
+    "podcasterapp_ffmpeg_fallback_total", "Jobs que no pudieron usar el camino ffmpeg preferido.", etiqueta="backend",
+))
+_m_resultado = _registro.agregar(Contador(
+    "podcasterapp_requests_total", "Requests de procesamiento por resultado.", etiqueta="outcome",
+))
+
+
+def observar_procesamiento(sol: Dict[str, Any], analysis: Dict[str, Any], timings_ms: Dict[str, float], camino: str) -> None:
+    """Vuelca a /metrics lo que ya se midió en el request (timings_ms viene también desde los workers)."""
+    for etapa, ms in timings_ms.items():
+        _m_etapa_s.observar(ms / 1000.0, etapa)
+    _m_request_s.observar(time.perf_counter() - sol["t0"], camino)
+    _m_input_bytes.observar(float(sol["input_bytes"]))
+    if analysis.get("duracion_original_s") is not None:
+        _m_input_dur_s.observar(float(analysis["duracion_original_s"]))
+    _m_resultado.inc(camino)
+    backend = analysis.get("dsp_backend")
+    if camino == "processed" and backend:
+        _m_backend.inc(backend)
+        elegido = backend_dsp()
+        if elegido == "numpy":
+            preferido = ("numpy", "numpy_parallel", "ffmpeg_stream")
+        elif elegido == "ffmpeg_pipe":
+            preferido = ("ffmpeg_pipe", "ffmpeg_parallel", "ffmpeg_stream")
+        else:
+            preferido = (elegido, "ffmpeg_stream")
+        if backend not in preferido:
+            _m_fallback.inc(backend)
+
+
+_registro.leer("podcasterapp_jobs_in_flight", "Jobs procesando ahora.", lambda: {None: _admision.stats()["running"]})
+_registro.leer("podcasterapp_jobs_queued", "Jobs admitidos esperando turno.", lambda: {None: _admision.stats()["queued"]})
+_registro.leer(
+    "podcasterapp_admission_memory_mb", "Memoria estimada reservada por jobs en curso.",
+    lambda: {None: _admision.stats()["memory_in_use_mb"]},
+)
+_registro.leer(
+    "podcasterapp_admission_rejected_total", "Requests rechazados por la admisión.",
+    lambda: {"full": _admision.stats()["rejected_full"], "timeout": _admision.stats()["rejected_timeout"]},
+    etiqueta="reason", tipo="counter",
+)
+_registro.leer(
+    "podcasterapp_cache_lookups_total", "Consultas a la cache de resultados.",
+    lambda: {"hit": _cache.stats()["hits"], "miss": _cache.stats()["misses"]},
+    etiqueta="result", tipo="counter",
+)
+_registro.leer(
+    "podcasterapp_retention_reclaimed_bytes_total", "Bytes liberados por la retención de media.",
+    lambda: {d: v["bytes_reclaimed"] for d, v in _retencion.stats()["dirs"].items()},
+    etiqueta="dir", tipo="counter",
+)
+_registro.leer(
+    "podcasterapp_metrics_rows_dropped_total", "Filas de request_metrics descartadas.",
+    lambda: {None: _metrics_writer.stats()["dropped"]}, tipo="counter",
+)
 
 # =========================
 #   RUTAS DE ARCHIVOS
@@ -172,16 +564,31 @@ MEDIA_DIR = BASE_DIR / "media"
 ORIGINAL_DIR = MEDIA_DIR / "original"
 PROCESSED_DIR = MEDIA_DIR / "processed"
 REPORT_DIR = MEDIA_DIR / "reports"
+# Subidas reanudables en curso (no se sirve por /media)
+UPLOADS_DIR = MEDIA_DIR / "uploads"
 STATIC_DIR = BASE_DIR / "static"
 
-for d in (ORIGINAL_DIR, PROCESSED_DIR, REPORT_DIR):
+for d in (ORIGINAL_DIR, PROCESSED_DIR, REPORT_DIR, UPLOADS_DIR):
     d.mkdir(parents=True, exist_ok=True)
 
 # =========================
 #   LÍMITE DE TAMAÑO
 # =========================
-MAX_FILE_SIZE_MB = 20
+# Con PROCESSING_MODE=auto los episodios largos se procesan por bloques, así que el límite se puede subir
+MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "20"))
 MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
+# Tamaño de cada escritura a disco al recibir un upload
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Margen para los headers del multipart al validar Content-Length
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+# Tope de cada campo de texto del form (mode, lang, formats): lo grande viaja como archivo
+MULTIPART_CAMPO_MAX_BYTES = 64 * 1024
+# Un lote (varios archivos o un zip) viaja en un solo request: su tope es el total, no por archivo
+BATCH_MAX_TOTAL_MB = int(os.getenv("BATCH_MAX_TOTAL_MB", "1024"))
+UPLOAD_PATHS = {"/process", "/api/process_audio", "/api/analyze", "/api/batch"}
+# Los que pasan por la admisión (_admision.reservar): /api/analyze no la usa y los ítems
+# de un lote esperan en su propio pool, así que a esos no se les corta por cola llena
+ADMISSION_PATHS = {"/process", "/api/process_audio"}
 
 # =========================
 #   i18n backend (report + resumen)
@@ -192,6 +599,9 @@ def norm_lang(lang: Optional[str]) -> str:
     l = (lang or "").strip().lower()
     return l if l in SUPPORTED_LANGS else "es"
 
+def norm_modo(mode: Optional[str]) -> str:
+    return "MICROFONO_EXTERNO" if str(mode or "").strip() == "MICROFONO_EXTERNO" else "LAPTOP_CELULAR"
+
 def mode_labels(mode_code: str) -> Dict[str, str]:
     if mode_code == "MICROFONO_EXTERNO":
         return {"es": "Micrófono externo (USB / interfaz)", "en": "External microphone (USB / interface)"}
@@ -261,11 +671,25 @@ def tr(lang: str, key: str) -> str:
             "k.snr": "Separación voz/fondo (aprox.)",
             "k.peak": "Pico máximo aproximado",
             "k.crest": "Crest factor aproximado",
+            "k.loud_orig": "Loudness integrado original",
+            "k.loud_final": "Loudness integrado final",
+            "k.true_peak": "True peak final",
             "k.clip": "Picos / clipping",
             "k.score": "Puntaje",
             "conf.low": "baja (pocas pausas detectadas)",
             "conf.ok": "ok",
             "html.title": "Resumen",
+            "batch.title": "=== Informe del lote ===",
+            "batch.summary": "== Resumen del lote ==",
+            "batch.items": "== Episodios ==",
+            "batch.done": "Procesados",
+            "batch.failed": "Con error",
+            "batch.pending": "Sin terminar",
+            "batch.duration": "Duración total",
+            "batch.avg_score": "Puntaje promedio",
+            "batch.lowest": "Puntaje más bajo",
+            "batch.loud_range": "Loudness final (mín. / máx.)",
+            "batch.clipping": "Con probable clipping",
         },
         "en": {
             "report.title": "=== Audio processing report ===",
@@ -284,15 +708,235 @@ def tr(lang: str, key: str) -> str:
             "k.snr": "Voice/background separation (approx.)",
             "k.peak": "Approx. max peak",
             "k.crest": "Approx. crest factor",
+            "k.loud_orig": "Original integrated loudness",
+            "k.loud_final": "Final integrated loudness",
+            "k.true_peak": "Final true peak",
             "k.clip": "Peaks / clipping",
             "k.score": "Score",
             "conf.low": "low (few pauses detected)",
             "conf.ok": "ok",
             "html.title": "Summary",
+            "batch.title": "=== Batch report ===",
+            "batch.summary": "== Batch summary ==",
+            "batch.items": "== Episodes ==",
+            "batch.done": "Processed",
+            "batch.failed": "Failed",
+            "batch.pending": "Unfinished",
+            "batch.duration": "Total duration",
+            "batch.avg_score": "Average score",
+            "batch.lowest": "Lowest score",
+            "batch.loud_range": "Final loudness (min / max)",
+            "batch.clipping": "Likely clipping",
         },
     }
     return D.get(lang, D["es"]).get(key, key)
 
+# =========================
+#   SERVIDO DE MEDIA Y ESTÁTICOS
+# =========================
+# Inmutable solo con ?v=<hash de contenido> (igual que los estáticos): los nombres de media
+# no derivan del contenido y algunos (informes) se reescriben; sin ?v= van con no-cache + ETag
+MEDIA_CACHE_MAX_AGE_S = int(os.getenv("MEDIA_CACHE_MAX_AGE_S", "31536000"))
+MEDIA_ETAG_MEMO_MAX = int(os.getenv("MEDIA_ETAG_MEMO_MAX", "4096"))
+# Por debajo de esto comprimir no compensa los headers extra
+STATIC_PRECOMPRESS_MIN_BYTES = int(os.getenv("STATIC_PRECOMPRESS_MIN_BYTES", "256"))
+
+CACHE_INMUTABLE = f"public, max-age={MEDIA_CACHE_MAX_AGE_S}, immutable"
+
+# mimetypes no conoce todos los contenedores de audio en todas las plataformas
+TIPOS_MEDIA = {
+    ".wav": "audio/wav",
+    ".mp3": "audio/mpeg",
+    ".m4a": "audio/mp4",
+    ".flac": "audio/flac",
+    ".opus": "audio/ogg",
+    ".ogg": "audio/ogg",
+    ".txt": "text/plain; charset=utf-8",
+    ".json": "application/json",
+    ".prof": "application/octet-stream",
+}
+
+# Sufijo del ETag por codificación: cada variante es una representación distinta
+SUFIJOS_CODIFICACION = {"br": "br", "gzip": "gz"}
+
+
+def tipo_media(nombre: str) -> str:
+    ext = os.path.splitext(nombre)[1].lower()
+    return TIPOS_MEDIA.get(ext) or mimetypes.guess_type(nombre)[0] or "application/octet-stream"
+
+
+def etag_coincide(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparación débil de If-None-Match (RFC 9110): ignora el prefijo W/."""
+    if not if_none_match:
+        return False
+    valor = etag[2:] if etag.startswith("W/") else etag
+    for candidato in if_none_match.split(","):
+        candidato = candidato.strip()
+        if candidato == "*":
+            return True
+        if candidato.startswith("W/"):
+            candidato = candidato[2:]
+        if candidato == valor:
+            return True
+    return False
+
+
+def elegir_codificacion(accept_encoding: Optional[str], disponibles) -> str:
+    """Elige br > gzip > identity según Accept-Encoding (respeta q=0)."""
+    calidades: Dict[str, float] = {}
+    for parte in (accept_encoding or "").split(","):
+        token, _, params = parte.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        calidades[token] = q
+    for cod in ("br", "gzip"):
+        if cod in disponibles and calidades.get(cod, calidades.get("*", 0.0)) > 0:
+            return cod
+    return "identity"
+
+
+class EtagsMedia:
+    """
+    ETags fuertes por hash de contenido, memoizados por (path, tamaño, mtime_ns): un archivo
+    se hashea una sola vez aunque el reproductor pida decenas de Ranges al hacer seek.
+    """
+
+    def __init__(self, max_entradas: int) -> None:
+        self.max_entradas = max(1, max_entradas)
+        self._lock = threading.Lock()
+        self._memo: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict()
+
+    def _guardar(self, clave: str, size: int, mtime_ns: int, etag: str) -> None:
+        with self._lock:
+            self._memo[clave] = (size, mtime_ns, etag)
+            self._memo.move_to_end(clave)
+            while len(self._memo) > self.max_entradas:
+                self._memo.popitem(last=False)
+
+    def sembrar(self, path: Path, sha256_hex: str) -> None:
+        """El upload ya se hasheó mientras se guardaba: evita releerlo en el primer GET."""
+        try:
+            st = path.stat()
+        except OSError:
+            return
+        self._guardar(str(path), st.st_size, st.st_mtime_ns, f'"{sha256_hex[:32]}"')
+
+    def etag(self, path: Path, st: os.stat_result) -> str:
+        """Bloqueante (lee el archivo si no está memoizado): llamar desde un thread."""
+        clave = str(path)
+        with self._lock:
+            hit = self._memo.get(clave)
+            if hit is not None and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+                self._memo.move_to_end(clave)
+                return hit[2]
+        hasher = hashlib.sha256()
+        with path.open("rb") as f:
+            while True:
+                chunk = f.read(1024 * 1024)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+        etag = f'"{hasher.hexdigest()[:32]}"'
+        self._guardar(clave, st.st_size, st.st_mtime_ns, etag)
+        return etag
+
+
+_etags_media = EtagsMedia(MEDIA_ETAG_MEMO_MAX)
+
+
+def carpeta_media(nombre: str) -> Optional[Path]:
+    # Resuelto en cada llamada: los directorios se pueden redefinir (benchmark)
+    return {"original": ORIGINAL_DIR, "processed": PROCESSED_DIR, "reports": REPORT_DIR}.get(nombre)
+
+
+class ActivosEstaticos:
+    """
+    Assets de STATIC_DIR cargados en memoria al arrancar, con variantes gzip/brotli
+    precomprimidas. index.html referencia al resto con ?v=<hash>, así el navegador los
+    cachea como inmutables; index.html se sirve con no-cache + ETag.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self._activos: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _hash(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()[:16]
+
+    @staticmethod
+    def _preparar(rel: str, data: bytes) -> Dict[str, Any]:
+        tipo = mimetypes.guess_type(rel)[0] or "application/octet-stream"
+        texto = tipo.startswith("text/") or tipo in ("application/javascript", "application/json", "image/svg+xml")
+        if texto:
+            tipo += "; charset=utf-8"
+        variantes = {"identity": data}
+        if texto and len(data) >= STATIC_PRECOMPRESS_MIN_BYTES:
+            gz = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(gz) < len(data):
+                variantes["gzip"] = gz
+            if brotli is not None:
+                br = brotli.compress(data, quality=11)
+                if len(br) < len(data):
+                    variantes["br"] = br
+        return {"hash": ActivosEstaticos._hash(data), "tipo": tipo, "variantes": variantes}
+
+    def cargar(self) -> None:
+        crudos: Dict[str, bytes] = {}
+        for p in sorted(self.directory.rglob("*")):
+            if p.is_file() and not p.name.startswith("."):
+                crudos[p.relative_to(self.directory).as_posix()] = p.read_bytes()
+
+        index = crudos.get("index.html")
+        if index is not None:
+            html = index.decode("utf-8")
+            for rel, data in crudos.items():
+                if rel != "index.html":
+                    html = html.replace(f'"/static/{rel}"', f'"/static/{rel}?v={self._hash(data)}"')
+            crudos["index.html"] = html.encode("utf-8")
+
+        # Reemplazo atómico: un request en curso ve el juego viejo o el nuevo completo
+        self._activos = {rel: self._preparar(rel, data) for rel, data in crudos.items()}
+        total = sum(len(v) for a in self._activos.values() for v in a["variantes"].values())
+        logger.info(f"[STATIC] {len(self._activos)} assets en memoria ({total} bytes con variantes)")
+
+    def respuesta(self, rel: str, request: Request) -> Response:
+        activo = self._activos.get(rel)
+        if activo is None:
+            raise HTTPException(status_code=404, detail="Not Found")
+
+        variantes = activo["variantes"]
+        cod = elegir_codificacion(request.headers.get("accept-encoding"), variantes)
+        etag = f'"{activo["hash"]}"' if cod == "identity" else f'"{activo["hash"]}-{SUFIJOS_CODIFICACION[cod]}"'
+        inmutable = request.query_params.get("v") == activo["hash"]
+        headers = {"ETag": etag, "Cache-Control": CACHE_INMUTABLE if inmutable else "no-cache"}
+        if len(variantes) > 1:
+            headers["Vary"] = "Accept-Encoding"
+
+        if etag_coincide(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        if cod != "identity":
+            headers["Content-Encoding"] = cod
+        return Response(content=variantes[cod], media_type=activo["tipo"], headers=headers)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "assets": len(self._activos),
+            "brotli": brotli is not None,
+            "bytes": sum(len(v) for a in self._activos.values() for v in a["variantes"].values()),
+        }
+
+
+_estaticos = ActivosEstaticos(STATIC_DIR)
+
 # =========================
 #   APP FASTAPI + CORS
 # =========================
@@ -311,17 +955,89 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.mount("/media", StaticFiles(directory=str(MEDIA_DIR)), name="media")
-app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
+@app.middleware("http")
+async def _limite_content_length(request: Request, call_next):
+    # Rechaza uploads con Content-Length demasiado grande antes de leer el body
+    # (sin Content-Length, RecepcionMultipart corta igual al pasar el límite)
+    try:
+        content_length = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        content_length = 0
+    if request.method == "PATCH" and request.url.path.startswith("/api/uploads/"):
+        if content_length > UPLOAD_SESSION_CHUNK_BYTES:
+            return JSONResponse({"detail": f"Max {UPLOAD_SESSION_CHUNK_MB} MB por trozo"}, status_code=413)
+    if request.method == "POST" and request.url.path in UPLOAD_PATHS:
+        limite_mb = BATCH_MAX_TOTAL_MB if request.url.path == "/api/batch" else MAX_FILE_SIZE_MB
+        if content_length > limite_mb * 1024 * 1024 + MULTIPART_OVERHEAD_BYTES:
+            return JSONResponse({"detail": f"Max {limite_mb} MB"}, status_code=413)
+    if request.method == "POST" and request.url.path in ADMISSION_PATHS:
+        # Sin lugar en la admisión: cortar antes de que el body se copie a disco
+        retry_after = _admision.rechazo_rapido()
+        if retry_after is not None:
+            return JSONResponse(
+                {"detail": "Servidor ocupado, intenta de nuevo en unos segundos."},
+                status_code=503,
+                headers={"Retry-After": str(retry_after)},
+            )
+    return await call_next(request)
+
+@app.api_route("/media/{carpeta}/{nombre}", methods=["GET", "HEAD"])
+async def servir_media(carpeta: str, nombre: str, request: Request):
+    base = carpeta_media(carpeta)
+    # Sin subdirectorios ni archivos a medio escribir (.part) u ocultos
+    if base is None or nombre != os.path.basename(nombre) or nombre.startswith(".") or nombre.endswith(".part"):
+        raise HTTPException(status_code=404, detail="Not Found")
+    path = base / nombre
+    try:
+        st = await run_in_threadpool(path.stat)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not stat.S_ISREG(st.st_mode):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    etag = await run_in_threadpool(_etags_media.etag, path, st)
+    inmutable = request.query_params.get("v") == etag.strip('"')
+    headers = {"ETag": etag, "Cache-Control": CACHE_INMUTABLE if inmutable else "no-cache"}
+    if etag_coincide(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    # FileResponse resuelve Range / If-Range (contra este ETag) / 416 y HEAD
+    return FileResponse(path, stat_result=st, media_type=tipo_media(nombre), headers=headers)
+
+@app.api_route("/static/{ruta:path}", methods=["GET", "HEAD"])
+def servir_estatico(ruta: str, request: Request):
+    return _estaticos.respuesta(ruta, request)
 
 @app.on_event("startup")
 def _startup():
+    # Antes de atender requests: el backend DSP y los formatos de salida dependen de esto
+    _capacidades.detectar()
+    _estaticos.cargar()
     init_db()
+    if db_metrics_ready():
+        _metrics_writer.start()
+    # Antes de la cache: cargar() descarta las entradas cuyos archivos se borraron acá
+    _retencion.reconciliar()
+    _retencion.start()
+    _cache.cargar()
+    # El primer barrido corre al arrancar: vence lo que quedó de antes del reinicio
+    _subidas.start()
+
+@app.on_event("shutdown")
+def _shutdown():
+    # Deja terminar los jobs en curso antes de salir; los ítems de lote que no arrancaron se descartan
+    _batch_executor.shutdown(wait=True, cancel_futures=True)
+    _job_executor.shutdown(wait=True)
+    _pool_procesos.shutdown()
+    _pool_segmentos.shutdown()
+    _canal_progreso.shutdown()
+    _retencion.close()
+    _subidas.close()
+    # Después de los jobs: sus métricas ya están en el buffer
+    _metrics_writer.close()
 
 @app.get("/", response_class=HTMLResponse)
-async def root():
-    index_path = STATIC_DIR / "index.html"
-    return index_path.read_text(encoding="utf-8")
+def root(request: Request):
+    return _estaticos.respuesta("index.html", request)
 
 @app.head("/health")
 def health_head():
@@ -334,8 +1050,29 @@ async def health():
         "db_metrics_enabled": ENABLE_DB_METRICS,
         "db_driver": db_driver,
         "db_url_present": bool(DATABASE_URL),
+        "db_metrics_writer": _metrics_writer.stats(),
+        "analysis_engine": "numpy" if (np is not None and ANALYSIS_ENGINE == "numpy") else "pydub",
+        "jobs_pending": _jobs_pendientes(),
+        "admission": _admision.stats(),
+        "job_workers": JOB_WORKERS,
+        "batch_workers": BATCH_WORKERS,
+        "dsp_backend": backend_dsp(),
+        "dsp_parallel_workers": DSP_PARALLEL_WORKERS if DSP_PARALLEL_WORKERS >= 2 else 0,
+        "exec_backend": EXEC_BACKEND,
+        "process_workers": PROCESS_WORKERS if EXEC_BACKEND == "process" else 0,
+        "process_pool_recycles": _pool_procesos.reciclajes,
+        "cache": _cache.stats(),
+        "retention": _retencion.stats(),
+        "uploads": _subidas.stats(),
+        "static": _estaticos.stats(),
+        "ffmpeg": _capacidades.stats(),
     }
 
+@app.get("/metrics")
+def metrics():
+    # Formato de texto de Prometheus (sin dependencia de prometheus_client)
+    return Response(content=_registro.exponer(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # =========================
 #   Audio utils
 # =========================
@@ -344,23 +1081,45 @@ LOSSY_EXTS = {"mp3", "m4a", "aac", "ogg", "opus", "wma"}
 def file_ext_lower(path: Path) -> str:
     return (path.suffix or "").lower().lstrip(".")
 
-def apply_ceiling_dbfs(audio: AudioSegment, ceiling_dbfs: float = -1.0) -> AudioSegment:
-    if audio.max_dBFS == float("-inf"):
+def apply_ceiling_dbfs(
+    audio: AudioSegment,
+    ceiling_dbfs: float = -1.0,
+    max_dbfs: Optional[float] = None,
+) -> AudioSegment:
+    # max_dbfs permite reutilizar un pico ya medido (cada lectura de audio.max_dBFS recorre el buffer)
+    peak = audio.max_dBFS if max_dbfs is None else max_dbfs
+    if peak == float("-inf"):
         return audio
-    if audio.max_dBFS > ceiling_dbfs:
-        return audio.apply_gain(ceiling_dbfs - audio.max_dBFS)
+    if peak > ceiling_dbfs:
+        return audio.apply_gain(ceiling_dbfs - peak)
     return audio
 
+# Parámetros de la cadena DSP: los comparten el filtergraph de ffmpeg y el backend NumPy
+HIGHPASS_HZ = 80
+HIGHPASS_POLOS = 1  # 1 polo, como pydub.high_pass_filter
+COMPRESOR = {"threshold": 0.16, "ratio": 4, "attack": 5, "release": 80, "knee": 2.5, "makeup": 1.5}
+LIMITADOR = {"limit_dbfs": -1.0, "attack": 5, "release": 60}
+# Techo: limitador rápido que no debería actuar (el anterior ya deja ~-1 dBFS)
+TECHO_ATTACK_MS = 0.1
+TECHO_RELEASE_MS = 20
+
+
+def filtros_compresor() -> str:
+    """acompressor + alimiter con los parámetros de COMPRESOR y LIMITADOR."""
+    limit_amp = 10 ** (LIMITADOR["limit_dbfs"] / 20)  # -1 dBFS ~ 0.8913
+    compresor = ":".join(f"{k}={v}" for k, v in COMPRESOR.items())
+    return (
+        f"acompressor={compresor}:mix=1,"
+        f"alimiter=limit={limit_amp}:attack={LIMITADOR['attack']}:release={LIMITADOR['release']}:level=false"
+    )
+
+
 def ffmpeg_compresor_la76_sutil(input_wav: Path, output_wav: Path) -> None:
     """
     Compresión sutil tipo 1176 (rápida) + limitador.
     Si ffmpeg no está disponible, se manejará excepción y se hará fallback.
     """
-    limit_amp = 10 ** (-1 / 20)  # -1 dBFS ~ 0.8913
-    filtergraph = (
-        "acompressor=threshold=0.16:ratio=4:attack=5:release=80:knee=2.5:makeup=1.5:mix=1,"
-        f"alimiter=limit={limit_amp}:attack=5:release=60:level=false"
-    )
+    filtergraph = filtros_compresor()
     cmd = [
         "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
         "-i", str(input_wav),
@@ -370,160 +1129,1256 @@ def ffmpeg_compresor_la76_sutil(input_wav: Path, output_wav: Path) -> None:
     ]
     subprocess.run(cmd, check=True)
 
+
+# "pipe": PCM por stdin/stdout y toda la cadena en un solo filtergraph (sin WAV temporales).
+# "tempfile": camino anterior (pydub high-pass + pre.wav/post.wav).
+FFMPEG_MODE = os.getenv("FFMPEG_MODE", "pipe").strip().lower()
+
+_FFMPEG_PCM_FMT = {1: "s8", 2: "s16le", 4: "s32le"}
+
+# Subir cuando cambie el resultado de la cadena DSP (invalida la cache de resultados)
+DSP_VERSION = "2"
+
+# Formatos de entrega además del WAV PCM (que siempre se genera: lo usan el análisis y la cache)
+OUTPUT_OPUS_BITRATE = os.getenv("OUTPUT_OPUS_BITRATE", "64k").strip()
+OUTPUT_MP3_BITRATE = os.getenv("OUTPUT_MP3_BITRATE", "128k").strip()
+FORMATOS_SALIDA: Dict[str, Dict[str, Any]] = {
+    "flac": {"muxer": "flac", "args": ["-c:a", "flac", "-compression_level", "5"]},
+    # libopus solo acepta 48/24/16/12/8 kHz: ffmpeg inserta el resample en el filtergraph
+    "opus": {"muxer": "opus", "args": ["-c:a", "libopus", "-b:a", OUTPUT_OPUS_BITRATE, "-application", "audio"]},
+    "mp3": {"muxer": "mp3", "args": ["-c:a", "libmp3lame", "-b:a", OUTPUT_MP3_BITRATE]},
+}
+# Formatos por defecto si el request no manda "formats" (ej. "mp3" o "flac,opus")
+OUTPUT_FORMATS_DEFAULT = os.getenv("OUTPUT_FORMATS_DEFAULT", "").strip()
+
+
+def norm_formatos(raw: Optional[str]) -> Tuple[str, ...]:
+    """
+    Parsea "flac,mp3" -> ("flac", "mp3"). "wav" se ignora (siempre sale); desconocidos -> 400.
+    Un formato sin encoder en este ffmpeg es 400 si se pidió, y se omite si viene del default.
+    """
+    pedido = raw is not None and bool(str(raw).strip())
+    if not pedido:
+        raw = OUTPUT_FORMATS_DEFAULT
+    formatos: list[str] = []
+    for f in str(raw).lower().replace(" ", "").split(","):
+        if not f or f == "wav" or f in formatos:
+            continue
+        if f not in FORMATOS_SALIDA:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Formato no soportado: {f} (opciones: wav, {', '.join(FORMATOS_SALIDA)})",
+            )
+        if not _capacidades.codifica(f):
+            if pedido:
+                raise HTTPException(status_code=400, detail=f"Formato no disponible en este servidor: {f}")
+            continue
+        formatos.append(f)
+    return tuple(formatos)
+
+
+def ruta_formato(processed_wav: Path, fmt: str) -> Path:
+    return processed_wav.with_suffix(f".{fmt}")
+
+
+def _salidas_formatos(processed_wav: Path, formatos: Tuple[str, ...]) -> Tuple[list[str], list[Path]]:
+    """Args de ffmpeg para mapear [fmt0], [fmt1]... a archivos .part, y la lista de esos .part."""
+    args: list[str] = []
+    parts: list[Path] = []
+    for i, fmt in enumerate(formatos):
+        destino = ruta_formato(processed_wav, fmt)
+        part = destino.with_name(destino.name + ".part")
+        args += ["-map", f"[fmt{i}]", *FORMATOS_SALIDA[fmt]["args"], "-f", FORMATOS_SALIDA[fmt]["muxer"], str(part)]
+        parts.append(part)
+    return args, parts
+
+
+def _asplit_formatos(base: list[str], formatos: Tuple[str, ...]) -> str:
+    etiquetas = base + [f"fmt{i}" for i in range(len(formatos))]
+    return f",asplit={len(etiquetas)}" + "".join(f"[{e}]" for e in etiquetas)
+
+
+def _publicar_formatos(processed_wav: Path, formatos: Tuple[str, ...], parts: list[Path]) -> None:
+    for fmt, part in zip(formatos, parts):
+        os.replace(part, ruta_formato(processed_wav, fmt))
+
+
+def codificar_formatos(processed_wav: Path, formatos: Tuple[str, ...]) -> None:
+    """
+    Codifica el WAV final a los formatos pedidos en una sola corrida de ffmpeg.
+    Solo para cuando no se pudieron generar en la pasada DSP (fallback pydub, techo o cache).
+    """
+    if not formatos:
+        return
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", str(processed_wav)]
+    parts: list[Path] = []
+    for fmt in formatos:
+        destino = ruta_formato(processed_wav, fmt)
+        part = destino.with_name(destino.name + ".part")
+        cmd += ["-map", "0:a", *FORMATOS_SALIDA[fmt]["args"], "-f", FORMATOS_SALIDA[fmt]["muxer"], str(part)]
+        parts.append(part)
+    try:
+        subprocess.run(cmd, capture_output=True, check=True)
+        _publicar_formatos(processed_wav, formatos, parts)
+    except subprocess.CalledProcessError as e:
+        err = (e.stderr or b"").decode("utf-8", "replace").strip()
+        raise RuntimeError(f"ffmpeg falló ({e.returncode}): {err[-500:]}") from e
+    finally:
+        for part in parts:
+            part.unlink(missing_ok=True)
+
+
+def filtergraph_dsp(dur_s: float, fade_ms: int, ceiling_dbfs: float) -> str:
+    """High-pass + compresor + limitador + fade out + techo, en ese orden."""
+    ceiling_amp = 10 ** (ceiling_dbfs / 20)
+    fade_s = min(fade_ms / 1000.0, dur_s)
+    filtros = [f"highpass=f={HIGHPASS_HZ}:poles={HIGHPASS_POLOS}", filtros_compresor()]
+    # fade_ms = 0: sin fade (segmentos que no terminan el episodio)
+    if fade_ms > 0:
+        filtros.append(f"afade=t=out:st={max(0.0, dur_s - fade_s):.4f}:d={fade_s:.4f}")
+    filtros.append(f"alimiter=limit={ceiling_amp}:attack={TECHO_ATTACK_MS}:release={TECHO_RELEASE_MS}:level=false")
+    return ",".join(filtros)
+
+
+def ffmpeg_dsp_pipe(
+    audio: AudioSegment,
+    output_wav: Path,
+    fade_ms: int,
+    ceiling_dbfs: float,
+    formatos: Tuple[str, ...] = (),
+) -> AudioSegment:
+    """
+    Envía el PCM a ffmpeg por stdin, corre la cadena DSP completa y escribe el WAV final
+    directamente en output_wav (más los formatos comprimidos pedidos, en la misma pasada);
+    el mismo resultado vuelve por stdout para analizarlo.
+    Lanza FileNotFoundError si no hay ffmpeg (el llamador hace fallback a pydub).
+    """
+    pcm_fmt = _FFMPEG_PCM_FMT.get(audio.sample_width)
+    if pcm_fmt is None:
+        raise ValueError(f"sample_width no soportado para pipe: {audio.sample_width}")
+
+    graph = filtergraph_dsp(len(audio) / 1000.0, fade_ms, ceiling_dbfs) + _asplit_formatos(["file", "pipe"], formatos)
+    part = output_wav.with_name(output_wav.name + ".part")
+    args_formatos, parts_formatos = _salidas_formatos(output_wav, formatos)
+    cmd = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", pcm_fmt, "-ar", str(audio.frame_rate), "-ac", str(audio.channels), "-i", "pipe:0",
+        "-filter_complex", f"[0:a]{graph}",
+        "-map", "[file]", "-c:a", "pcm_s16le", "-f", "wav", str(part),
+        *args_formatos,
+        "-map", "[pipe]", "-c:a", "pcm_s16le", "-f", "s16le", "pipe:1",
+    ]
+    try:
+        proc = subprocess.run(cmd, input=audio.raw_data, capture_output=True, check=True)
+        os.replace(part, output_wav)
+        _publicar_formatos(output_wav, formatos, parts_formatos)
+    except subprocess.CalledProcessError as e:
+        err = (e.stderr or b"").decode("utf-8", "replace").strip()
+        raise RuntimeError(f"ffmpeg falló ({e.returncode}): {err[-500:]}") from e
+    finally:
+        for p in (part, *parts_formatos):
+            p.unlink(missing_ok=True)
+
+    return AudioSegment(data=proc.stdout, sample_width=2, frame_rate=audio.frame_rate, channels=audio.channels)
+
+def probe_audio(path: Path) -> Optional[Dict[str, Any]]:
+    """
+    Metadatos del primer stream de audio vía ffprobe (sin decodificar).
+    Devuelve None si no hay ffprobe o el archivo no se pudo leer.
+    """
+    if not _capacidades.ffprobe:
+        return None
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "a:0",
+        "-show_entries", "stream=codec_name,sample_rate,channels,duration:format=duration,format_name",
+        "-of", "json", str(path),
+    ]
+    try:
+        proc = subprocess.run(cmd, capture_output=True, check=True, timeout=30)
+        data = json.loads(proc.stdout or b"{}")
+    except (OSError, subprocess.SubprocessError, ValueError) as e:
+        logger.info(f"[PROBE] ffprobe no disponible o falló para {path.name}: {e}")
+        return None
+
+    streams = data.get("streams") or []
+    if not streams:
+        return None
+    s = streams[0]
+    fmt = data.get("format") or {}
+    try:
+        duration_s = float(s.get("duration") or fmt.get("duration") or 0.0)
+        return {
+            "codec": s.get("codec_name"),
+            "format": fmt.get("format_name"),
+            "sample_rate": int(s.get("sample_rate") or 0),
+            "channels": int(s.get("channels") or 0),
+            "duration_s": duration_s,
+        }
+    except (TypeError, ValueError):
+        return None
+
 # =========================
-#   ANALISIS
+#   CAPACIDADES DE FFMPEG (detectadas una vez)
 # =========================
-def analizar_audio(audio: AudioSegment, original_path: Optional[Path] = None) -> Dict[str, Any]:
-    dur_ms = len(audio)
-    nivel_dbfs = float(audio.dBFS) if audio.dBFS != float("-inf") else -90.0
+# Filtros de filtergraph_dsp / ffmpeg_compresor_la76_sutil
+FILTROS_DSP = ("highpass", "acompressor", "alimiter", "afade")
+# Tope de duración del audio de entrada (segundos); 0 = sin tope
+MAX_DURATION_S = float(os.getenv("MAX_DURATION_S", "0"))
+# Códecs que pydub decodifica a pcm_s16le (su caso "fltp"): con los metadatos ya medidos se
+# decodifican directo, sin que from_file vuelva a correr ffprobe
+CODECS_DECODE_S16 = ("mp3", "aac")
 
-    # Estimar “fondo” usando ventanas; percentil 10% (no 25%) para reducir sesgo si casi no hay pausas.
-    chunk_ms = 200
-    niveles: list[float] = []
-    for i in range(0, dur_ms, chunk_ms):
-        c = audio[i: i + chunk_ms]
-        v = float(c.dBFS) if c.dBFS != float("-inf") else -90.0
-        niveles.append(v)
-
-    niveles.sort()
-    ruido_estimado = -80.0
-    ruido_confiable = True
 
-    if niveles:
-        n_sub = max(1, len(niveles) // 10)  # ✅ 10% más bajo
-        ruido_estimado = sum(niveles[:n_sub]) / n_sub
-        # Si ni siquiera el “10% más bajo” baja de cierto umbral, probablemente no hubo pausas limpias.
-        if ruido_estimado > -45.0:
-            ruido_confiable = False
+def _listar_ffmpeg(opcion: str) -> list[list[str]]:
+    """Filas de "ffmpeg -filters/-codecs/-encoders" partidas en columnas ([] si ffmpeg no está)."""
+    try:
+        out = subprocess.run(
+            ["ffmpeg", "-hide_banner", opcion], capture_output=True, check=True, timeout=30
+        ).stdout.decode("utf-8", "replace")
+    except (OSError, subprocess.SubprocessError):
+        return []
+    lineas = out.splitlines()
+    # -codecs y -encoders separan la leyenda de la tabla con una línea de guiones
+    for i, linea in enumerate(lineas):
+        if linea.strip().startswith("---"):
+            lineas = lineas[i + 1:]
+            break
+    return [partes for partes in (linea.split() for linea in lineas) if len(partes) >= 3 and partes[1] != "="]
+
+
+def _version_binario(binario: str) -> Optional[str]:
+    try:
+        out = subprocess.run([binario, "-version"], capture_output=True, check=True, timeout=10).stdout
+        return out.decode("utf-8", "replace").splitlines()[0].strip()
+    except (OSError, subprocess.SubprocessError, IndexError):
+        return None
 
-    # Limitar para no inventar fondos absurdos
-    ruido_estimado = max(ruido_estimado, -80.0)
 
-    snr = nivel_dbfs - ruido_estimado
+class CapacidadesFfmpeg:
+    """
+    Qué ofrecen los binarios ffmpeg/ffprobe del host (versión, filtros de la cadena DSP, códecs).
+    Se detecta una sola vez (al arrancar, o en el primer uso dentro de un worker de proceso) en vez
+    de descubrirlo en cada request por un subprocess que falla.
+    """
 
-    # Ambiente (copy prudente)
-    if not ruido_confiable:
-        sala_code = "unknown"
-        sala_indice = 0.7
-    else:
-        if snr >= 40 and ruido_estimado <= -70:
-            sala_code = "very_controlled"
-            sala_indice = 0.15
-        elif snr >= 28 and ruido_estimado <= -58:
-            sala_code = "controlled"
-            sala_indice = 0.45
-        elif snr >= 18:
-            sala_code = "reflective_or_busy"
-            sala_indice = 0.75
-        else:
-            sala_code = "very_busy"
-            sala_indice = 1.0
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._datos: Optional[Dict[str, Any]] = None
+
+    def detectar(self) -> Dict[str, Any]:
+        with self._lock:
+            if self._datos is None:
+                t0 = time.perf_counter()
+                version = _version_binario("ffmpeg")
+                version_ffprobe = _version_binario("ffprobe")
+                filtros = {p[1] for p in _listar_ffmpeg("-filters") if "->" in p[2]} if version else set()
+                decodifica, codifica = set(), set()
+                if version:
+                    for p in _listar_ffmpeg("-codecs"):
+                        if len(p[0]) == 6 and p[0][2] == "A" and p[0][0] == "D":
+                            decodifica.add(p[1])
+                    codifica = {p[1] for p in _listar_ffmpeg("-encoders") if p[0].startswith("A")}
+                self._datos = {
+                    "ffmpeg": version is not None,
+                    "ffmpeg_version": version,
+                    "ffprobe": version_ffprobe is not None,
+                    "ffprobe_version": version_ffprobe,
+                    "filtros": {f: f in filtros for f in FILTROS_DSP},
+                    "decoders": decodifica,
+                    "encoders": codifica,
+                    "probe_ms": round((time.perf_counter() - t0) * 1000.0, 1),
+                }
+                if version is None:
+                    logger.warning("[FFMPEG] ffmpeg no disponible: DSP sin ffmpeg y solo WAV de entrada.")
+                elif not all(self._datos["filtros"].values()):
+                    faltan = [f for f, ok in self._datos["filtros"].items() if not ok]
+                    logger.warning(f"[FFMPEG] Faltan filtros de la cadena DSP: {', '.join(faltan)}")
+            return self._datos
+
+    @property
+    def ffmpeg(self) -> bool:
+        return self.detectar()["ffmpeg"]
+
+    @property
+    def ffprobe(self) -> bool:
+        return self.detectar()["ffprobe"]
+
+    @property
+    def dsp(self) -> bool:
+        """ffmpeg con todos los filtros de la cadena DSP."""
+        datos = self.detectar()
+        return datos["ffmpeg"] and all(datos["filtros"].values())
+
+    def decodifica(self, codec: Optional[str]) -> bool:
+        return bool(codec) and codec in self.detectar()["decoders"]
+
+    def codifica(self, fmt: str) -> bool:
+        args = FORMATOS_SALIDA[fmt]["args"]
+        return args[args.index("-c:a") + 1] in self.detectar()["encoders"]
+
+    def stats(self) -> Dict[str, Any]:
+        datos = self.detectar()
+        return {
+            "ffmpeg": datos["ffmpeg_version"],
+            "ffprobe": datos["ffprobe_version"],
+            "filters": datos["filtros"],
+            "audio_decoders": len(datos["decoders"]),
+            "output_formats": {fmt: self.codifica(fmt) for fmt in FORMATOS_SALIDA},
+            "probe_ms": datos["probe_ms"],
+        }
 
-    sala_txt = sala_labels(sala_code)
 
-    # Peak/clipping heurística
-    sample_width = audio.sample_width
-    max_possible = float((1 << (8 * sample_width - 1)) - 1)
+_capacidades = CapacidadesFfmpeg()
 
-    samples = audio.get_array_of_samples()
-    if samples:
-        max_abs = max(abs(s) for s in samples)
-        peak_ratio = max_abs / max_possible
-        clip_samples = sum(1 for s in samples if abs(s) >= 0.985 * max_possible)
-        clip_ratio = clip_samples / len(samples)
-    else:
-        peak_ratio = 0.0
-        clip_ratio = 0.0
 
-    peak_db = audio.max_dBFS if audio.max_dBFS != float("-inf") else -90.0
-    crest_factor = peak_db - nivel_dbfs
+def validar_entrada(info: Optional[Dict[str, Any]]) -> None:
+    """
+    Rechaza, antes de decodificar, lo que ffprobe ya dice que no se va a poder procesar:
+    archivo dañado o sin audio (422), códec sin decoder (415) o más largo que MAX_DURATION_S (413).
+    Sin ffprobe no hay metadatos: esos casos se siguen descubriendo al decodificar.
+    """
+    if not _capacidades.ffprobe:
+        return
+    if info is None or info["sample_rate"] <= 0 or info["channels"] <= 0:
+        raise HTTPException(status_code=422, detail="No se pudo leer el audio (archivo dañado o sin pista de audio).")
+    if _capacidades.ffmpeg and not _capacidades.decodifica(info["codec"]):
+        raise HTTPException(status_code=415, detail=f"Códec de audio no soportado: {info['codec']}")
+    if MAX_DURATION_S > 0 and info["duration_s"] > MAX_DURATION_S:
+        raise HTTPException(status_code=413, detail=f"El audio pasa de la duración máxima ({_mm_ss(MAX_DURATION_S)}).")
 
-    ext = file_ext_lower(original_path) if original_path else ""
-    is_lossy = ext in LOSSY_EXTS
 
-    # Para archivos lossy, ser más conservador (menos falsos positivos)
-    if is_lossy:
-        clip_detectado = (peak_ratio > 0.995) and (clip_ratio > 0.0020)
-        hot_signal = (peak_ratio > 0.985)
-    else:
-        clip_detectado = (peak_ratio > 0.992) and (clip_ratio > 0.0010)
-        hot_signal = (peak_ratio > 0.98)
+def inspeccionar_entrada(path: Path) -> Optional[Dict[str, Any]]:
+    """probe_audio + validar_entrada: los metadatos (o None sin ffprobe) para no volver a medirlos."""
+    info = probe_audio(path)
+    validar_entrada(info)
+    return info
 
-    if clip_detectado:
-        clip_code = "clipping_detected"
-    elif hot_signal:
-        clip_code = "hot_signal"
-    else:
-        clip_code = "no_clipping"
 
-    clip_txt = clip_labels(clip_code)
+def decodificar_audio(path: Path, info: Optional[Dict[str, Any]] = None) -> AudioSegment:
+    """
+    AudioSegment.from_file, salvo MP3/AAC con metadatos conocidos: ahí pydub correría ffprobe
+    otra vez para terminar en el mismo pcm_s16le, así que se decodifica directo por stdout.
+    """
+    if (
+        info and info["codec"] in CODECS_DECODE_S16 and info["sample_rate"] > 0 and info["channels"] > 0
+        and _capacidades.ffmpeg
+    ):
+        sr, ch = int(info["sample_rate"]), int(info["channels"])
+        cmd = [
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-i", str(path), "-vn",
+            "-f", "s16le", "-c:a", "pcm_s16le", "-ar", str(sr), "-ac", str(ch), "pipe:1",
+        ]
+        try:
+            proc = subprocess.run(cmd, capture_output=True, check=True)
+        except subprocess.CalledProcessError as e:
+            err = (e.stderr or b"").decode("utf-8", "replace").strip()
+            raise RuntimeError(f"ffmpeg falló ({e.returncode}): {err[-500:]}") from e
+        datos = proc.stdout[: len(proc.stdout) - len(proc.stdout) % (2 * ch)]
+        return AudioSegment(data=datos, sample_width=2, frame_rate=sr, channels=ch)
+    return AudioSegment.from_file(path)
 
-    return {
-        "file_ext": ext,
-        "is_lossy": bool(is_lossy),
+# =========================
+#   ANALISIS
+# =========================
+# "numpy" (por defecto) usa el motor vectorizado; "pydub" fuerza el camino original.
+ANALYSIS_ENGINE = os.getenv("ANALYSIS_ENGINE", "numpy").strip().lower()
 
-        "sala_code": sala_code,
-        "sala_indice": round(float(sala_indice), 2),
-        "sala_descripcion_es": sala_txt["es"],
-        "sala_descripcion_en": sala_txt["en"],
+VENTANA_RUIDO_MS = 200
+# Muestras por bloque interno del motor NumPy (acota los temporales float64)
+ANALISIS_BLOQUE_MUESTRAS = 1 << 20
 
-        "ruido_estimado_dbfs": round(float(ruido_estimado), 1),
-        "ruido_confiable": bool(ruido_confiable),
-        "nivel_original_dbfs": round(float(nivel_dbfs), 1),
-        "snr_db": round(float(snr), 1),
+_NP_DTYPES = {1: "<i1", 2: "<i2", 4: "<i4"}
 
-        "peak_dbfs": round(float(peak_db), 1),
-        "crest_factor_db": round(float(crest_factor), 1),
 
-        "clip_detectado": bool(clip_detectado),
-        "hot_signal": bool(hot_signal),
-        "clip_ratio": round(float(clip_ratio), 5),
-        "clip_code": clip_code,
-        "clip_descripcion_es": clip_txt["es"],
-        "clip_descripcion_en": clip_txt["en"],
-    }
+def _db_o_piso(valor: float, referencia: float, piso: float = -90.0) -> float:
+    # Igual que pydub.utils.ratio_to_db, pero con el piso que usa el análisis en vez de -inf
+    if valor <= 0:
+        return piso
+    return 20.0 * math.log10(valor / referencia)
 
-def calcular_quality(a: Dict[str, Any], mode_code: str) -> Tuple[int, str, str]:
-    score = 55
 
-    snr = float(a.get("snr_db", 0.0))
-    sala = float(a.get("sala_indice", 0.5))
-    nivel_orig = float(a.get("nivel_original_dbfs", -24.0))
-    clip_code = str(a.get("clip_code", "no_clipping"))
-    ruido_confiable = bool(a.get("ruido_confiable", True))
-    is_lossy = bool(a.get("is_lossy", False))
+def motor_numpy_disponible(audio: AudioSegment) -> bool:
+    if np is None or ANALYSIS_ENGINE != "numpy":
+        return False
+    return audio.sample_width in _NP_DTYPES
 
-    # SNR contribución (si no es confiable, pesa menos)
-    snr_clamped = max(10.0, min(40.0, snr))
-    snr_contrib = (snr_clamped - 10.0) * (18.0 / 30.0)  # hasta +18
-    if not ruido_confiable:
-        snr_contrib *= 0.45
-    score += snr_contrib
 
-    # Sala/ambiente (ligero)
-    score += (1.0 - min(max(sala, 0.0), 1.0)) * 12.0
+def muestras_numpy(audio: AudioSegment):
+    """Vista zero-copy (solo lectura) del buffer PCM intercalado de un AudioSegment."""
+    return np.frombuffer(audio.raw_data, dtype=_NP_DTYPES[audio.sample_width])
 
-    # Nivel original (solo para orientar)
-    if -26 <= nivel_orig <= -16:
-        score += 8
-    elif -32 <= nivel_orig < -26 or -16 < nivel_orig <= -10:
-        score += 4
-    else:
-        score -= 4
 
-    # Penalizaciones por picos/clipping (más suaves, especialmente en lossy)
-    if clip_code == "clipping_detected":
-        score -= 22 if not is_lossy else 16
-    elif clip_code == "hot_signal":
-        score -= 8 if not is_lossy else 6
+class AcumuladorAnalisis:
+    """
+    Estadísticas del análisis calculadas por bloques con NumPy.
 
-    # Modo (micro externo bonus leve)
-    if mode_code == "LAPTOP_CELULAR":
-        score -= 3
-    else:
-        score += 3
+    Reproduce lo que hace el camino pydub: RMS global (audioop.rms, truncado a entero),
+    dBFS de ventanas de 200 ms con los mismos cortes de frame que el slicing de pydub,
+    pico absoluto y conteo de muestras cerca del techo. Recibe muestras enteras
+    intercaladas y puede alimentarse de a trozos.
+    """
 
-    score = int(max(0, min(100, round(score))))
+    def __init__(
+        self,
+        frame_rate: int,
+        channels: int,
+        sample_width: int,
+        ventanas: bool = True,
+        picos: Optional["PicosOnda"] = None,
+        loudness: Optional["MedidorLoudness"] = None,
+    ):
+        self.frame_rate = int(frame_rate)
+        self.channels = max(1, int(channels))
+        self.sample_width = int(sample_width)
+        self.ventanas = ventanas
+        # Opcionales: picos de forma de onda y loudness salen de esta misma pasada
+        self.picos = picos
+        self.loudness = loudness
+
+        # Referencias iguales a pydub: max_possible_amplitude (dBFS) y el máximo entero (clip)
+        self._ref_dbfs = float(2 ** (8 * self.sample_width)) / 2.0
+        self._max_possible = float((1 << (8 * self.sample_width - 1)) - 1)
+        self._umbral_clip_sq = (0.985 * self._max_possible) ** 2
+
+        self._frames = 0
+        self._n = 0
+        self._suma_sq = 0.0
+        self._max_abs = 0
+        self._clip = 0
+
+        self._niveles: list[float] = []
+        self._k = 0
+        self._fin_k = self._fin_ventana(0)
+        self._ventana_sq = 0.0
+        self._ventana_n = 0
+        # Últimos frames al cuadrado: la ventana parcial de pydub puede cortar hasta ~1 ms antes del final
+        self._cola_max = (self.frame_rate // 1000 + 2) * self.channels
+        self._cola = None
+
+    def _fin_ventana(self, k: int) -> int:
+        return int((k + 1) * VENTANA_RUIDO_MS * self.frame_rate / 1000.0)
+
+    def _cerrar_ventana(self) -> None:
+        rms = int(math.sqrt(self._ventana_sq / self._ventana_n)) if self._ventana_n else 0
+        self._niveles.append(_db_o_piso(rms, self._ref_dbfs))
+        self._ventana_sq = 0.0
+        self._ventana_n = 0
+
+    def agregar(self, muestras) -> None:
+        x = np.asarray(muestras).reshape(-1)
+        for ini in range(0, x.size, ANALISIS_BLOQUE_MUESTRAS):
+            self._agregar_bloque(x[ini: ini + ANALISIS_BLOQUE_MUESTRAS])
+
+    def _agregar_bloque(self, x) -> None:
+        if x.size == 0:
+            return
+        ch = self.channels
+
+        self._max_abs = max(self._max_abs, int(x.max()), -int(x.min()))
+        if self.picos is not None:
+            self.picos.agregar(x)
+        if self.loudness is not None:
+            self.loudness.agregar(x)
+
+        y = x.astype(np.float64)
+        y *= y
+        self._suma_sq += float(y.sum())
+        self._clip += int(np.count_nonzero(y >= self._umbral_clip_sq))
+
+        f0 = self._frames
+        self._n += x.size
+        self._frames = self._n // ch
+        f1 = self._frames
+
+        if not self.ventanas:
+            return
+        if self._cola is None or y.size >= self._cola_max:
+            self._cola = y[y.size - min(y.size, self._cola_max):].copy()
+        else:
+            self._cola = np.concatenate((self._cola, y))[-self._cola_max:]
+
+        pos = f0
+        while self._fin_k <= f1:
+            seg = y[(pos - f0) * ch: (self._fin_k - f0) * ch]
+            self._ventana_sq += float(seg.sum())
+            self._ventana_n += seg.size
+            self._cerrar_ventana()
+            pos = max(pos, self._fin_k)
+            self._k += 1
+            self._fin_k = self._fin_ventana(self._k)
+        resto = y[(pos - f0) * ch:]
+        self._ventana_sq += float(resto.sum())
+        self._ventana_n += resto.size
+
+    @property
+    def frames(self) -> int:
+        return self._frames
+
+    def resultado(self) -> Dict[str, Any]:
+        dur_ms = round(1000 * (self._frames / float(self.frame_rate))) if self.frame_rate else 0
+
+        niveles: Optional[list[float]] = None
+        if self.ventanas:
+            niveles = list(self._niveles)
+            # Última ventana parcial (range(0, dur_ms, 200) en el camino pydub). pydub la corta en
+            # int(dur_ms * frame_rate / 1000): con dur_ms redondeado hacia arriba rellena con silencio
+            # (frames en cero que cuentan en el RMS), hacia abajo descarta los últimos frames.
+            n_ventanas = len(range(0, dur_ms, VENTANA_RUIDO_MS))
+            if len(niveles) < n_ventanas:
+                ini = int(self._k * VENTANA_RUIDO_MS * self.frame_rate / 1000.0)
+                fin = int(dur_ms * self.frame_rate / 1000.0)
+                suma = self._ventana_sq
+                sobran = self._frames - fin
+                if sobran > 0:
+                    suma = max(0.0, suma - float(self._cola[self._cola.size - sobran * self.channels:].sum()))
+                n = (fin - ini) * self.channels
+                rms = int(math.sqrt(suma / n)) if n > 0 else 0
+                niveles.append(_db_o_piso(rms, self._ref_dbfs))
+            del niveles[n_ventanas:]
+
+        rms_total = int(math.sqrt(self._suma_sq / self._n)) if self._n else 0
+        m = {
+            "dur_ms": dur_ms,
+            "nivel_dbfs": _db_o_piso(rms_total, self._ref_dbfs),
+            "niveles": niveles,
+            "peak_ratio": (self._max_abs / self._max_possible) if self._n else 0.0,
+            "clip_ratio": (self._clip / self._n) if self._n else 0.0,
+            "peak_db": _db_o_piso(self._max_abs, self._ref_dbfs),
+        }
+        if self.loudness is not None:
+            m.update(self.loudness.resultado())
+        return m
+
+
+# =========================
+#   PICOS DE FORMA DE ONDA
+# =========================
+PEAKS_ENABLED = _truthy(os.getenv("PEAKS_ENABLED", "1"))
+
+
+def _escalas_picos(raw: str) -> Tuple[int, ...]:
+    """Muestras por pixel de cada zoom; todas múltiplos de la más fina (se derivan de ella)."""
+    valores = sorted({int(v) for v in raw.split(",") if v.strip() and int(v) > 0}) or [512]
+    base = valores[0]
+    return tuple(sorted({max(base, round(v / base) * base) for v in valores}))
+
+
+PEAKS_SAMPLES_PER_PIXEL = _escalas_picos(os.getenv("PEAKS_SAMPLES_PER_PIXEL", "512,2048,8192"))
+
+
+class PicosOnda:
+    """
+    Mínimo/máximo por bloque de N frames (mono: sobre todos los canales) a varios zooms.
+    Se alimenta con las mismas muestras enteras que AcumuladorAnalisis, de a trozos de
+    cualquier largo; solo guarda el nivel más fino y deriva el resto al final.
+    """
+
+    def __init__(self, frame_rate: int, channels: int, sample_width: int,
+                 escalas: Tuple[int, ...] = PEAKS_SAMPLES_PER_PIXEL):
+        self.frame_rate = int(frame_rate)
+        self.channels = max(1, int(channels))
+        self.escalas = escalas
+        self._max_possible = float(1 << (8 * int(sample_width) - 1))
+        self._paso = escalas[0] * self.channels
+        self._resto = None
+        self._mins: list = []
+        self._maxs: list = []
+        self.n = 0
+
+    def _bins(self, x) -> None:
+        b = x.reshape(-1, self._paso)
+        self._mins.append(b.min(axis=1))
+        self._maxs.append(b.max(axis=1))
+
+    def agregar(self, muestras) -> None:
+        x = np.asarray(muestras).reshape(-1)
+        self.n += x.size
+        if self._resto is not None and self._resto.size:
+            falta = self._paso - self._resto.size
+            self._resto = np.concatenate((self._resto, x[:falta]))
+            x = x[falta:]
+            if self._resto.size < self._paso:
+                return
+            self._bins(self._resto)
+        usable = (x.size // self._paso) * self._paso
+        if usable:
+            self._bins(x[:usable])
+        # Copia: el bloque de origen puede ser una vista sobre un buffer que se reutiliza
+        self._resto = x[usable:].copy()
+
+    def resultado(self) -> Dict[str, Any]:
+        mins, maxs = list(self._mins), list(self._maxs)
+        if self._resto is not None and self._resto.size:
+            mins.append(self._resto.min(keepdims=True))
+            maxs.append(self._resto.max(keepdims=True))
+        mins = np.concatenate(mins) if mins else np.zeros(0, dtype=np.int64)
+        maxs = np.concatenate(maxs) if maxs else np.zeros(0, dtype=np.int64)
+
+        escala = 127.0 / self._max_possible
+        niveles = []
+        for spp in self.escalas:
+            k = spp // self.escalas[0]
+            idx = np.arange(0, mins.size, k)
+            lo = np.minimum.reduceat(mins, idx) if mins.size else mins
+            hi = np.maximum.reduceat(maxs, idx) if maxs.size else maxs
+            data = np.empty(2 * lo.size, dtype=np.int64)
+            data[0::2] = np.clip(np.round(lo * escala), -128, 127)
+            data[1::2] = np.clip(np.round(hi * escala), -128, 127)
+            # Mismas claves que el JSON de audiowaveform (peaks.js lo lee tal cual)
+            niveles.append({
+                "version": 2,
+                "channels": 1,
+                "sample_rate": self.frame_rate,
+                "samples_per_pixel": spp,
+                "bits": 8,
+                "length": int(lo.size),
+                "data": data.tolist(),
+            })
+        frames = self.n // self.channels
+        return {
+            "duration_s": round(frames / float(self.frame_rate), 3) if self.frame_rate else 0.0,
+            "levels": niveles,
+        }
+
+
+def nuevos_picos(frame_rate: int, channels: int, sample_width: int) -> Optional[PicosOnda]:
+    if not PEAKS_ENABLED or np is None:
+        return None
+    return PicosOnda(frame_rate, channels, sample_width)
+
+
+def rutas_picos(processed_wav: Path) -> Dict[str, Path]:
+    # Con "_PROCESADO" en el nombre: la retención los agrupa con el resto del conjunto
+    return {
+        "original": processed_wav.with_name(f"{processed_wav.stem}_peaks_original.json"),
+        "processed": processed_wav.with_name(f"{processed_wav.stem}_peaks.json"),
+    }
+
+
+def guardar_picos(processed_wav: Path, picos: Dict[str, Optional[PicosOnda]]) -> None:
+    """Escribe los picos junto al WAV procesado (solo los que se alimentaron en el análisis)."""
+    for clave, ruta in rutas_picos(processed_wav).items():
+        p = picos.get(clave)
+        if p is None or p.n == 0:
+            ruta.unlink(missing_ok=True)
+            continue
+        part = ruta.with_name(ruta.name + ".part")
+        part.write_text(json.dumps(p.resultado(), separators=(",", ":")), encoding="utf-8")
+        os.replace(part, ruta)
+
+
+# =========================
+#   LOUDNESS (BS.1770-4 / EBU R128)
+# =========================
+LOUDNESS_ENABLED = _truthy(os.getenv("LOUDNESS_ENABLED", "1"))
+# Etapa de normalización (opt-in): lleva el procesado al objetivo sin pasarse del true peak máximo.
+# Apagada por defecto: cambia la ganancia de la salida y los formatos extra pasan a codificarse
+# en una pasada aparte, después de la ganancia (ver formatos_en_dsp)
+LOUDNESS_NORMALIZE = _truthy(os.getenv("LOUDNESS_NORMALIZE", "0"))
+LOUDNESS_TARGET_LUFS = float(os.getenv("LOUDNESS_TARGET_LUFS", "-16"))
+LOUDNESS_TRUE_PEAK_DBTP = float(os.getenv("LOUDNESS_TRUE_PEAK_DBTP", "-1.0"))
+# Dentro de esta tolerancia no se reescribe el procesado
+LOUDNESS_TOLERANCE_LU = float(os.getenv("LOUDNESS_TOLERANCE_LU", "0.5"))
+# Frames por fila del filtro K por bloques (más filas = matmuls más chicos pero más estados)
+LOUDNESS_FILAS = 64
+
+LOUDNESS_GATE_ABS = -70.0
+LOUDNESS_GATE_REL = -10.0
+LOUDNESS_PASO_MS = 100  # bloques de 400 ms con 75 % de solapamiento = pasos de 100 ms
+
+# Interpolador 4x del Anexo 2 de BS.1770-4 (48 taps en 4 fases de 12)
+_TP_FASES = np.array([
+    [0.0017089843750, 0.0109863281250, -0.0196533203125, 0.0332031250000, -0.0594482421875, 0.1373291015625,
+     0.9721679687500, -0.1022949218750, 0.0476074218750, -0.0266113281250, 0.0148925781250, -0.0083007812500],
+    [-0.0291748046875, 0.0292968750000, -0.0517578125000, 0.0891113281250, -0.1665039062500, 0.4650878906250,
+     0.7797851562500, -0.2003173828125, 0.1015625000000, -0.0582275390625, 0.0330810546875, -0.0189208984375],
+    [-0.0189208984375, 0.0330810546875, -0.0582275390625, 0.1015625000000, -0.2003173828125, 0.7797851562500,
+     0.4650878906250, -0.1665039062500, 0.0891113281250, -0.0517578125000, 0.0292968750000, -0.0291748046875],
+    [-0.0083007812500, 0.0148925781250, -0.0266113281250, 0.0476074218750, -0.1022949218750, 0.9721679687500,
+     0.1373291015625, -0.0594482421875, 0.0332031250000, -0.0196533203125, 0.0109863281250, 0.0017089843750],
+], dtype=np.float32).T[::-1].copy() if np is not None else None  # fila j pondera x[t - 11 + j]
+_TP_TAPS = 12
+# Cota de cuánto puede superar una muestra interpolada al máximo de sus 12 vecinas
+_TP_GANANCIA_MAX = float(np.abs(_TP_FASES).sum(axis=0).max()) if np is not None else 1.0
+# Para señales densas: filas de 32 salidas como una sola matmul (tramo de 43 muestras -> 32 x 4 fases)
+_TP_FILA = 32
+
+
+def _matriz_tp():
+    m = np.zeros((_TP_FILA + _TP_TAPS - 1, 4 * _TP_FILA), dtype=np.float32)
+    for i in range(_TP_FILA):
+        m[i:i + _TP_TAPS, 4 * i:4 * i + 4] = _TP_FASES
+    return m
+
+
+_TP_MATRIZ = _matriz_tp() if np is not None else None
+
+
+def _max_abs(y) -> float:
+    return max(float(y.max()), -float(y.min())) if y.size else 0.0
+
+
+def _interpolar_todo(x) -> float:
+    """Máximo absoluto del sobremuestreo 4x de x (1D, las primeras 11 muestras son historia)."""
+    filas = (x.size - (_TP_TAPS - 1)) // _TP_FILA
+    pico = 0.0
+    if filas:
+        tramos = np.lib.stride_tricks.sliding_window_view(x, _TP_FILA + _TP_TAPS - 1)[: filas * _TP_FILA: _TP_FILA]
+        pico = _max_abs(tramos @ _TP_MATRIZ)
+    resto = x[filas * _TP_FILA:]
+    if resto.size >= _TP_TAPS:
+        pico = max(pico, _max_abs(np.lib.stride_tricks.sliding_window_view(resto, _TP_TAPS) @ _TP_FASES))
+    return pico
+
+
+def coeficientes_k(frame_rate: int) -> Tuple[Tuple[Tuple[float, ...], Tuple[float, ...]], ...]:
+    """
+    Biquads de la ponderación K ((b0, b1, b2), (a1, a2)) para cualquier sample rate
+    (misma derivación que libebur128; a 48 kHz coincide con la tabla de BS.1770).
+    """
+    f0, g, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = math.tan(math.pi * f0 / frame_rate)
+    vh = 10.0 ** (g / 20.0)
+    vb = vh ** 0.4996667741545416
+    a0 = 1.0 + k / q + k * k
+    shelf = (
+        ((vh + vb * k / q + k * k) / a0, 2.0 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0),
+        (2.0 * (k * k - 1.0) / a0, (1.0 - k / q + k * k) / a0),
+    )
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = math.tan(math.pi * f0 / frame_rate)
+    a0 = 1.0 + k / q + k * k
+    pasaaltos = ((1.0, -2.0, 1.0), (2.0 * (k * k - 1.0) / a0, (1.0 - k / q + k * k) / a0))
+    return shelf, pasaaltos
+
+
+def _simular_biquads(secciones, entrada, estado) -> Tuple[list, list]:
+    """Cascada de biquads en forma directa II transpuesta, muestra a muestra (solo para armar matrices)."""
+    s = list(estado)
+    salida = []
+    for x in entrada:
+        for i, ((b0, b1, b2), (a1, a2)) in enumerate(secciones):
+            y = b0 * x + s[2 * i]
+            s[2 * i] = b1 * x - a1 * y + s[2 * i + 1]
+            s[2 * i + 1] = b2 * x - a2 * y
+            x = y
+        salida.append(x)
+    return salida, s
+
+
+_MATRICES_IIR: Dict[Any, Tuple[Any, Any, Any]] = {}
+
+
+def matrices_biquads(secciones) -> Tuple[Any, Any, Any]:
+    """
+    Forma por bloques de una cascada de biquads (n = 2 estados por sección): para una fila X de
+    LOUDNESS_FILAS frames, [Y | s'] = X @ TG + s @ [OT | P]. TG (float32) es la respuesta desde
+    estado cero; OT y P llevan el estado entre filas. Se arman simulando el filtro una vez.
+    """
+    mats = _MATRICES_IIR.get(secciones)
+    if mats is not None:
+        return mats
+    c = LOUDNESS_FILAS
+    n = 2 * len(secciones)
+    cero = [0.0] * n
+
+    h, _ = _simular_biquads(secciones, [1.0] + [0.0] * (c - 1), cero)
+    tg = np.zeros((c, c + n))
+    for k in range(c):
+        tg[k, k:c] = h[: c - k]
+        # Estado final de la fila por un impulso en la posición k = estado c-1-k muestras después
+        impulso = [0.0] * (c - k)
+        impulso[0] = 1.0
+        tg[k, c:] = _simular_biquads(secciones, impulso, cero)[1]
+
+    ot = np.zeros((n, c))
+    p = np.zeros((n, n))
+    for j in range(n):
+        s0 = [0.0] * n
+        s0[j] = 1.0
+        y, s = _simular_biquads(secciones, [0.0] * c, s0)
+        ot[j] = y
+        p[j] = s
+
+    mats = (tg.astype(np.float32), ot, p)
+    _MATRICES_IIR[secciones] = mats
+    return mats
+
+
+def matrices_k(frame_rate: int) -> Tuple[Any, Any, Any]:
+    return matrices_biquads(coeficientes_k(frame_rate))
+
+
+def filtrar_biquads(x, mats, estado):
+    """
+    Filtra x (1D float32, múltiplo de LOUDNESS_FILAS) partiendo de estado; devuelve (y, estado final).
+    Exacto: las filas salen de un matmul y el estado entre filas de _escanear_estados.
+    """
+    tg, ot, p = mats
+    c = LOUDNESS_FILAS
+    yf = x.reshape(-1, c) @ tg
+    y = yf[:, :c]
+    s = _escanear_estados(yf[:, c:].astype(np.float64), p, estado)
+    previos = np.concatenate((estado[None, :], s[:-1]), axis=0)
+    y += (previos @ ot).astype(np.float32)
+    return y.reshape(-1), s[-1].copy()
+
+
+def _escanear_estados(f, p, s0):
+    """
+    Estados al final de cada fila: s[r] = s[r-1] @ p + f[r], con s[-1] = s0.
+    Suma prefija por duplicación (log pasos vectorizados); corta cuando p^d ya no aporta.
+    """
+    f[0] += s0 @ p
+    s = f
+    pd = p
+    d = 1
+    while d < s.shape[0] and np.abs(pd).max() > 1e-18:
+        siguiente = s.copy()
+        siguiente[d:] += s[:-d] @ pd
+        s = siguiente
+        pd = pd @ pd
+        d *= 2
+    return s
+
+
+def pesos_canales(channels: int) -> list[float]:
+    # BS.1770: surrounds pesan 1.41 y el LFE no cuenta (layouts 5.0 / 5.1 en orden de ffmpeg)
+    if channels == 6:
+        return [1.0, 1.0, 1.0, 0.0, 1.41, 1.41]
+    if channels == 5:
+        return [1.0, 1.0, 1.0, 1.41, 1.41]
+    return [1.0] * channels
+
+
+class MedidorLoudness:
+    """
+    Loudness integrado (ponderación K, bloques de 400 ms, gates -70 LUFS y -10 LU) y true peak
+    (sobremuestreo 4x). Se alimenta de a trozos con las mismas muestras enteras intercaladas que
+    AcumuladorAnalisis. El filtro K corre por filas de LOUDNESS_FILAS frames con matmuls y un
+    escaneo de estados (exacto, sin recursión muestra a muestra); el true peak solo interpola
+    alrededor de las muestras que podrían superar el pico ya visto.
+    """
+
+    def __init__(self, frame_rate: int, channels: int, sample_width: int):
+        self.frame_rate = int(frame_rate)
+        self.channels = max(1, int(channels))
+        self._escala = 1.0 / float(1 << (8 * int(sample_width) - 1))
+        self._mats = matrices_k(self.frame_rate)
+        self._pesos = pesos_canales(self.channels)
+        self._estado = np.zeros((self.channels, 4))
+        self._resto = np.zeros(0, dtype=np.int64)
+        self._pendiente = np.zeros((self.channels, 0), dtype=np.float32)
+        self._cola = np.zeros((self.channels, _TP_TAPS - 1), dtype=np.float32)
+        self._tp = 0.0
+        self.n = 0
+
+        # Energía ponderada por paso de 100 ms (los bloques de 400 ms se arman al final)
+        self._frames = 0
+        self._k = 0
+        self._fin_k = self._fin_paso(0)
+        self._parcial = 0.0
+        self._pasos: list[float] = []
+
+    def _fin_paso(self, k: int) -> int:
+        return int((k + 1) * LOUDNESS_PASO_MS * self.frame_rate / 1000.0)
+
+    def agregar(self, muestras) -> None:
+        x = np.asarray(muestras).reshape(-1)
+        self.n += x.size
+        if self._resto.size:
+            x = np.concatenate((self._resto, x))
+        usable = x.size - (x.size % self.channels)
+        self._resto = x[usable:].copy()
+        if not usable:
+            return
+        f = x[:usable].reshape(-1, self.channels).T.astype(np.float32, order="C")
+        f *= self._escala
+        self._true_peak(f)
+        self._filtrar(f)
+
+    def _true_peak(self, f) -> None:
+        xp = np.concatenate((self._cola, f), axis=1)
+        self._cola = xp[:, -(_TP_TAPS - 1):].copy()
+        magnitud = np.abs(xp)
+        ref = max(self._tp, float(magnitud[:, _TP_TAPS - 1:].max()))
+        self._tp = ref
+        if ref <= 0.0:
+            return
+        # Una interpolada solo puede superar ref si alguna de sus 12 vecinas pasa ref / ganancia máx.
+        cerca = np.flatnonzero(magnitud >= ref / _TP_GANANCIA_MAX)
+        if not cerca.size:
+            return
+        if cerca.size * _TP_TAPS > xp.size:
+            # Señal densa (p. ej. ya limitada): sale más barato interpolar todo el bloque
+            for canal in range(self.channels):
+                self._tp = max(self._tp, _interpolar_todo(xp[canal]))
+            return
+        # Marca las 12 interpoladas que dependen de cada muestra cercana (sin duplicados)
+        marca = np.zeros(xp.shape, dtype=bool)
+        plano = marca.reshape(-1)
+        for k in range(_TP_TAPS):
+            plano[np.minimum(cerca + k, plano.size - 1)] = True
+        marca[:, : _TP_TAPS - 1] = False
+        ts = np.flatnonzero(plano)
+        ventanas = np.lib.stride_tricks.sliding_window_view(xp.reshape(-1), _TP_TAPS)[ts - (_TP_TAPS - 1)]
+        self._tp = max(self._tp, _max_abs(ventanas @ _TP_FASES))
+
+    def _energia_k(self, f):
+        """Energía ponderada por frame de la señal filtrada K (f: canales x múltiplo de LOUDNESS_FILAS)."""
+        energia = np.zeros(f.shape[1], dtype=np.float64)
+        for canal, peso in enumerate(self._pesos):
+            if peso == 0.0:
+                continue
+            y, self._estado[canal] = filtrar_biquads(f[canal], self._mats, self._estado[canal])
+            y *= y
+            energia += peso * y
+        return energia
+
+    def _filtrar(self, f) -> None:
+        if self._pendiente.shape[1]:
+            f = np.concatenate((self._pendiente, f), axis=1)
+        usable = (f.shape[1] // LOUDNESS_FILAS) * LOUDNESS_FILAS
+        self._pendiente = f[:, usable:].copy()
+        if usable:
+            self._acumular(self._energia_k(f[:, :usable]))
+
+    def _acumular(self, energia) -> None:
+        if not energia.size:
+            return
+        f0 = self._frames
+        f1 = f0 + energia.size
+        cortes = []
+        while self._fin_k <= f1:
+            cortes.append(self._fin_k - f0)
+            self._k += 1
+            self._fin_k = self._fin_paso(self._k)
+        self._frames = f1
+        # Un solo pase: suma por tramo entre cortes de paso (el último tramo queda parcial)
+        inicios = [0] + [c for c in cortes if c < energia.size]
+        sumas = np.add.reduceat(energia, inicios).tolist()
+        for i in range(len(cortes)):
+            self._pasos.append(self._parcial + sumas[i] if i == 0 else sumas[i])
+            self._parcial = 0.0
+        if len(sumas) > len(cortes):
+            self._parcial += sumas[-1]
+
+    def resultado(self) -> Dict[str, Any]:
+        # Últimos frames (menos de una fila): se completan con ceros y se descarta lo agregado
+        resto = self._pendiente.shape[1]
+        if resto:
+            relleno = np.zeros((self.channels, LOUDNESS_FILAS), dtype=np.float32)
+            relleno[:, :resto] = self._pendiente
+            self._pendiente = self._pendiente[:, :0]
+            self._acumular(self._energia_k(relleno)[:resto])
+
+        lufs: Optional[float] = None
+        pasos = np.asarray(self._pasos, dtype=np.float64)
+        if pasos.size >= 4:
+            bloques = pasos[:-3] + pasos[1:-2] + pasos[2:-1] + pasos[3:]
+            fines = np.array([self._fin_paso(k) for k in range(pasos.size)])
+            inicios = np.concatenate(([0], fines[:-1]))
+            z = bloques / (fines[3:] - inicios[:-3])
+            with np.errstate(divide="ignore"):
+                l = -0.691 + 10.0 * np.log10(z)
+            sobre_abs = l > LOUDNESS_GATE_ABS
+            if sobre_abs.any():
+                gate_rel = -0.691 + 10.0 * math.log10(float(z[sobre_abs].mean())) + LOUDNESS_GATE_REL
+                z_ok = z[sobre_abs & (l > gate_rel)]
+                lufs = -0.691 + 10.0 * math.log10(float(z_ok.mean()))
+
+        return {
+            "lufs": lufs,
+            "true_peak_db": _db_o_piso(self._tp, 1.0),
+        }
+
+
+def nuevo_medidor(frame_rate: int, channels: int, sample_width: int) -> Optional[MedidorLoudness]:
+    if not LOUDNESS_ENABLED or np is None:
+        return None
+    return MedidorLoudness(frame_rate, channels, sample_width)
+
+
+def normaliza_loudness() -> bool:
+    return LOUDNESS_NORMALIZE and LOUDNESS_ENABLED and np is not None
+
+
+def ganancia_salida(m_proc: Dict[str, Any]) -> Tuple[Optional[float], str]:
+    """
+    Ganancia final del procesado y su motivo: "loudness" (objetivo LUFS, tope de true peak)
+    o "ceiling" (solo si el limitador se pasó del techo). (None, "") si no hace falta tocarlo.
+    """
+    if normaliza_loudness() and m_proc.get("lufs") is not None:
+        ganancia = min(
+            LOUDNESS_TARGET_LUFS - m_proc["lufs"],
+            LOUDNESS_TRUE_PEAK_DBTP - m_proc["true_peak_db"],
+        )
+        fuera_de_tp = m_proc["true_peak_db"] > LOUDNESS_TRUE_PEAK_DBTP + CEILING_TOLERANCIA_DB
+        if abs(ganancia) > LOUDNESS_TOLERANCE_LU or fuera_de_tp:
+            return ganancia, "loudness"
+    # Tolerancia: la cuantización a 16 bits deja el pico del limitador apenas sobre -1.0 dBFS
+    if m_proc["peak_db"] > CEILING_DBFS + CEILING_TOLERANCIA_DB:
+        return CEILING_DBFS - m_proc["peak_db"], "ceiling"
+    return None, ""
+
+
+def formatos_en_dsp(formatos: Tuple[str, ...]) -> Tuple[str, ...]:
+    # Con normalización casi siempre hay una ganancia posterior: codificar antes sería trabajo tirado
+    return () if normaliza_loudness() else formatos
+
+
+def registrar_normalizacion(analisis: Dict[str, Any], m_proc: Dict[str, Any], ganancia_db: float) -> None:
+    if normaliza_loudness() and "lufs" in m_proc:
+        analisis["loudness_target_lufs"] = LOUDNESS_TARGET_LUFS
+        analisis["loudness_gain_db"] = round(float(ganancia_db or 0.0), 2)
+
+
+def con_ganancia(m_nuevo: Dict[str, Any], m_previo: Dict[str, Any], ganancia: float) -> Dict[str, Any]:
+    """La ganancia es lineal: loudness y true peak se corren lo mismo sin volver a medir."""
+    if "lufs" in m_previo:
+        m_nuevo["lufs"] = None if m_previo["lufs"] is None else m_previo["lufs"] + ganancia
+        m_nuevo["true_peak_db"] = m_previo["true_peak_db"] + ganancia
+    return m_nuevo
+
+
+def _metricas_numpy(
+    audio: AudioSegment,
+    ventanas: bool = True,
+    picos: Optional[PicosOnda] = None,
+    loudness: Optional[MedidorLoudness] = None,
+) -> Dict[str, Any]:
+    acc = AcumuladorAnalisis(
+        audio.frame_rate, audio.channels, audio.sample_width, ventanas=ventanas, picos=picos, loudness=loudness
+    )
+    acc.agregar(muestras_numpy(audio))
+    return acc.resultado()
+
+
+def _metricas_pydub(audio: AudioSegment, ventanas: bool = True) -> Dict[str, Any]:
+    """Camino original (Python puro); se mantiene como fallback sin NumPy."""
+    dur_ms = len(audio)
+    nivel_dbfs = float(audio.dBFS) if audio.dBFS != float("-inf") else -90.0
+
+    niveles: Optional[list[float]] = None
+    if ventanas:
+        niveles = []
+        for i in range(0, dur_ms, VENTANA_RUIDO_MS):
+            c = audio[i: i + VENTANA_RUIDO_MS]
+            v = float(c.dBFS) if c.dBFS != float("-inf") else -90.0
+            niveles.append(v)
+
+    sample_width = audio.sample_width
+    max_possible = float((1 << (8 * sample_width - 1)) - 1)
+
+    samples = audio.get_array_of_samples()
+    if samples:
+        max_abs = max(abs(s) for s in samples)
+        peak_ratio = max_abs / max_possible
+        clip_samples = sum(1 for s in samples if abs(s) >= 0.985 * max_possible)
+        clip_ratio = clip_samples / len(samples)
+    else:
+        peak_ratio = 0.0
+        clip_ratio = 0.0
+
+    peak_db = audio.max_dBFS if audio.max_dBFS != float("-inf") else -90.0
+
+    return {
+        "dur_ms": dur_ms,
+        "nivel_dbfs": nivel_dbfs,
+        "niveles": niveles,
+        "peak_ratio": peak_ratio,
+        "clip_ratio": clip_ratio,
+        "peak_db": peak_db,
+    }
+
+
+def metricas_audio(
+    audio: AudioSegment,
+    ventanas: bool = True,
+    picos: Optional[PicosOnda] = None,
+    loudness: Optional[MedidorLoudness] = None,
+) -> Dict[str, Any]:
+    # picos y loudness solo se alimentan con el motor NumPy (sin él no hay forma de onda ni LUFS)
+    if motor_numpy_disponible(audio):
+        return _metricas_numpy(audio, ventanas=ventanas, picos=picos, loudness=loudness)
+    return _metricas_pydub(audio, ventanas=ventanas)
+
+
+def _bloque_clip(m: Dict[str, Any], is_lossy: bool) -> Dict[str, Any]:
+    peak_ratio = float(m["peak_ratio"])
+    clip_ratio = float(m["clip_ratio"])
+
+    # Para archivos lossy, ser más conservador (menos falsos positivos)
+    if is_lossy:
+        clip_detectado = (peak_ratio > 0.995) and (clip_ratio > 0.0020)
+        hot_signal = (peak_ratio > 0.985)
+    else:
+        clip_detectado = (peak_ratio > 0.992) and (clip_ratio > 0.0010)
+        hot_signal = (peak_ratio > 0.98)
+
+    if clip_detectado:
+        clip_code = "clipping_detected"
+    elif hot_signal:
+        clip_code = "hot_signal"
+    else:
+        clip_code = "no_clipping"
+
+    clip_txt = clip_labels(clip_code)
+
+    return {
+        "clip_detectado": bool(clip_detectado),
+        "hot_signal": bool(hot_signal),
+        "clip_ratio": round(float(clip_ratio), 5),
+        "clip_code": clip_code,
+        "clip_descripcion_es": clip_txt["es"],
+        "clip_descripcion_en": clip_txt["en"],
+    }
+
+
+def _bloque_loudness(m: Dict[str, Any], sufijo: str) -> Dict[str, Any]:
+    # Solo si se midió (motor NumPy); lufs es None si no hubo ni 400 ms sobre el gate absoluto
+    if "lufs" not in m:
+        return {}
+    return {
+        f"loudness{sufijo}_lufs": None if m["lufs"] is None else round(float(m["lufs"]), 1),
+        f"true_peak{sufijo}_dbtp": round(float(m["true_peak_db"]), 1),
+    }
+
+
+def analizar_clip(m: Dict[str, Any], original_path: Optional[Path] = None) -> Dict[str, Any]:
+    """Modo "solo clip": nivel, pico y bloque de clipping, sin la estimación de fondo por ventanas."""
+    ext = file_ext_lower(original_path) if original_path else ""
+    return {
+        "nivel_dbfs": round(float(m["nivel_dbfs"]), 1),
+        "peak_dbfs": round(float(m["peak_db"]), 1),
+        **_bloque_loudness(m, ""),
+        **_bloque_clip(m, ext in LOSSY_EXTS),
+    }
+
+
+def analizar_metricas(m: Dict[str, Any], original_path: Optional[Path] = None) -> Dict[str, Any]:
+    nivel_dbfs = float(m["nivel_dbfs"])
+
+    # Estimar “fondo” usando ventanas; percentil 10% (no 25%) para reducir sesgo si casi no hay pausas.
+    niveles = sorted(m["niveles"] or [])
+    ruido_estimado = -80.0
+    ruido_confiable = True
+
+    if niveles:
+        n_sub = max(1, len(niveles) // 10)  # ✅ 10% más bajo
+        ruido_estimado = sum(niveles[:n_sub]) / n_sub
+        # Si ni siquiera el “10% más bajo” baja de cierto umbral, probablemente no hubo pausas limpias.
+        if ruido_estimado > -45.0:
+            ruido_confiable = False
+
+    # Limitar para no inventar fondos absurdos
+    ruido_estimado = max(ruido_estimado, -80.0)
+
+    snr = nivel_dbfs - ruido_estimado
+
+    # Ambiente (copy prudente)
+    if not ruido_confiable:
+        sala_code = "unknown"
+        sala_indice = 0.7
+    else:
+        if snr >= 40 and ruido_estimado <= -70:
+            sala_code = "very_controlled"
+            sala_indice = 0.15
+        elif snr >= 28 and ruido_estimado <= -58:
+            sala_code = "controlled"
+            sala_indice = 0.45
+        elif snr >= 18:
+            sala_code = "reflective_or_busy"
+            sala_indice = 0.75
+        else:
+            sala_code = "very_busy"
+            sala_indice = 1.0
+
+    sala_txt = sala_labels(sala_code)
+
+    # Peak/clipping heurística
+    peak_db = float(m["peak_db"])
+    crest_factor = peak_db - nivel_dbfs
+
+    ext = file_ext_lower(original_path) if original_path else ""
+    is_lossy = ext in LOSSY_EXTS
+
+    return {
+        "file_ext": ext,
+        "is_lossy": bool(is_lossy),
+
+        "sala_code": sala_code,
+        "sala_indice": round(float(sala_indice), 2),
+        "sala_descripcion_es": sala_txt["es"],
+        "sala_descripcion_en": sala_txt["en"],
+
+        "ruido_estimado_dbfs": round(float(ruido_estimado), 1),
+        "ruido_confiable": bool(ruido_confiable),
+        "nivel_original_dbfs": round(float(nivel_dbfs), 1),
+        "snr_db": round(float(snr), 1),
+
+        "peak_dbfs": round(float(peak_db), 1),
+        "crest_factor_db": round(float(crest_factor), 1),
+
+        **_bloque_loudness(m, "_original"),
+
+        **_bloque_clip(m, is_lossy),
+    }
+
+
+def analizar_audio(
+    audio: AudioSegment,
+    original_path: Optional[Path] = None,
+    solo_clip: bool = False,
+    picos: Optional[PicosOnda] = None,
+    loudness: Optional[MedidorLoudness] = None,
+) -> Dict[str, Any]:
+    m = metricas_audio(audio, ventanas=not solo_clip, picos=picos, loudness=loudness)
+    if solo_clip:
+        return analizar_clip(m, original_path=original_path)
+    return analizar_metricas(m, original_path=original_path)
+
+def calcular_quality(a: Dict[str, Any], mode_code: str) -> Tuple[int, str, str]:
+    score = 55
+
+    snr = float(a.get("snr_db", 0.0))
+    sala = float(a.get("sala_indice", 0.5))
+    nivel_orig = float(a.get("nivel_original_dbfs", -24.0))
+    clip_code = str(a.get("clip_code", "no_clipping"))
+    ruido_confiable = bool(a.get("ruido_confiable", True))
+    is_lossy = bool(a.get("is_lossy", False))
+
+    # SNR contribución (si no es confiable, pesa menos)
+    snr_clamped = max(10.0, min(40.0, snr))
+    snr_contrib = (snr_clamped - 10.0) * (18.0 / 30.0)  # hasta +18
+    if not ruido_confiable:
+        snr_contrib *= 0.45
+    score += snr_contrib
+
+    # Sala/ambiente (ligero)
+    score += (1.0 - min(max(sala, 0.0), 1.0)) * 12.0
+
+    # Nivel original (solo para orientar)
+    if -26 <= nivel_orig <= -16:
+        score += 8
+    elif -32 <= nivel_orig < -26 or -16 < nivel_orig <= -10:
+        score += 4
+    else:
+        score -= 4
+
+    # Penalizaciones por picos/clipping (más suaves, especialmente en lossy)
+    if clip_code == "clipping_detected":
+        score -= 22 if not is_lossy else 16
+    elif clip_code == "hot_signal":
+        score -= 8 if not is_lossy else 6
+
+    # Modo (micro externo bonus leve)
+    if mode_code == "LAPTOP_CELULAR":
+        score -= 3
+    else:
+        score += 3
+
+    score = int(max(0, min(100, round(score))))
 
     # Labels más justos (especialmente si clipping)
     if clip_code == "clipping_detected":
@@ -548,71 +2403,523 @@ def calcular_quality(a: Dict[str, Any], mode_code: str) -> Tuple[int, str, str]:
     return score, label_es, label_en
 
 # =========================
-#   PROCESAMIENTO
+#   DSP NUMPY (sin ffmpeg)
 # =========================
-def procesar_audio_core(original_path: Path, mode_code: str) -> Tuple[Path, Dict[str, Any]]:
-    audio = AudioSegment.from_file(original_path)
-    analisis = analizar_audio(audio, original_path=original_path)
+# "auto": cadena en ffmpeg (FFMPEG_MODE) y, si no hay binario con los filtros (ver backend_dsp)
+# o falla, la misma cadena en NumPy;
+# "numpy": siempre NumPy (no lanza ffmpeg para el DSP en memoria);
+# "pydub": camino anterior (ffmpeg y, si falla, high_pass_filter + normalize de pydub).
+# El procesamiento por bloques de episodios largos sigue usando el filtergraph de ffmpeg.
+DSP_BACKEND = os.getenv("DSP_BACKEND", "auto").strip().lower()
+# Frames por bloque de cada etapa (múltiplo de LOUDNESS_FILAS; acota los temporales float64)
+DSP_BLOQUE_FRAMES = 1 << 16
 
-    # Recortes más conservadores (evita “comerse” palabra)
-    TRIM_INICIO_MS = 120
-    TRIM_FINAL_MS = 200
 
-    dur_ms = len(audio)
-    if dur_ms > (TRIM_INICIO_MS + TRIM_FINAL_MS):
-        audio_proc_base = audio[TRIM_INICIO_MS : dur_ms - TRIM_FINAL_MS]
-    elif dur_ms > TRIM_INICIO_MS:
-        audio_proc_base = audio[TRIM_INICIO_MS:]
+def dsp_numpy_disponible(audio: AudioSegment) -> bool:
+    return np is not None and DSP_BACKEND != "pydub" and audio.sample_width in _NP_DTYPES
+
+
+def backend_dsp() -> str:
+    """
+    Backend DSP del camino en memoria según DSP_BACKEND, FFMPEG_MODE y las capacidades detectadas:
+    "numpy", "ffmpeg_pipe", "ffmpeg_tempfile" o "pydub". Si ffmpeg no tiene los filtros, ni se intenta.
+    """
+    if DSP_BACKEND == "numpy" and np is not None:
+        return "numpy"
+    if _capacidades.dsp:
+        return "ffmpeg_pipe" if FFMPEG_MODE == "pipe" else "ffmpeg_tempfile"
+    if DSP_BACKEND == "auto" and np is not None and FFMPEG_MODE == "pipe":
+        return "numpy"
+    return "pydub"
+
+
+def coeficientes_pasaaltos(frame_rate: int, hz: float = HIGHPASS_HZ, polos: int = HIGHPASS_POLOS):
+    """Biquad pasaaltos ((b0, b1, b2), (a1, a2)) con las fórmulas del filtro highpass de ffmpeg."""
+    w0 = 2.0 * math.pi * hz / frame_rate
+    if polos == 1:
+        a1 = -math.exp(-w0)
+        b0 = (1.0 - a1) / 2.0
+        return (((b0, -b0, 0.0), (a1, 0.0)),)
+    # Butterworth (Q = 0.707, el ancho por defecto de ffmpeg)
+    alpha = math.sin(w0) / (2.0 * 0.707)
+    cw = math.cos(w0)
+    a0 = 1.0 + alpha
+    b0 = (1.0 + cw) / 2.0 / a0
+    return (((b0, -2.0 * b0, b0), (-2.0 * cw / a0, (1.0 - alpha) / a0)),)
+
+
+def _filtrar_tramo(x, mats, estado):
+    """Filtra x (1D float32) in place; el último trozo parcial se completa con ceros. Devuelve el estado."""
+    c = LOUDNESS_FILAS
+    usable = x.size - x.size % c
+    if usable:
+        x[:usable], estado = filtrar_biquads(x[:usable], mats, estado)
+    if usable < x.size:
+        relleno = np.zeros(c, dtype=np.float32)
+        relleno[: x.size - usable] = x[usable:]
+        # El estado posterior al relleno no sirve: solo pasa en el último bloque
+        x[usable:] = filtrar_biquads(relleno, mats, estado)[0][: x.size - usable]
+    return estado
+
+
+def _maximo_con_decaimiento(v, lam: float, previo: float):
+    """
+    y[t] = max(v[t], y[t-1] * e^lam) con y[-1] = previo (v >= 0, lam < 0), sin recursión:
+    en log, y[t] = max_k(log v[k] - lam k) + lam t es un maximum.accumulate.
+    """
+    rampa = np.arange(v.size, dtype=np.float64) * lam
+    inicial = math.log(previo) + lam if previo > 0.0 else -np.inf
+    if np.count_nonzero(v) * 4 < v.size:
+        activos = np.flatnonzero(v)
+        # Pocos valores no nulos (p. ej. la atenuación de un limitador): el máximo solo cambia en
+        # ellos, así que se acumula sobre esos y se repite cada valor hasta el siguiente
+        u = np.log(v[activos].astype(np.float64)) - rampa[activos]
+        np.maximum(u, inicial, out=u)
+        np.maximum.accumulate(u, out=u)
+        tramos = np.diff(np.append(activos, v.size))
+        u = np.concatenate((np.full(activos[0] if activos.size else v.size, inicial), np.repeat(u, tramos)))
     else:
-        audio_proc_base = audio
+        with np.errstate(divide="ignore"):
+            u = np.log(v.astype(np.float64))
+        u -= rampa
+        np.maximum(u, inicial, out=u)
+        np.maximum.accumulate(u, out=u)
+    u += rampa
+    return np.exp(u, out=u)
+
+
+def _minimo_deslizante(v, w: int):
+    """min(v[j:j + w]) para cada j (van Herk / Gil-Werman: mínimos prefijo y sufijo por tramos de w)."""
+    n = v.size - w + 1
+    if w <= 8:
+        # Ventanas cortas (el techo): w - 1 mínimos entre copias desplazadas salen más baratos
+        m = v[:n].copy()
+        for k in range(1, w):
+            np.minimum(m, v[k: k + n], out=m)
+        return m
+    t = np.full(-(-v.size // w) * w, np.inf)
+    t[: v.size] = v
+    t = t.reshape(-1, w)
+    prefijo = np.minimum.accumulate(t, axis=1).reshape(-1)
+    sufijo = np.minimum.accumulate(t[:, ::-1], axis=1)[:, ::-1].reshape(-1)
+    return np.minimum(sufijo[:n], prefijo[w - 1: w - 1 + n])
+
+
+# Filas del seguidor de envolvente: sumas acumuladas por fila como un matmul triangular (float32)
+_FILA_ENV = 64
+_TRIANGULAR = np.triu(np.ones((_FILA_ENV, _FILA_ENV), dtype=np.float32)) if np is not None else None
+# Pasadas para fijar en qué frames el seguidor sube (attack) o baja (release)
+COMPRESOR_ITERACIONES = 6
+
+
+def _seguidor_envolvente(d, sube, c_att: float, c_rel: float, e0: float):
+    """
+    e[t] = e[t-1] + (d[t] - e[t-1]) * c[t], con c[t] = c_att donde sube y c_rel si no (e[-1] = e0).
+    Con la decisión fija la recursión es lineal: por fila, e = P * (e_inicio + suma(c d / P)) con
+    P el producto acumulado de (1 - c); el estado entre filas sale de un escaneo por duplicación.
+    d (float32) y sube tienen largo múltiplo de _FILA_ENV.
+    """
+    paso = sube.astype(np.float32)
+    log_q = paso * np.float32(math.log1p(-c_att) - math.log1p(-c_rel))
+    log_q += np.float32(math.log1p(-c_rel))
+    prod = np.exp(log_q.reshape(-1, _FILA_ENV) @ _TRIANGULAR)
+    peso = paso * np.float32(c_att - c_rel)
+    peso += np.float32(c_rel)
+    peso *= d
+    env = (peso.reshape(-1, _FILA_ENV) / prod) @ _TRIANGULAR
+    env *= prod
+
+    # Entre filas: E[r] = prod_fin[r] * E[r-1] + env_fin[r]
+    p = prod[:, -1].astype(np.float64)
+    f = env[:, -1].astype(np.float64)
+    f[0] += e0 * p[0]
+    dist = 1
+    while dist < f.size:
+        f_sig = f.copy()
+        f_sig[dist:] += f[:-dist] * p[dist:]
+        p_sig = p.copy()
+        p_sig[dist:] *= p[:-dist]
+        f, p = f_sig, p_sig
+        dist *= 2
+    inicios = np.concatenate(([e0], f[:-1])).astype(np.float32)
+    env += prod * inicios[:, None]
+    return env.reshape(-1)
+
+
+class CompresorNumpy:
+    """
+    acompressor vectorizado: detección RMS con los canales enlazados por promedio, rodilla suave
+    de Hermite y los mismos coeficientes de attack/release que ffmpeg. El seguidor de envolvente
+    (sube con attack, baja con release) se resuelve con _seguidor_envolvente partiendo de una
+    aproximación (máximo con decaimiento de release + pasabajos de attack) y corrigiendo en qué
+    frames sube hasta que no cambia (o COMPRESOR_ITERACIONES); la ganancia se aplica in place.
+    """
 
-    # Limpieza básica
-    audio_proc_base = audio_proc_base.high_pass_filter(80)
+    def __init__(self, frame_rate: int, threshold: float, ratio: float, attack: float,
+                 release: float, knee: float, makeup: float):
+        # Tope de 0.25: (1 - c)^_FILA_ENV tiene que seguir siendo un float32 normal
+        self._c_att = min(0.25, 4000.0 / (attack * frame_rate))
+        self._c_rel = min(0.25, 4000.0 / (release * frame_rate))
+        self._mats_att = matrices_biquads((((self._c_att, 0.0, 0.0), (self._c_att - 1.0, 0.0)),))
+        self._lam = math.log1p(-self._c_rel)
+        self._env = 0.0
+        self.ratio = float(ratio)
+        self.makeup = float(makeup)
+        self.knee = float(knee)
+        self._thres = math.log(threshold)
+        self._knee_start = math.log(threshold / math.sqrt(knee))
+        self._knee_stop = math.log(threshold * math.sqrt(knee))
+        self._comp_knee_stop = (self._knee_stop - self._thres) / self.ratio + self._thres
+
+    def _envolvente(self, d):
+        n = d.size
+        if n % _FILA_ENV:
+            d = np.concatenate((d, np.zeros(_FILA_ENV - n % _FILA_ENV, dtype=np.float32)))
+        guia = _maximo_con_decaimiento(d, self._lam, self._env).astype(np.float32)
+        _filtrar_tramo(guia, self._mats_att, np.zeros(2))
+        sube = np.empty(d.size, dtype=bool)
+        sube[0] = d[0] > self._env
+        np.greater(d[1:], guia[:-1], out=sube[1:])
+        nueva = sube.copy()
+        for _ in range(COMPRESOR_ITERACIONES):
+            env = _seguidor_envolvente(d, sube, self._c_att, self._c_rel, self._env)
+            np.greater(d[1:], env[:-1], out=nueva[1:])
+            if np.array_equal(nueva[:n], sube[:n]):
+                break
+            sube, nueva = nueva, sube
+        self._env = float(env[n - 1])
+        return env[:n]
+
+    def procesar(self, x) -> None:
+        """x: (canales, frames) float32, contiguo por canal. Los bloques van en orden."""
+        d = np.abs(x[0]) if x.shape[0] == 1 else np.abs(x).mean(axis=0)
+        d *= d
+        env = self._envolvente(d)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pendiente = np.log(env)
+            pendiente *= 0.5
+            ganancia = (pendiente - self._thres) / self.ratio + self._thres
+            if self.knee > 1.0:
+                rodilla = pendiente < self._knee_stop
+                if rodilla.any():
+                    ancho = self._knee_stop - self._knee_start
+                    t = (pendiente[rodilla] - self._knee_start) / ancho
+                    p0, p1, m0, m1 = self._knee_start, self._comp_knee_stop, ancho, ancho / self.ratio
+                    ct2 = -3.0 * p0 - 2.0 * m0 + 3.0 * p1 - m1
+                    ct3 = 2.0 * p0 + m0 - 2.0 * p1 + m1
+                    ganancia[rodilla] = ((ct3 * t + ct2) * t + m0) * t + p0
+            ganancia -= pendiente
+            np.exp(ganancia, out=ganancia)
+        ganancia[~(pendiente > self._knee_start)] = 1.0
+        ganancia *= np.float32(self.makeup)
+        x *= ganancia
+
+
+class LimitadorNumpy:
+    """
+    Limitador con lookahead de attack ms: ganancia requerida min(1, limite / pico) por frame,
+    mínimo deslizante hacia adelante, release exponencial sobre la atenuación en dB y promedio
+    móvil de attack ms. Como cada frame entra en todas las ventanas que lo promedian, ninguna
+    muestra pasa el límite (a diferencia de alimiter, no agrega latencia).
+    """
 
-    # Compresión + limitador (sutil), con fallback si no hay ffmpeg
-    audio_proc: AudioSegment
-    try:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            tmpdir = Path(tmpdir)
-            pre = tmpdir / "pre.wav"
-            post = tmpdir / "post.wav"
-            audio_proc_base.export(pre, format="wav")
-            ffmpeg_compresor_la76_sutil(pre, post)
-            audio_proc = AudioSegment.from_file(post)
-    except Exception as e:
-        logger.warning(f"[AUDIO] Fallback sin ffmpeg/filters: {e}")
-        # Fallback suave: normalizar pero dejando techo seguro -1 dBFS
-        audio_proc = effects.normalize(audio_proc_base)
-        audio_proc = apply_ceiling_dbfs(audio_proc, -1.0)
+    def __init__(self, frame_rate: int, limit: float, attack_ms: float, release_ms: float):
+        self.limite = float(limit)
+        self.ventana = max(1, int(round(attack_ms * frame_rate / 1000.0)))
+        self._lam = -1000.0 / max(1e-6, release_ms * frame_rate)
+        self._atenuacion = 0.0
+        self._previos = None  # últimas ventana-1 ganancias (el promedio móvil cruza bloques)
+
+    def procesar(self, buf, i0: int, i1: int) -> None:
+        """Limita buf[:, i0:i1] in place; lee ventana-1 frames más allá de i1 (el lookahead)."""
+        w = self.ventana
+        fin = min(buf.shape[1], i1 + w - 1)
+        pico = np.abs(buf[:, i0:fin]).max(axis=0)
+        if (
+            float(pico.max()) <= self.limite
+            and self._atenuacion * math.exp(self._lam) < 1e-9
+            and (self._previos is None or float(self._previos.min(initial=1.0)) >= 1.0)
+        ):
+            # Nada que limitar en el bloque (ni su lookahead) y sin release pendiente: ganancia 1
+            self._atenuacion = 0.0
+            self._previos = np.ones(w - 1)
+            return
+        requerida = np.ones(i1 - i0 + w - 1)
+        np.divide(self.limite, pico, out=requerida[: pico.size], where=pico > self.limite)
+        minima = _minimo_deslizante(requerida, w)
+        if self._previos is None:
+            # Ventanas que empiezan antes del primer frame (los primeros promedios también quedan <= límite)
+            minima = np.concatenate((np.minimum.accumulate(requerida[: w - 1]), minima))
+        atenuacion = _maximo_con_decaimiento(-np.log(minima), self._lam, self._atenuacion)
+        self._atenuacion = float(atenuacion[-1])
+        ganancia = np.exp(-atenuacion, out=atenuacion)
+        if self._previos is not None:
+            ganancia = np.concatenate((self._previos, ganancia))
+        self._previos = ganancia[ganancia.size - (w - 1):]
+        acumulada = np.concatenate(([0.0], np.cumsum(ganancia)))
+        buf[:, i0:i1] *= ((acumulada[w:] - acumulada[:-w]) / w).astype(np.float32)
+
+
+def curva_fade(n: int, curva: str = "tri"):
+    """Ganancias de un fade out de n frames (de 1 a 1/n), con las curvas de afade de ffmpeg."""
+    g = np.arange(n, 0, -1, dtype=np.float64) / n
+    if curva == "qsin":
+        return np.sin(g * (math.pi / 2.0))
+    if curva == "hsin":
+        return (1.0 - np.cos(g * math.pi)) / 2.0
+    if curva == "qua":
+        return g * g
+    if curva == "cub":
+        return g * g * g
+    return g
+
+
+def pcm_a_float32(audio: AudioSegment):
+    """PCM entero intercalado -> buffer float32 planar (canales x frames) en [-1, 1)."""
+    x = muestras_numpy(audio)
+    ch = audio.channels
+    frames = x.size // ch
+    buf = np.empty((ch, frames), dtype=np.float32)
+    buf[...] = x[: frames * ch].reshape(frames, ch).T
+    buf *= 1.0 / float(1 << (8 * audio.sample_width - 1))
+    return buf
+
+
+def float32_a_s16(buf):
+    """Cuantiza buf (se modifica in place) a s16 intercalado (frames x canales), como pcm_s16le de ffmpeg."""
+    buf *= 32768.0
+    np.rint(buf, out=buf)
+    np.clip(buf, -32768.0, 32767.0, out=buf)
+    return buf.T.astype("<i2", order="C")
+
+
+def float32_a_pcm16(buf, frame_rate: int) -> AudioSegment:
+    pcm = float32_a_s16(buf)
+    return AudioSegment(data=pcm.tobytes(), sample_width=2, frame_rate=frame_rate, channels=buf.shape[0])
+
+
+class CadenaDspNumpy:
+    """
+    La cadena de filtergraph_dsp sobre un buffer float32 planar, in place y etapa por etapa
+    (cada etapa recorre todo el buffer por bloques de DSP_BLOQUE_FRAMES con su estado).
+    """
 
-    # Fade out leve para evitar clicks al final
-    audio_proc = audio_proc.fade_out(120)
+    def __init__(self, frame_rate: int, channels: int, ceiling_dbfs: float):
+        self.frame_rate = int(frame_rate)
+        self._pasaaltos = matrices_biquads(coeficientes_pasaaltos(self.frame_rate))
+        self._estados_hp = np.zeros((channels, self._pasaaltos[2].shape[0]))
+        self.compresor = CompresorNumpy(self.frame_rate, **COMPRESOR)
+        self.limitador = LimitadorNumpy(
+            self.frame_rate, 10 ** (LIMITADOR["limit_dbfs"] / 20), LIMITADOR["attack"], LIMITADOR["release"]
+        )
+        self.techo = LimitadorNumpy(self.frame_rate, 10 ** (ceiling_dbfs / 20), TECHO_ATTACK_MS, TECHO_RELEASE_MS)
 
-    # Techo final (seguro)
-    audio_proc = apply_ceiling_dbfs(audio_proc, -1.0)
+    @staticmethod
+    def _bloques(total: int):
+        for i0 in range(0, total, DSP_BLOQUE_FRAMES):
+            yield i0, min(total, i0 + DSP_BLOQUE_FRAMES)
 
+    def pasaaltos(self, buf) -> None:
+        for i0, i1 in self._bloques(buf.shape[1]):
+            for canal in range(buf.shape[0]):
+                self._estados_hp[canal] = _filtrar_tramo(buf[canal, i0:i1], self._pasaaltos, self._estados_hp[canal])
 
+    def comprimir(self, buf) -> None:
+        for i0, i1 in self._bloques(buf.shape[1]):
+            self.compresor.procesar(buf[:, i0:i1])
+        # El limitador mira hacia adelante: corre después de comprimir todo el buffer
+        for i0, i1 in self._bloques(buf.shape[1]):
+            self.limitador.procesar(buf, i0, i1)
 
-    analisis["nivel_final_dbfs"] = round(
-        float(audio_proc.dBFS) if audio_proc.dBFS != float("-inf") else -90.0, 1
-    )
+    def fade_out(self, buf, fade_ms: int) -> None:
+        n = min(buf.shape[1], int(round(fade_ms * self.frame_rate / 1000.0)))
+        if n > 0:
+            buf[:, -n:] *= curva_fade(n).astype(np.float32)
+
+    def limitar_techo(self, buf) -> None:
+        for i0, i1 in self._bloques(buf.shape[1]):
+            self.techo.procesar(buf, i0, i1)
+
+
+# =========================
+#   PROCESAMIENTO
+# =========================
+# Porcentaje de avance al terminar cada etapa (los eventos de progreso usan el máximo alcanzado)
+PROGRESO_ETAPAS = {
+    "probe": 2,
+    "decode": 20,
+    "analyze": 35,
+    "decode_analyze": 35,
+    "trim": 37,
+    "highpass": 50,
+    "compress": 75,
+    "dsp": 80,
+    "fade": 82,
+    "ceiling": 85,
+    "loudness": 85,
+    "analyze_processed": 88,
+    "export": 95,
+    "peaks": 97,
+    "report": 100,
+}
+
+
+class Etapas:
+    """
+    Cronómetro por etapa del pipeline; los tiempos (ms) viajan en la respuesta.
+    Si se pasa on_evento, avisa el inicio y fin de cada etapa (progreso de jobs).
+    """
+
+    def __init__(self, on_evento: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
+        self.ms: Dict[str, float] = {}
+        self._on_evento = on_evento
+        self._t0 = time.perf_counter()
+        self._pct = 0
+
+    def _emitir(self, nombre: str, estado: str, stage_ms: Optional[float] = None) -> None:
+        if self._on_evento is None:
+            return
+        if estado == "end":
+            self._pct = max(self._pct, PROGRESO_ETAPAS.get(nombre, self._pct))
+        ev: Dict[str, Any] = {
+            "stage": nombre,
+            "state": estado,
+            "percent": self._pct,
+            "elapsed_ms": round((time.perf_counter() - self._t0) * 1000.0, 1),
+        }
+        if stage_ms is not None:
+            ev["stage_ms"] = stage_ms
+        try:
+            self._on_evento(ev)
+        except Exception as e:
+            # El progreso es informativo: nunca debe romper el procesamiento
+            logger.debug(f"[PROGRESO] Callback falló: {e}")
+
+    @contextmanager
+    def etapa(self, nombre: str):
+        self._emitir(nombre, "start")
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = (time.perf_counter() - t0) * 1000.0
+            self.ms[nombre] = round(self.ms.get(nombre, 0.0) + dt, 1)
+            self._emitir(nombre, "end", round(dt, 1))
+
+
+# Recortes más conservadores (evita “comerse” palabra)
+TRIM_INICIO_MS = 120
+TRIM_FINAL_MS = 200
+FADE_OUT_MS = 120
+CEILING_DBFS = -1.0
+CEILING_TOLERANCIA_DB = 0.05
+
+
+def recortar_bordes(audio: AudioSegment) -> AudioSegment:
+    dur_ms = len(audio)
+    if dur_ms > (TRIM_INICIO_MS + TRIM_FINAL_MS):
+        return audio[TRIM_INICIO_MS : dur_ms - TRIM_FINAL_MS]
+    if dur_ms > TRIM_INICIO_MS:
+        return audio[TRIM_INICIO_MS:]
+    return audio
+
+
+def _dsp_pydub(audio_proc_base: AudioSegment, etapas: Etapas, probar_ffmpeg: bool = True) -> Tuple[AudioSegment, str]:
+    """Camino con pydub (+ ffmpeg vía WAV temporales si existe). Devuelve (audio, backend)."""
+    # Limpieza básica
+    with etapas.etapa("highpass"):
+        audio_proc_base = audio_proc_base.high_pass_filter(80)
+
+    # Compresión + limitador (sutil), con fallback si no hay ffmpeg
+    audio_proc: AudioSegment
+    with etapas.etapa("compress"):
+        try:
+            if not probar_ffmpeg:
+                raise FileNotFoundError("ffmpeg no disponible")
+            with tempfile.TemporaryDirectory() as tmpdir:
+                tmpdir = Path(tmpdir)
+                pre = tmpdir / "pre.wav"
+                post = tmpdir / "post.wav"
+                audio_proc_base.export(pre, format="wav")
+                ffmpeg_compresor_la76_sutil(pre, post)
+                audio_proc = AudioSegment.from_file(post)
+            backend = "ffmpeg_tempfile"
+        except Exception as e:
+            logger.warning(f"[AUDIO] Fallback sin ffmpeg/filters: {e}")
+            # Fallback suave: normalizar pero dejando techo seguro -1 dBFS
+            # (effects.normalize deja el pico en -0.1 dBFS, así que el techo no necesita medirlo otra vez)
+            audio_proc = effects.normalize(audio_proc_base, headroom=0.1)
+            audio_proc = apply_ceiling_dbfs(audio_proc, CEILING_DBFS, max_dbfs=-0.1)
+            backend = "pydub"
+
+    # Fade out leve para evitar clicks al final
+    with etapas.etapa("fade"):
+        audio_proc = audio_proc.fade_out(FADE_OUT_MS)
+
+    return audio_proc, backend
+
+
+def _dsp_numpy(
+    audio_proc_base: AudioSegment, etapas: Etapas, fade_ms: int, ceiling_dbfs: float, segmentos: int = 0
+) -> Tuple[AudioSegment, str]:
+    """
+    La cadena de filtergraph_dsp en NumPy, sobre un solo buffer float32 que se modifica in place
+    (o repartida en segmentos entre procesos, ver segmentos_dsp). Devuelve (audio, backend).
+    """
+    if segmentos:
+        try:
+            with etapas.etapa("dsp"):
+                return dsp_numpy_segmentado(audio_proc_base, segmentos, fade_ms, ceiling_dbfs), "numpy_parallel"
+        except Exception as e:
+            logger.warning(f"[AUDIO] DSP por segmentos falló, usando la cadena serial: {e}")
+    with etapas.etapa("highpass"):
+        buf = pcm_a_float32(audio_proc_base)
+        cadena = CadenaDspNumpy(audio_proc_base.frame_rate, buf.shape[0], ceiling_dbfs)
+        cadena.pasaaltos(buf)
+    with etapas.etapa("compress"):
+        cadena.comprimir(buf)
+    with etapas.etapa("fade"):
+        cadena.fade_out(buf, fade_ms)
+    with etapas.etapa("ceiling"):
+        cadena.limitar_techo(buf)
+        return float32_a_pcm16(buf, audio_proc_base.frame_rate), "numpy"
+
+
+def _completar_analisis(
+    analisis: Dict[str, Any],
+    a_proc: Dict[str, Any],
+    mode_code: str,
+    dur_ms: int,
+    dur_proc_ms: int,
+) -> None:
+    """Mezcla la medición del procesado (modo solo clip) con el análisis del original + modo y puntaje."""
+    analisis["nivel_final_dbfs"] = a_proc["nivel_dbfs"]
 
     # Peak real del PROCESADO (post techo)
-    analisis["peak_dbfs"] = round(
-        float(audio_proc.max_dBFS) if audio_proc.max_dBFS != float("-inf") else -90.0, 1
-    )
+    analisis["peak_dbfs"] = a_proc["peak_dbfs"]
 
     # Crest factor del PROCESADO (pico - nivel promedio)
     analisis["crest_factor_db"] = round(
         float(analisis["peak_dbfs"] - analisis["nivel_final_dbfs"]), 1
     )
 
-    # Recalcular SOLO el bloque de picos/clipping para que el reporte sea coherente con el procesado
-    a_proc = analizar_audio(audio_proc, original_path=original_path)
+    # Bloque de picos/clipping coherente con el procesado
     for k in ("clip_detectado", "hot_signal", "clip_ratio", "clip_code", "clip_descripcion_es", "clip_descripcion_en"):
         analisis[k] = a_proc[k]
 
+    if "loudness_lufs" in a_proc:
+        analisis["loudness_final_lufs"] = a_proc["loudness_lufs"]
+        analisis["true_peak_final_dbtp"] = a_proc["true_peak_dbtp"]
 
+    analisis["duracion_original_s"] = round(dur_ms / 1000.0, 2)
+    analisis["duracion_procesada_s"] = round(dur_proc_ms / 1000.0, 2)
+
+    puntuar_analisis(analisis, mode_code)
+
+
+def puntuar_analisis(analisis: Dict[str, Any], mode_code: str) -> None:
+    """Agrega el modo (es/en) y el puntaje de calidad al análisis."""
     # Normaliza modo
     mode_code = "MICROFONO_EXTERNO" if mode_code == "MICROFONO_EXTERNO" else "LAPTOP_CELULAR"
     analisis["mode_code"] = mode_code
@@ -621,19 +2928,444 @@ def procesar_audio_core(original_path: Path, mode_code: str) -> Tuple[Path, Dict
     analisis["modo_en"] = mlabels["en"]
     analisis["modo"] = analisis["modo_es"]  # compat
 
-    analisis["duracion_original_s"] = round(dur_ms / 1000.0, 2)
-    analisis["duracion_procesada_s"] = round(len(audio_proc) / 1000.0, 2)
-
     quality_score, q_es, q_en = calcular_quality(analisis, mode_code)
     analisis["quality_score"] = int(quality_score)
     analisis["quality_label_es"] = q_es
     analisis["quality_label_en"] = q_en
     analisis["quality_label"] = q_es  # compat
 
+
+def procesar_audio_core(
+    original_path: Path,
+    mode_code: str,
+    progreso: Optional[Callable[[Dict[str, Any]], None]] = None,
+    formatos: Tuple[str, ...] = (),
+    info: Optional[Dict[str, Any]] = None,
+) -> Tuple[Path, Dict[str, Any]]:
+    """
+    Pipeline por etapas: decodifica una vez, analiza el original una vez y, tras el DSP,
+    mide el procesado en modo "solo clip" (sin repetir la estimación de fondo).
+    progreso (opcional) recibe un evento al empezar y terminar cada etapa.
+    formatos: codificaciones extra (FORMATOS_SALIDA) que salen de la misma pasada de ffmpeg.
+    info: resultado de probe_audio si ya se corrió (admisión); si no, se corre acá.
+    """
+    etapas = Etapas(progreso)
+
+    if PROCESSING_MODE != "memory" and np is not None and _capacidades.ffmpeg:
+        if info is None:
+            with etapas.etapa("probe"):
+                info = probe_audio(original_path)
+        if info and info["sample_rate"] > 0 and info["channels"] > 0 and (
+            PROCESSING_MODE == "streaming" or info["duration_s"] >= STREAMING_MIN_DURATION_S
+        ):
+            return procesar_audio_streaming(original_path, mode_code, info, etapas, formatos)
+
+    with etapas.etapa("decode"):
+        audio = decodificar_audio(original_path, info)
+
+    picos = {"original": nuevos_picos(audio.frame_rate, audio.channels, audio.sample_width)}
+    with etapas.etapa("analyze"):
+        analisis = analizar_audio(
+            audio, original_path=original_path, picos=picos["original"],
+            loudness=nuevo_medidor(audio.frame_rate, audio.channels, audio.sample_width),
+        )
+
+    dur_ms = len(audio)
+
+    with etapas.etapa("trim"):
+        audio_proc_base = recortar_bordes(audio)
+    del audio
+
     processed_name = f"{original_path.stem}_PROCESADO.wav"
     processed_path = PROCESSED_DIR / processed_name
-    audio_proc.export(processed_path, format="wav")
 
+    audio_proc: Optional[AudioSegment] = None
+    dsp_backend = "pydub"
+    exportado = False
+    preferido = backend_dsp()
+    usar_numpy = dsp_numpy_disponible(audio_proc_base)
+    segmentos = segmentos_dsp(audio_proc_base)
+
+    if preferido == "numpy" and usar_numpy:
+        audio_proc, dsp_backend = _dsp_numpy(audio_proc_base, etapas, FADE_OUT_MS, CEILING_DBFS, segmentos)
+    elif preferido == "ffmpeg_pipe":
+        try:
+            with etapas.etapa("dsp"):
+                if segmentos:
+                    # Los formatos extra se codifican después, desde el WAV ya unido
+                    audio_proc = ffmpeg_dsp_segmentado(audio_proc_base, segmentos, FADE_OUT_MS, CEILING_DBFS)
+                else:
+                    audio_proc = ffmpeg_dsp_pipe(
+                        audio_proc_base, processed_path, FADE_OUT_MS, CEILING_DBFS, formatos_en_dsp(formatos)
+                    )
+            dsp_backend = "ffmpeg_parallel" if segmentos else "ffmpeg_pipe"
+            exportado = not segmentos
+        except Exception as e:
+            logger.warning(f"[AUDIO] ffmpeg pipe falló, usando camino pydub: {e}")
+
+    if audio_proc is None and usar_numpy and FFMPEG_MODE == "pipe":
+        # Misma cadena sin ffmpeg (ni WAV temporales); FFMPEG_MODE=tempfile sigue pidiendo el camino anterior
+        audio_proc, dsp_backend = _dsp_numpy(audio_proc_base, etapas, FADE_OUT_MS, CEILING_DBFS, segmentos)
+    if audio_proc is None:
+        audio_proc, dsp_backend = _dsp_pydub(audio_proc_base, etapas, probar_ffmpeg=_capacidades.dsp)
+    del audio_proc_base
+
+    # Medición del PROCESADO en una sola pasada (nivel, picos, loudness)
+    with etapas.etapa("analyze_processed"):
+        picos["processed"] = nuevos_picos(audio_proc.frame_rate, audio_proc.channels, audio_proc.sample_width)
+        m_proc = metricas_audio(
+            audio_proc, ventanas=False, picos=picos["processed"],
+            loudness=nuevo_medidor(audio_proc.frame_rate, audio_proc.channels, audio_proc.sample_width),
+        )
+
+    # Ganancia final: objetivo de loudness o, si no, techo seguro
+    ganancia, motivo = ganancia_salida(m_proc)
+    if ganancia is not None:
+        with etapas.etapa(motivo):
+            audio_proc = audio_proc.apply_gain(ganancia)
+            picos["processed"] = nuevos_picos(audio_proc.frame_rate, audio_proc.channels, audio_proc.sample_width)
+            m_proc = con_ganancia(
+                metricas_audio(audio_proc, ventanas=False, picos=picos["processed"]), m_proc, ganancia
+            )
+        exportado = False
+    a_proc = analizar_clip(m_proc, original_path=original_path)
+
+    _completar_analisis(analisis, a_proc, mode_code, dur_ms, len(audio_proc))
+    registrar_normalizacion(analisis, m_proc, ganancia if motivo == "loudness" else 0.0)
+
+    if not exportado:
+        with etapas.etapa("export"):
+            audio_proc.export(processed_path, format="wav")
+        # Lo codificado en la pasada DSP ya no coincide con el WAV final (o nunca se generó)
+        for fmt in formatos:
+            ruta_formato(processed_path, fmt).unlink(missing_ok=True)
+
+    with etapas.etapa("peaks"):
+        guardar_picos(processed_path, picos)
+
+    analisis["dsp_backend"] = dsp_backend
+    analisis["timings_ms"] = etapas.ms
+    return processed_path, analisis
+
+# =========================
+#   PROCESAMIENTO POR BLOQUES (episodios largos)
+# =========================
+# "memory": siempre AudioSegment en memoria; "streaming": siempre por bloques;
+# "auto": por bloques si el audio dura STREAMING_MIN_DURATION_S o más.
+PROCESSING_MODE = os.getenv("PROCESSING_MODE", "auto").strip().lower()
+STREAMING_MIN_DURATION_S = float(os.getenv("STREAMING_MIN_DURATION_S", "900"))
+# Largo de cada bloque PCM leído desde ffmpeg (la memoria pico queda acotada por esto)
+STREAM_BLOCK_S = float(os.getenv("STREAM_BLOCK_S", "10"))
+
+
+def _ffmpeg_stream(cmd: list[str], frame_width: int, block_frames: int, on_block) -> None:
+    """
+    Corre ffmpeg con salida PCM por stdout y entrega bloques de block_frames frames
+    (como array int16) a on_block, sin juntar nunca el audio completo en memoria.
+    """
+    block_bytes = max(1, block_frames) * frame_width
+    with tempfile.TemporaryFile() as errf:
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=errf)
+        try:
+            resto = b""
+            while True:
+                buf = proc.stdout.read(block_bytes)
+                if not buf:
+                    break
+                buf = resto + buf
+                usable = len(buf) - (len(buf) % frame_width)
+                resto = buf[usable:]
+                if usable:
+                    on_block(np.frombuffer(buf[:usable], dtype="<i2"))
+            rc = proc.wait()
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        finally:
+            proc.stdout.close()
+        if rc != 0:
+            errf.seek(0)
+            err = errf.read().decode("utf-8", "replace").strip()
+            raise RuntimeError(f"ffmpeg falló ({rc}): {err[-500:]}")
+
+
+def procesar_audio_streaming(
+    original_path: Path,
+    mode_code: str,
+    info: Dict[str, Any],
+    etapas: Etapas,
+    formatos: Tuple[str, ...] = (),
+) -> Tuple[Path, Dict[str, Any]]:
+    """
+    Misma cadena que procesar_audio_core, pero sin cargar el episodio en memoria:
+    1) ffmpeg decodifica a PCM por stdout y el análisis se acumula bloque a bloque;
+    2) un segundo ffmpeg recorta, filtra y escribe el WAV final, y su salida por stdout
+       alimenta la medición "solo clip" del procesado.
+    Los filtros de ffmpeg mantienen su estado entre bloques y AcumuladorAnalisis arrastra
+    las ventanas de 200 ms que cruzan el borde de un bloque, así que no hay costuras.
+    """
+    sr = int(info["sample_rate"])
+    ch = int(info["channels"])
+    frame_width = 2 * ch
+    block_frames = int(STREAM_BLOCK_S * sr)
+    pcm_out = ["-f", "s16le", "-c:a", "pcm_s16le", "-ar", str(sr), "-ac", str(ch), "pipe:1"]
+
+    picos = {"original": nuevos_picos(sr, ch, 2)}
+    acc = AcumuladorAnalisis(sr, ch, 2, ventanas=True, picos=picos["original"], loudness=nuevo_medidor(sr, ch, 2))
+    with etapas.etapa("decode_analyze"):
+        _ffmpeg_stream(
+            ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", str(original_path), "-vn", *pcm_out],
+            frame_width, block_frames, acc.agregar,
+        )
+    m = acc.resultado()
+    analisis = analizar_metricas(m, original_path=original_path)
+    dur_ms = int(m["dur_ms"])
+    total_frames = acc.frames
+
+    # Mismos recortes que recortar_bordes, expresados en frames
+    ini_ms, fin_ms = 0, dur_ms
+    if dur_ms > (TRIM_INICIO_MS + TRIM_FINAL_MS):
+        ini_ms, fin_ms = TRIM_INICIO_MS, dur_ms - TRIM_FINAL_MS
+    elif dur_ms > TRIM_INICIO_MS:
+        ini_ms = TRIM_INICIO_MS
+    ini_f = int(ini_ms * sr / 1000.0)
+    fin_f = min(total_frames, int(fin_ms * sr / 1000.0))
+    dur_proc_s = max(0, fin_f - ini_f) / float(sr)
+
+    processed_path = PROCESSED_DIR / f"{original_path.stem}_PROCESADO.wav"
+    part = processed_path.with_name(processed_path.name + ".part")
+    formatos_dsp = formatos_en_dsp(formatos)
+    graph = (
+        f"atrim=start_sample={ini_f}:end_sample={fin_f},asetpts=PTS-STARTPTS,"
+        + filtergraph_dsp(dur_proc_s, FADE_OUT_MS, CEILING_DBFS)
+        + _asplit_formatos(["file", "pipe"], formatos_dsp)
+    )
+    args_formatos, parts_formatos = _salidas_formatos(processed_path, formatos_dsp)
+    picos["processed"] = nuevos_picos(sr, ch, 2)
+    acc_proc = AcumuladorAnalisis(
+        sr, ch, 2, ventanas=False, picos=picos["processed"], loudness=nuevo_medidor(sr, ch, 2)
+    )
+    formatos_ok = True
+    try:
+        with etapas.etapa("dsp"):
+            _ffmpeg_stream(
+                [
+                    "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+                    "-i", str(original_path), "-vn",
+                    "-filter_complex", f"[0:a]{graph}",
+                    "-map", "[file]", "-c:a", "pcm_s16le", "-ar", str(sr), "-ac", str(ch), "-f", "wav", str(part),
+                    *args_formatos,
+                    "-map", "[pipe]", *pcm_out,
+                ],
+                frame_width, block_frames, acc_proc.agregar,
+            )
+        m_proc = acc_proc.resultado()
+
+        # Objetivo de loudness o techo: una pasada extra de ganancia, también por bloques
+        ganancia, motivo = ganancia_salida(m_proc)
+        if ganancia is not None:
+            fixed = processed_path.with_name(processed_path.name + ".gain.part")
+            picos["processed"] = nuevos_picos(sr, ch, 2)
+            acc_proc = AcumuladorAnalisis(sr, ch, 2, ventanas=False, picos=picos["processed"])
+            with etapas.etapa(motivo):
+                _ffmpeg_stream(
+                    [
+                        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+                        "-f", "wav", "-i", str(part),
+                        "-filter_complex", f"[0:a]volume={ganancia:.4f}dB,asplit=2[file][pipe]",
+                        "-map", "[file]", "-c:a", "pcm_s16le", "-f", "wav", str(fixed),
+                        "-map", "[pipe]", *pcm_out,
+                    ],
+                    frame_width, block_frames, acc_proc.agregar,
+                )
+            os.replace(fixed, part)
+            m_proc = con_ganancia(acc_proc.resultado(), m_proc, ganancia)
+            # Las codificaciones son previas a la ganancia: se descartan y se rehacen desde el WAV final
+            formatos_ok = False
+        os.replace(part, processed_path)
+        if formatos_ok:
+            _publicar_formatos(processed_path, formatos_dsp, parts_formatos)
+    finally:
+        for p in (part, *parts_formatos):
+            p.unlink(missing_ok=True)
+
+    a_proc = analizar_clip(m_proc, original_path=original_path)
+    _completar_analisis(analisis, a_proc, mode_code, dur_ms, int(m_proc["dur_ms"]))
+    registrar_normalizacion(analisis, m_proc, ganancia if motivo == "loudness" else 0.0)
+
+    with etapas.etapa("peaks"):
+        guardar_picos(processed_path, picos)
+
+    analisis["dsp_backend"] = "ffmpeg_stream"
+    analisis["timings_ms"] = etapas.ms
+    return processed_path, analisis
+
+# =========================
+#   ANÁLISIS RÁPIDO (sin procesar)
+# =========================
+# Largo de cada bloque leído al escanear el archivo (la memoria pico queda acotada por esto)
+ANALYZE_BLOCK_S = float(os.getenv("ANALYZE_BLOCK_S", "10"))
+WAV_EXTS = {"wav", "wave"}
+
+
+def _metricas_wav(path: Path) -> Dict[str, Any]:
+    """
+    Escanea un WAV PCM por bloques con el módulo wave (sin decodificar todo el archivo).
+    Lanza wave.Error si no es PCM entero de 8/16/32 bits (p. ej. float o WAVE_FORMAT_EXTENSIBLE).
+    """
+    with wave.open(str(path), "rb") as w:
+        sw = w.getsampwidth()
+        if sw not in _NP_DTYPES:
+            raise wave.Error(f"sample width {sw} no soportado")
+        sr = w.getframerate()
+        ch = w.getnchannels()
+        acc = AcumuladorAnalisis(sr, ch, sw, ventanas=True, loudness=nuevo_medidor(sr, ch, sw))
+        block_frames = max(1, int(ANALYZE_BLOCK_S * sr))
+        while True:
+            buf = w.readframes(block_frames)
+            if not buf:
+                break
+            if sw == 1:
+                # WAV de 8 bits es sin signo; pydub lo centra igual antes de medir
+                acc.agregar(np.frombuffer(buf, dtype=np.uint8).astype(np.int16) - 128)
+            else:
+                acc.agregar(np.frombuffer(buf, dtype=_NP_DTYPES[sw]))
+    return acc.resultado()
+
+
+def metricas_archivo(
+    path: Path,
+    etapas: Etapas,
+    info: Optional[Dict[str, Any]] = None,
+) -> Tuple[Dict[str, Any], str]:
+    """
+    Métricas del análisis del original sin cargarlo en memoria: WAV PCM se lee por bloques
+    con el módulo wave; el resto (FLAC, MP3, ...) se decodifica con ffmpeg a PCM por stdout.
+    Sin NumPy, o sin metadatos para armar el decode, cae a pydub. Devuelve (métricas, motor).
+    """
+    if np is not None and ANALYSIS_ENGINE == "numpy":
+        if file_ext_lower(path) in WAV_EXTS:
+            try:
+                with etapas.etapa("decode_analyze"):
+                    return _metricas_wav(path), "wave"
+            except (wave.Error, EOFError) as e:
+                logger.info(f"[ANALYZE] {path.name} no es WAV PCM simple, usando ffmpeg: {e}")
+
+        if info is None:
+            with etapas.etapa("probe"):
+                info = probe_audio(path)
+        if info and info["sample_rate"] > 0 and info["channels"] > 0 and _capacidades.ffmpeg:
+            sr = int(info["sample_rate"])
+            ch = int(info["channels"])
+            acc = AcumuladorAnalisis(sr, ch, 2, ventanas=True, loudness=nuevo_medidor(sr, ch, 2))
+            with etapas.etapa("decode_analyze"):
+                _ffmpeg_stream(
+                    [
+                        "ffmpeg", "-hide_banner", "-loglevel", "error", "-i", str(path), "-vn",
+                        "-f", "s16le", "-c:a", "pcm_s16le", "-ar", str(sr), "-ac", str(ch), "pipe:1",
+                    ],
+                    2 * ch, max(1, int(ANALYZE_BLOCK_S * sr)), acc.agregar,
+                )
+            return acc.resultado(), "ffmpeg_stream"
+
+    with etapas.etapa("decode"):
+        audio = decodificar_audio(path, info)
+    with etapas.etapa("analyze"):
+        medidor = nuevo_medidor(audio.frame_rate, audio.channels, audio.sample_width)
+        return metricas_audio(audio, loudness=medidor), "pydub"
+
+
+def analizar_archivo(path: Path, mode_code: str, info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Solo diagnóstico (analizar_audio + calcular_quality) sobre el original:
+    sin recorte, filtros ni export. Los picos y el clipping son los del archivo subido.
+    """
+    etapas = Etapas()
+    m, motor = metricas_archivo(path, etapas, info)
+    analisis = analizar_metricas(m, original_path=path)
+    analisis["duracion_original_s"] = round(int(m["dur_ms"]) / 1000.0, 2)
+    puntuar_analisis(analisis, mode_code)
+    analisis["analysis_backend"] = motor
+    analisis["timings_ms"] = etapas.ms
+    return analisis
+
+# =========================
+#   PROFILING (opt-in, por request)
+# =========================
+PROFILING_ENABLED = _truthy(os.getenv("PROFILING_ENABLED", "0"))
+# Fracción de requests perfilados al azar (0 = solo los que piden el header)
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_HEADER = os.getenv("PROFILING_HEADER", "X-Profile").strip()
+# Si está seteado, el header tiene que traer este valor (si no, alcanza con "1")
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "").strip()
+
+_perfiles_lock = threading.Lock()
+_perfiles_activos = 0
+
+
+def pedir_perfil(request: Request) -> bool:
+    if not PROFILING_ENABLED:
+        return False
+    valor = (request.headers.get(PROFILING_HEADER) or "").strip()
+    if valor and valor == (PROFILING_TOKEN or "1"):
+        return True
+    return PROFILING_SAMPLE_RATE > 0 and random.random() < PROFILING_SAMPLE_RATE
+
+
+def procesar_audio_core_perfilado(original_path: Path, mode_code: str, **kwargs: Any) -> Tuple[Path, Dict[str, Any]]:
+    """
+    procesar_audio_core bajo cProfile + tracemalloc. Guarda junto al informe:
+    {stem}_PROCESADO_profile.prof (pstats, para snakeviz/pstats) y _profile.txt (resumen).
+    cProfile solo ve el hilo que llama; tracemalloc es de todo el proceso, así que con el
+    backend de hilos y otros jobs en paralelo el pico es aproximado (queda anotado en el resumen).
+    """
+    global _perfiles_activos
+    with _perfiles_lock:
+        _perfiles_activos += 1
+        concurrentes = _perfiles_activos
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+
+    prof = cProfile.Profile()
+    t0 = time.perf_counter()
+    try:
+        prof.enable()
+        try:
+            processed_path, analisis = procesar_audio_core(original_path, mode_code, **kwargs)
+        finally:
+            prof.disable()
+    finally:
+        wall_ms = (time.perf_counter() - t0) * 1000.0
+        with _perfiles_lock:
+            pico_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            _perfiles_activos -= 1
+            if _perfiles_activos == 0:
+                tracemalloc.stop()
+
+    base = REPORT_DIR / f"{original_path.stem}_PROCESADO_profile"
+    prof_path = base.with_suffix(".prof")
+    txt_path = base.with_suffix(".txt")
+    prof.dump_stats(str(prof_path))
+
+    buf = io.StringIO()
+    buf.write(f"Archivo: {original_path.name}\n")
+    buf.write(f"Tiempo total: {wall_ms:.1f} ms\n")
+    buf.write(f"tracemalloc pico: {pico_mb:.1f} MB" + (f" (aprox.: {concurrentes} perfiles en paralelo)" if concurrentes > 1 else "") + "\n")
+    buf.write(f"Etapas (ms): {json.dumps(analisis.get('timings_ms') or {})}\n")
+    buf.write(f"Backend DSP: {analisis.get('dsp_backend')}\n\n")
+    stats = pstats.Stats(prof, stream=buf)
+    stats.sort_stats("cumulative").print_stats(40)
+    txt_path.write_text(buf.getvalue(), encoding="utf-8")
+
+    analisis["profile"] = {
+        "prof_name": prof_path.name,
+        "summary_name": txt_path.name,
+        "wall_ms": round(wall_ms, 1),
+        "tracemalloc_peak_mb": round(pico_mb, 1),
+    }
+    logger.info(f"[PROFILE] {original_path.name}: {wall_ms:.0f} ms, pico {pico_mb:.1f} MB -> {prof_path.name}")
     return processed_path, analisis
 
 # =========================
@@ -688,272 +3420,2714 @@ def construir_informe_texto(nombre_original: str, a: Dict[str, Any], lang: str)
             "Graba 5–10 s de “silencio” al inicio para ayudar a estimar el fondo/limpieza.",
         ]
 
-    lines = []
-    lines.append(tr(lang, "report.title"))
-    lines.append("")
-    lines.append(f"{tr(lang,'report.file')}: {nombre_original}")
-    lines.append("")
+    lines = []
+    lines.append(tr(lang, "report.title"))
+    lines.append("")
+    lines.append(f"{tr(lang,'report.file')}: {nombre_original}")
+    lines.append("")
+
+    # ✅ Resumen rápido: 4 líneas máximo
+    lines.append(tr(lang, "report.quick"))
+    lines.append(f"- {score_line}")
+    lines.append(f"- {peak_line}")
+    lines.append(f"- Tip #1: {main_hint_1}")
+    lines.append(f"- Tip #2: {main_hint_2}")
+    lines.append("")
+
+    # ✅ Sección educativa (valor real sin llenar el resumen)
+    lines.append(edu_title)
+    for tip in edu:
+        lines.append(f"- {tip}")
+    lines.append("")
+
+    # Resumen general (puede quedar, pero sin sobrecargar arriba)
+    lines.append(tr(lang, "report.summary"))
+    if lang == "en":
+        lines.append(
+            f"We processed your audio in {modo} mode. "
+            f"Environment estimate: {ambiente}. "
+            f"Estimated background: {a['ruido_estimado_dbfs']} dBFS (confidence: {ruido_conf})."
+        )
+    else:
+        lines.append(
+            f"Procesamos tu audio en modo {modo}. "
+            f"Estimación de ambiente: {ambiente}. "
+            f"Fondo estimado: {a['ruido_estimado_dbfs']} dBFS (confiabilidad: {ruido_conf})."
+        )
+    lines.append("")
+
+    lines.append(tr(lang, "report.trim_note"))
+    lines.append("")
+
+    # Datos técnicos (opcional)
+    lines.append(tr(lang, "report.keydata"))
+    lines.append(f"- {tr(lang,'k.mode')}: {modo}")
+    lines.append(f"- {tr(lang,'k.room')}: {ambiente} (índice {a['sala_indice']})" if lang=="es" else f"- {tr(lang,'k.room')}: {ambiente} (index {a['sala_indice']})")
+    lines.append(f"- {tr(lang,'k.noise')}: {a['ruido_estimado_dbfs']} dBFS")
+    lines.append(f"- {tr(lang,'k.noise_conf')}: {ruido_conf}")
+    lines.append(f"- {tr(lang,'k.orig')}: {a['nivel_original_dbfs']} dBFS")
+    lines.append(f"- {tr(lang,'k.final')}: {a['nivel_final_dbfs']} dBFS")
+    if a.get("loudness_original_lufs") is not None:
+        lines.append(f"- {tr(lang,'k.loud_orig')}: {a['loudness_original_lufs']} LUFS")
+    if a.get("loudness_final_lufs") is not None:
+        lines.append(f"- {tr(lang,'k.loud_final')}: {a['loudness_final_lufs']} LUFS")
+    if a.get("true_peak_final_dbtp") is not None:
+        lines.append(f"- {tr(lang,'k.true_peak')}: {a['true_peak_final_dbtp']} dBTP")
+    lines.append(f"- {tr(lang,'k.snr')}: {a.get('snr_db', 0.0)} dB")
+    lines.append(f"- {tr(lang,'k.peak')}: {a.get('peak_dbfs', 0.0)} dBFS")
+    lines.append(f"- {tr(lang,'k.crest')}: {a.get('crest_factor_db', 0.0)} dB")
+    lines.append(f"- {tr(lang,'k.score')}: {a.get('quality_score','-')} / 100 ({quality_label})")
+    lines.append("")
+    lines.append(tr(lang, "report.clip_comment"))
+    lines.append(clip_desc)
+    lines.append("")
+    return "\n".join(lines)
+
+
+def analysis_to_html(a: Dict[str, Any], lang: str) -> str:
+    lang = norm_lang(lang)
+
+    modo = a.get("modo_en") if lang == "en" else a.get("modo_es")
+    modo = modo or a.get("modo", "-")
+
+    quality_label = a.get("quality_label_en") if lang == "en" else a.get("quality_label_es")
+    quality_label = quality_label or a.get("quality_label", "-")
+
+    score = a.get("quality_score", "-")
+    peak = a.get("peak_dbfs", "-")
+    clip_detectado = bool(a.get("clip_detectado", False))
+    hot_signal = bool(a.get("hot_signal", False))
+
+    def li(label: str, value: Any) -> str:
+        return f"<li><strong>{html_escape(label)}:</strong> {html_escape(str(value))}</li>"
+
+    # -------------------------
+    # Tips educativos (arriba y abiertos)
+    # -------------------------
+    if lang == "en":
+        tips_title = "Tips to record better at home"
+        tips_summary = "Show tips"
+        tips = [
+            "Choose a room with soft stuff (curtains, carpet, sofa). Avoid empty rooms.",
+            "Don’t face a hard wall. Aim the mic toward a blanket/curtain 30–60 cm away.",
+            "DIY booth: record near a closet full of clothes or hang a blanket behind you.",
+            "Mic distance: 10–15 cm with a pop filter (or 15–20 cm slightly off-axis).",
+            "Reduce noise: turn off fan/AC, close windows, keep the mic away from the laptop.",
+            "Record 5–10 seconds of silence at the start to help cleanup and estimation.",
+        ]
+    else:
+        tips_title = "Tips para grabar mejor en casa"
+        tips_summary = "Ver tips"
+        tips = [
+            "Elige una pieza con cosas blandas (cortinas, alfombra, sofá). Evita piezas vacías.",
+            "No grabes mirando una pared dura. Mejor apunta el mic hacia una manta/cortina a 30–60 cm.",
+            "Cabina casera: graba cerca de un closet con ropa o cuelga una manta detrás tuyo.",
+            "Distancia al mic: 10–15 cm con pop filter (o 15–20 cm y un poco de lado).",
+            "Reduce ruido: apaga ventilador/AC, cierra ventanas, aleja el mic del notebook.",
+            "Graba 5–10 s de “silencio” al inicio para ayudar a limpieza/estimación del fondo.",
+        ]
+
+    tips_html = (
+        "<details open style='margin-top:10px;'>"
+        f"<summary style='cursor:pointer; opacity:.95; font-weight:700;'>"
+        f"{html_escape(tips_summary)} — {html_escape(tips_title)}"
+        f"</summary>"
+        "<ul class='report-list' style='margin-top:10px;'>"
+        + "".join(f"<li>{html_escape(t)}</li>" for t in tips)
+        + "</ul>"
+        "</details>"
+    )
+
+    # -------------------------
+    # Resumen mínimo (3 líneas)
+    # -------------------------
+    items = []
+    items.append(li(tr(lang, "k.score"), f"{score} / 100 — {quality_label}"))
+    items.append(li(tr(lang, "k.mode"), modo))
+
+    if lang == "en":
+        if clip_detectado or hot_signal:
+            status = f"Peak ~ {peak} dBFS. Risk of clipping: lower input gain."
+        else:
+            status = f"Peak ~ {peak} dBFS. No clear clipping detected."
+        status_label = "Status"
+    else:
+        if clip_detectado or hot_signal:
+            status = f"Pico ~ {peak} dBFS. Riesgo de clipping: baja la ganancia."
+        else:
+            status = f"Pico ~ {peak} dBFS. No se detecta clipping claro."
+        status_label = "Estado"
+
+    items.append(li(status_label, status))
+
+    return (
+        "<div class='report-box'>"
+        + (f"<h3 style='margin:0 0 6px 0;'>Tips</h3>" if lang == "es"
+        else f"<h3 style='margin:0 0 6px 0;'>Tips</h3>")
+        + tips_html
+        + ("<h4 style='margin:14px 0 6px 0; opacity:.9;'>Resumen informe</h4>" if lang == "es"
+        else "<h4 style='margin:14px 0 6px 0; opacity:.9;'>Report summary</h4>")
+        + "<ul class='report-list'>"
+        + "".join(items)
+        + "</ul>"
+        + "</div>"
+    )
+
+
+def _mm_ss(segundos: float) -> str:
+    total = int(round(segundos))
+    h, resto = divmod(total, 3600)
+    return f"{h}:{resto // 60:02d}:{resto % 60:02d}" if h else f"{resto // 60}:{resto % 60:02d}"
+
+
+def resumen_lote(items: list) -> Dict[str, Any]:
+    """
+    Agregado de un lote. Cada ítem: {"original_filename", "status" ("done" / "error" / otro),
+    "analysis" (si terminó), "error"}; lo comparten GET /api/batch y la CLI.
+    """
+    terminados = [it for it in items if it.get("status") == "done" and it.get("analysis")]
+    hechos = [it["analysis"] for it in terminados]
+    puntajes = [
+        (int(it["analysis"]["quality_score"]), it["original_filename"])
+        for it in terminados if it["analysis"].get("quality_score") is not None
+    ]
+    lufs = [float(a["loudness_final_lufs"]) for a in hechos if a.get("loudness_final_lufs") is not None]
+    fallidos = sum(1 for it in items if it.get("status") == "error")
+    return {
+        "total": len(items),
+        "done": len(hechos),
+        "error": fallidos,
+        "pending": len(items) - len(hechos) - fallidos,
+        "duration_s": round(sum(float(a.get("duracion_original_s") or 0.0) for a in hechos), 1),
+        "avg_quality_score": round(sum(p for p, _ in puntajes) / len(puntajes), 1) if puntajes else None,
+        "lowest_quality": {"score": min(puntajes)[0], "original_filename": min(puntajes)[1]} if puntajes else None,
+        "loudness_final_lufs": {"min": min(lufs), "max": max(lufs)} if lufs else None,
+        "clipping": sum(1 for a in hechos if a.get("clip_detectado")),
+    }
+
+
+def informe_lote_texto(items: list, lang: str) -> str:
+    lang = norm_lang(lang)
+    r = resumen_lote(items)
+    lines = [tr(lang, "batch.title"), "", tr(lang, "batch.summary")]
+    lines.append(f"- {tr(lang, 'batch.done')}: {r['done']} / {r['total']}")
+    if r["error"]:
+        lines.append(f"- {tr(lang, 'batch.failed')}: {r['error']}")
+    if r["pending"]:
+        lines.append(f"- {tr(lang, 'batch.pending')}: {r['pending']}")
+    lines.append(f"- {tr(lang, 'batch.duration')}: {_mm_ss(r['duration_s'])}")
+    if r["avg_quality_score"] is not None:
+        lines.append(f"- {tr(lang, 'batch.avg_score')}: {r['avg_quality_score']} / 100")
+        lines.append(
+            f"- {tr(lang, 'batch.lowest')}: {r['lowest_quality']['score']} / 100 ({r['lowest_quality']['original_filename']})"
+        )
+    if r["loudness_final_lufs"] is not None:
+        lines.append(
+            f"- {tr(lang, 'batch.loud_range')}: {r['loudness_final_lufs']['min']} / {r['loudness_final_lufs']['max']} LUFS"
+        )
+    lines.append(f"- {tr(lang, 'batch.clipping')}: {r['clipping']}")
+    lines.append("")
+
+    lines.append(tr(lang, "batch.items"))
+    for it in items:
+        nombre = it["original_filename"]
+        a = it.get("analysis") or {}
+        if it.get("status") == "done" and a:
+            partes = [f"{tr(lang, 'k.score')} {a.get('quality_score', '-')}/100"]
+            if a.get("duracion_original_s") is not None:
+                partes.append(_mm_ss(float(a["duracion_original_s"])))
+            if a.get("loudness_final_lufs") is not None:
+                partes.append(f"{a['loudness_final_lufs']} LUFS")
+            if a.get("true_peak_final_dbtp") is not None:
+                partes.append(f"{a['true_peak_final_dbtp']} dBTP")
+            if a.get("clip_detectado"):
+                partes.append("clipping")
+            lines.append(f"- {nombre}: " + " · ".join(partes))
+        elif it.get("status") == "error":
+            lines.append(f"- {nombre}: ERROR — {it.get('error') or '-'}")
+        else:
+            lines.append(f"- {nombre}: {it.get('status') or '-'}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+# =========================
+#   CACHE DE RESULTADOS (por contenido)
+# =========================
+CACHE_ENABLED = _truthy(os.getenv("CACHE_ENABLED", "1"))
+CACHE_MAX_MB = int(os.getenv("CACHE_MAX_MB", "2048"))
+# Fuera de MEDIA_DIR: el índice no se sirve por /media
+CACHE_DIR = BASE_DIR / "cache"
+
+
+def clave_cache(sha256: str, mode_code: str) -> str:
+    # Incluye DSP_VERSION: si cambia la cadena de procesamiento, las entradas viejas dejan de servir
+    # y el objetivo de loudness: cambiarlo por env cambia el audio entregado
+    loudness = f"{LOUDNESS_TARGET_LUFS:g}/{LOUDNESS_TRUE_PEAK_DBTP:g}" if normaliza_loudness() else "off"
+    version = f"{DSP_VERSION}+numpy" if backend_dsp() == "numpy" else DSP_VERSION
+    return hashlib.sha256(f"{sha256}|{mode_code}|{version}|{loudness}".encode("utf-8")).hexdigest()[:32]
+
+
+class CacheResultados:
+    """
+    Índice en disco (un JSON por entrada en CACHE_DIR) de uploads ya procesados.
+    LRU por tamaño: cuenta original + procesado de cada entrada y, al pasar max_bytes,
+    borra las menos usadas junto con sus archivos. El orden LRU sobrevive reinicios vía mtime.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, enabled: bool = True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._entradas: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._por_procesado: Dict[str, str] = {}  # processed_name -> clave
+        self._lock = threading.Lock()
+
+    def _entry_path(self, clave: str) -> Path:
+        return self.directory / f"{clave}.json"
+
+    @staticmethod
+    def _archivos(entry: Dict[str, Any]) -> list[Path]:
+        processed = PROCESSED_DIR / entry["processed_name"]
+        reports = list(REPORT_DIR.glob(f"{processed.stem}_report*.txt"))
+        formatos = [ruta_formato(processed, fmt) for fmt in FORMATOS_SALIDA]
+        return [ORIGINAL_DIR / entry["safe_name"], processed, *formatos, *rutas_picos(processed).values(), *reports]
+
+    @staticmethod
+    def _tamano(entry: Dict[str, Any]) -> int:
+        total = 0
+        processed = PROCESSED_DIR / entry["processed_name"]
+        for p in (
+            ORIGINAL_DIR / entry["safe_name"],
+            processed,
+            *(ruta_formato(processed, f) for f in FORMATOS_SALIDA),
+            *rutas_picos(processed).values(),
+        ):
+            try:
+                total += p.stat().st_size
+            except OSError:
+                pass
+        return total
+
+    def cargar(self) -> None:
+        if not self.enabled:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        with self._lock:
+            for p in files:
+                try:
+                    entry = json.loads(p.read_text(encoding="utf-8"))
+                except Exception:
+                    p.unlink(missing_ok=True)
+                    continue
+                if not (PROCESSED_DIR / entry.get("processed_name", "")).is_file():
+                    p.unlink(missing_ok=True)
+                    continue
+                entry["bytes"] = self._tamano(entry)
+                self._entradas[p.stem] = entry
+                self._por_procesado[entry["processed_name"]] = p.stem
+                self._bytes += entry["bytes"]
+            self._evictar()
+        logger.info(f"[CACHE] {len(self._entradas)} entradas, {self._bytes / 1e6:.1f} MB")
+
+    def obtener(self, clave: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entradas.get(clave)
+            if entry is not None and not (PROCESSED_DIR / entry["processed_name"]).is_file():
+                # Alguien borró los archivos por fuera: la entrada ya no sirve
+                self._quitar(clave)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.hits += 1
+        try:
+            os.utime(self._entry_path(clave))
+        except OSError:
+            pass
+        return entry
+
+    def guardar(self, clave: str, entry: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        entry = dict(entry, created_at=time.time())
+        entry["bytes"] = self._tamano(entry)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self._entry_path(clave).with_suffix(".tmp")
+        tmp.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self._entry_path(clave))
+        with self._lock:
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= anterior["bytes"]
+                self._por_procesado.pop(anterior["processed_name"], None)
+            self._entradas[clave] = entry
+            self._por_procesado[entry["processed_name"]] = clave
+            self._bytes += entry["bytes"]
+            self._evictar()
+
+    def recalcular(self, clave: str) -> None:
+        """Vuelve a medir una entrada (ej. tras codificar formatos nuevos sobre un resultado cacheado)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._entradas.get(clave)
+            if entry is None:
+                return
+            nuevo = self._tamano(entry)
+            self._bytes += nuevo - entry["bytes"]
+            entry["bytes"] = nuevo
+            self._evictar()
+
+    def _quitar(self, clave: str, borrar_archivos: bool = False) -> None:
+        entry = self._entradas.pop(clave, None)
+        if entry is None:
+            return
+        self._bytes -= entry["bytes"]
+        self._por_procesado.pop(entry["processed_name"], None)
+        self._entry_path(clave).unlink(missing_ok=True)
+        if borrar_archivos:
+            for p in self._archivos(entry):
+                p.unlink(missing_ok=True)
+                _retencion.olvidar(p)
+
+    def olvidar_procesado(self, processed_name: str) -> None:
+        """La retención borró los archivos de una entrada: sale del índice (sin tocar archivos)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            clave = self._por_procesado.get(processed_name)
+            if clave is not None:
+                self._quitar(clave)
+
+    def _evictar(self) -> None:
+        # Siempre conserva la entrada más reciente (la que se acaba de guardar/usar)
+        while self._bytes > self.max_bytes and len(self._entradas) > 1:
+            clave = next(iter(self._entradas))
+            self._quitar(clave, borrar_archivos=True)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entradas),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_cache = CacheResultados(CACHE_DIR, CACHE_MAX_MB * 1024 * 1024, enabled=CACHE_ENABLED)
+
+# =========================
+#   RETENCIÓN DE MEDIA
+# =========================
+RETENTION_ENABLED = _truthy(os.getenv("RETENTION_ENABLED", "1"))
+RETENTION_SWEEP_INTERVAL_S = float(os.getenv("RETENTION_SWEEP_INTERVAL_S", "300"))
+# Nada más nuevo que esto se borra (jobs en curso, descargas recién entregadas)
+RETENTION_GRACE_S = float(os.getenv("RETENTION_GRACE_S", "900"))
+
+
+def _cuota_dir(nombre: str, max_age_h: str) -> Tuple[float, int]:
+    """(edad máxima en s, tamaño máximo en bytes) de un directorio; 0 = sin límite."""
+    age_h = float(os.getenv(f"RETENTION_{nombre}_MAX_AGE_H", max_age_h))
+    max_mb = int(os.getenv(f"RETENTION_{nombre}_MAX_MB", "0"))
+    return age_h * 3600.0, max_mb * 1024 * 1024
+
+
+def clave_conjunto(directorio: str, nombre: str) -> str:
+    """
+    Agrupa original, procesado(s) e informes del mismo upload:
+    1700000000_ep.mp3 / 1700000000_ep_PROCESADO.wav / 1700000000_ep_PROCESADO_report_es.txt -> 1700000000_ep
+    """
+    if directorio == "original":
+        return Path(nombre).stem
+    return nombre.rsplit("_PROCESADO", 1)[0]
+
+
+class RetencionMedia:
+    """
+    Borra conjuntos de archivos (original + procesados + informes) por edad y por tamaño total
+    de cada directorio. Índice en memoria: un dict por archivo y, por directorio, un heap
+    (mtime del conjunto, clave) con invalidación perezosa, así que cada barrido solo toca los
+    conjuntos que efectivamente borra (nada de listar directorios con cientos de miles de archivos).
+    La edad de un conjunto es la de su archivo más reciente: un cache hit escribe su propio
+    informe dentro del conjunto y lo "rejuvenece".
+    """
+
+    def __init__(
+        self,
+        dirs: Dict[str, Tuple[Path, float, int]],
+        intervalo_s: float = RETENTION_SWEEP_INTERVAL_S,
+        gracia_s: float = RETENTION_GRACE_S,
+        enabled: bool = True,
+    ):
+        self.dirs = dirs
+        self.intervalo_s = intervalo_s
+        self.gracia_s = gracia_s
+        self.enabled = enabled
+
+        self._archivos: Dict[Path, Tuple[str, str, int]] = {}  # path -> (dir, clave, bytes)
+        self._conjuntos: Dict[str, Dict[str, Any]] = {}  # clave -> {"mtime", "paths"}
+        self._bytes: Dict[str, int] = {d: 0 for d in dirs}
+        self._heaps: Dict[str, list] = {d: [] for d in dirs}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.sweeps = 0
+        self.sets_deleted = 0
+        self.files_deleted = 0
+        self.orphans_deleted = 0
+        self.bytes_reclaimed: Dict[str, int] = {d: 0 for d in dirs}
+        self.last_sweep_ms = 0.0
+
+    def _dir_de(self, path: Path) -> Optional[str]:
+        for nombre, (directory, _, _) in self.dirs.items():
+            if path.parent == directory:
+                return nombre
+        return None
+
+    # ----- índice -----
+    def registrar(self, path: Path) -> None:
+        """Agrega (o actualiza) un archivo recién escrito."""
+        if not self.enabled:
+            return
+        d = self._dir_de(path)
+        if d is None:
+            return
+        try:
+            st = path.stat()
+        except OSError:
+            return
+        with self._lock:
+            self._indexar(path, d, st.st_size, st.st_mtime)
+
+    def _indexar(self, path: Path, d: str, size: int, mtime: float) -> None:
+        clave = clave_conjunto(d, path.name)
+        anterior = self._archivos.get(path)
+        if anterior is not None:
+            self._bytes[anterior[0]] -= anterior[2]
+        self._archivos[path] = (d, clave, size)
+        self._bytes[d] += size
+
+        conj = self._conjuntos.setdefault(clave, {"mtime": 0.0, "paths": set()})
+        nuevo_dir = not any(self._archivos[p][0] == d for p in conj["paths"] if p != path)
+        conj["paths"].add(path)
+        if mtime > conj["mtime"]:
+            conj["mtime"] = mtime
+            for dd in {self._archivos[p][0] for p in conj["paths"]}:
+                heapq.heappush(self._heaps[dd], (mtime, clave))
+        elif nuevo_dir:
+            heapq.heappush(self._heaps[d], (conj["mtime"], clave))
+
+    def olvidar(self, path: Path) -> None:
+        """Saca del índice un archivo que alguien más borró (ej. la cache al desalojar)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            info = self._archivos.pop(path, None)
+            if info is None:
+                return
+            d, clave, size = info
+            self._bytes[d] -= size
+            conj = self._conjuntos.get(clave)
+            if conj is not None:
+                conj["paths"].discard(path)
+                if not conj["paths"]:
+                    del self._conjuntos[clave]
+
+    def _sacar_conjunto(self, clave: str) -> list[Tuple[str, Path, int]]:
+        conj = self._conjuntos.pop(clave, None)
+        if conj is None:
+            return []
+        out = []
+        for p in conj["paths"]:
+            d, _, size = self._archivos.pop(p)
+            self._bytes[d] -= size
+            out.append((d, p, size))
+        return out
+
+    def _vigente(self, d: str, mtime: float, clave: str) -> bool:
+        conj = self._conjuntos.get(clave)
+        return (
+            conj is not None
+            and conj["mtime"] == mtime
+            and any(self._archivos[p][0] == d for p in conj["paths"])
+        )
+
+    def _compactar(self, d: str) -> None:
+        # Las entradas viejas del heap se acumulan cuando un conjunto se rejuvenece
+        heap = self._heaps[d]
+        if len(heap) > 2 * len(self._conjuntos) + 1024:
+            self._heaps[d] = [e for e in heap if self._vigente(d, e[0], e[1])]
+            heapq.heapify(self._heaps[d])
+
+    # ----- borrado -----
+    def _borrar(self, archivos: list[Tuple[str, Path, int]]) -> None:
+        for d, p, size in archivos:
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning(f"[RETENTION] No se pudo borrar {p.name}: {e}")
+                continue
+            self.files_deleted += 1
+            self.bytes_reclaimed[d] += size
+            if d == "processed" and p.suffix == ".wav":
+                _cache.olvidar_procesado(p.name)
+
+    def barrer(self, ahora: Optional[float] = None) -> int:
+        """Un barrido: borra conjuntos vencidos o que hacen pasar de cuota a su directorio."""
+        if not self.enabled:
+            return 0
+        t0 = time.perf_counter()
+        ahora = time.time() if ahora is None else ahora
+        victimas: list[Tuple[str, Path, int]] = []
+        conjuntos = 0
+        with self._lock:
+            for d, (_, max_age_s, max_bytes) in self.dirs.items():
+                self._compactar(d)
+                heap = self._heaps[d]
+                while heap:
+                    mtime, clave = heap[0]
+                    if not self._vigente(d, mtime, clave):
+                        heapq.heappop(heap)
+                        continue
+                    if mtime > ahora - self.gracia_s:
+                        break
+                    vencido = max_age_s > 0 and mtime < ahora - max_age_s
+                    excedido = max_bytes > 0 and self._bytes[d] > max_bytes
+                    if not (vencido or excedido):
+                        break
+                    heapq.heappop(heap)
+                    victimas += self._sacar_conjunto(clave)
+                    conjuntos += 1
+        # Fuera del lock: unlink + aviso a la cache (que tiene su propio lock)
+        self._borrar(victimas)
+        self.sets_deleted += conjuntos
+        self.sweeps += 1
+        self.last_sweep_ms = round((time.perf_counter() - t0) * 1000.0, 1)
+        if conjuntos:
+            logger.info(f"[RETENTION] {conjuntos} conjuntos borrados ({sum(v[2] for v in victimas) / 1e6:.1f} MB)")
+        return conjuntos
+
+    def reconciliar(self) -> None:
+        """
+        Escaneo de arranque: arma el índice y limpia huérfanos (restos .part de uploads/DSP
+        cortados, originales que nunca se procesaron, informes o formatos sin WAV procesado).
+        """
+        if not self.enabled:
+            return
+        limite = time.time() - self.gracia_s
+        huerfanos: list[Tuple[str, Path, int]] = []
+        with self._lock:
+            for d, (directory, _, _) in self.dirs.items():
+                directory.mkdir(parents=True, exist_ok=True)
+                with os.scandir(directory) as it:
+                    for e in it:
+                        if not e.is_file():
+                            continue
+                        st = e.stat()
+                        if e.name.endswith(".part"):
+                            if st.st_mtime < limite:
+                                huerfanos.append((d, Path(e.path), st.st_size))
+                            continue
+                        self._indexar(Path(e.path), d, st.st_size, st.st_mtime)
+
+            for clave in [
+                c for c, conj in self._conjuntos.items()
+                if conj["mtime"] < limite and not any(
+                    self._archivos[p][0] == "processed" and p.suffix == ".wav" for p in conj["paths"]
+                )
+            ]:
+                huerfanos += self._sacar_conjunto(clave)
+
+        self._borrar(huerfanos)
+        self.orphans_deleted += len(huerfanos)
+        logger.info(
+            f"[RETENTION] {len(self._archivos)} archivos en {len(self._conjuntos)} conjuntos; "
+            f"{len(huerfanos)} huérfanos borrados"
+        )
+
+    # ----- hilo -----
+    def start(self) -> None:
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="media-retention", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.intervalo_s):
+            try:
+                self.barrer()
+            except Exception as e:
+                logger.warning(f"[RETENTION] Barrido falló: {e}")
+
+    def close(self) -> None:
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=5.0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            dirs = {
+                d: {
+                    "bytes": self._bytes[d],
+                    "max_bytes": max_bytes,
+                    "max_age_s": max_age_s,
+                    "bytes_reclaimed": self.bytes_reclaimed[d],
+                }
+                for d, (_, max_age_s, max_bytes) in self.dirs.items()
+            }
+            return {
+                "enabled": self.enabled,
+                "files": len(self._archivos),
+                "sets": len(self._conjuntos),
+                "sweeps": self.sweeps,
+                "sets_deleted": self.sets_deleted,
+                "files_deleted": self.files_deleted,
+                "orphans_deleted": self.orphans_deleted,
+                "last_sweep_ms": self.last_sweep_ms,
+                "dirs": dirs,
+            }
+
+
+_retencion = RetencionMedia(
+    {
+        "original": (ORIGINAL_DIR, *_cuota_dir("ORIGINAL", "168")),
+        "processed": (PROCESSED_DIR, *_cuota_dir("PROCESSED", "168")),
+        "reports": (REPORT_DIR, *_cuota_dir("REPORTS", "168")),
+    },
+    enabled=RETENTION_ENABLED,
+)
+
+# =========================
+#   SUBIDAS REANUDABLES
+# =========================
+# Una sesión sin actividad por más de esto se borra (bytes recibidos incluidos)
+UPLOAD_SESSION_TTL_S = float(os.getenv("UPLOAD_SESSION_TTL_S", "86400"))
+UPLOAD_SESSION_SWEEP_S = float(os.getenv("UPLOAD_SESSION_SWEEP_S", "600"))
+# Tope de cada PATCH: lo que se pierde si la conexión se corta a mitad de un trozo
+UPLOAD_SESSION_CHUNK_MB = int(os.getenv("UPLOAD_SESSION_CHUNK_MB", "8"))
+UPLOAD_SESSION_CHUNK_BYTES = UPLOAD_SESSION_CHUNK_MB * 1024 * 1024
+# Sesiones abiertas a la vez (cada una puede reservar hasta MAX_FILE_SIZE_MB de disco)
+UPLOAD_SESSIONS_MAX = int(os.getenv("UPLOAD_SESSIONS_MAX", "200"))
+
+_ID_SUBIDA = re.compile(r"^[0-9a-f]{32}$")
+_SHA256_HEX = re.compile(r"^[0-9a-f]{64}$")
+
+
+def norm_sha256(valor: Optional[str]) -> Optional[str]:
+    if valor is None or not str(valor).strip():
+        return None
+    v = str(valor).strip().lower()
+    if not _SHA256_HEX.match(v):
+        raise HTTPException(status_code=400, detail="sha256 debe ser un hash hex de 64 caracteres.")
+    return v
+
+
+class SubidasReanudables:
+    """
+    Subidas por partes para conexiones inestables: init -> PATCH por offset -> finalize.
+    Cada sesión vive en disco: <id>.part con los bytes recibidos y <id>.json con lo declarado
+    en el init. El offset es el tamaño del .part (sobrevive a un reinicio) y un PATCH que no
+    parte justo ahí responde 409 con el offset real, así el cliente retoma sin re-subir nada.
+    Al finalizar se verifica tamaño y sha256 y el archivo pasa a ORIGINAL_DIR con un rename.
+    Un hilo borra las sesiones sin actividad hace más de ttl_s.
+    """
+
+    def __init__(self, directorio: Path, ttl_s: float, intervalo_s: float, max_sesiones: int):
+        self.directorio = directorio
+        self.ttl_s = ttl_s
+        self.intervalo_s = intervalo_s
+        self.max_sesiones = max_sesiones
+        # Un lock por sesión: dos PATCH de la misma sesión nunca escriben a la vez
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.created = 0
+        self.finalized = 0
+        self.expired = 0
+        self.hash_mismatches = 0
+
+    def _rutas(self, upload_id: str) -> Tuple[Path, Path]:
+        if not _ID_SUBIDA.match(upload_id):
+            raise HTTPException(status_code=404, detail="Subida no encontrada.")
+        return self.directorio / f"{upload_id}.part", self.directorio / f"{upload_id}.json"
+
+    def _lock_de(self, upload_id: str) -> threading.Lock:
+        # Solo para sesiones que existen: ids inventados no dejan locks colgados
+        if not self._rutas(upload_id)[1].exists():
+            raise HTTPException(status_code=404, detail="Subida no encontrada.")
+        with self._lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _olvidar(self, upload_id: str) -> None:
+        part, meta = self._rutas(upload_id)
+        part.unlink(missing_ok=True)
+        meta.unlink(missing_ok=True)
+        with self._lock:
+            self._locks.pop(upload_id, None)
+
+    def _meta(self, upload_id: str) -> Tuple[Path, Dict[str, Any]]:
+        part, meta = self._rutas(upload_id)
+        try:
+            datos = json.loads(meta.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            raise HTTPException(status_code=404, detail="Subida no encontrada.")
+        return part, datos
+
+    def _estado(self, upload_id: str, part: Path, datos: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            st = part.stat()
+            offset, actividad = st.st_size, st.st_mtime
+        except OSError:
+            offset, actividad = 0, datos["created_at"]
+        return {
+            "upload_id": upload_id,
+            "upload_url": f"/api/uploads/{upload_id}",
+            "filename": datos["filename"],
+            "size": datos["size"],
+            "offset": offset,
+            "chunk_max_bytes": UPLOAD_SESSION_CHUNK_BYTES,
+            "expires_at": actividad + self.ttl_s,
+        }
+
+    def crear(self, filename: Optional[str], size: int, sha256: Optional[str]) -> Dict[str, Any]:
+        if size <= 0:
+            raise HTTPException(status_code=400, detail="size debe ser mayor que 0.")
+        if size > MAX_FILE_SIZE_BYTES:
+            raise HTTPException(status_code=413, detail=f"Max {MAX_FILE_SIZE_MB} MB")
+        if sum(1 for _ in self.directorio.glob("*.json")) >= self.max_sesiones:
+            raise HTTPException(status_code=503, detail="Demasiadas subidas en curso, intenta de nuevo más tarde.")
+        upload_id = uuid.uuid4().hex
+        part, meta = self._rutas(upload_id)
+        datos = {
+            "filename": os.path.basename(filename or "audio") or "audio",
+            "size": int(size),
+            "sha256": sha256,
+            "created_at": time.time(),
+        }
+        part.touch()
+        meta.write_text(json.dumps(datos), encoding="utf-8")
+        self.created += 1
+        return self._estado(upload_id, part, datos)
+
+    def estado(self, upload_id: str) -> Dict[str, Any]:
+        part, datos = self._meta(upload_id)
+        return self._estado(upload_id, part, datos)
+
+    def escribir(self, upload_id: str, offset: int, datos_chunk: bytes) -> int:
+        """Agrega un trozo en offset; devuelve el offset nuevo. 409 (con el offset real) si no coincide."""
+        with self._lock_de(upload_id):
+            part, datos = self._meta(upload_id)
+            actual = part.stat().st_size if part.exists() else 0
+            if offset != actual:
+                raise HTTPException(
+                    status_code=409, detail=f"Offset {offset} no coincide (recibidos {actual} bytes).",
+                    headers={"Upload-Offset": str(actual)},
+                )
+            if actual + len(datos_chunk) > datos["size"]:
+                raise HTTPException(status_code=413, detail=f"El trozo pasa del tamaño declarado ({datos['size']} bytes).")
+            with part.open("ab") as f:
+                f.write(datos_chunk)
+            return actual + len(datos_chunk)
+
+    def finalizar(self, upload_id: str, sha256: Optional[str]) -> Tuple[Path, str, str, int, str]:
+        """
+        Verifica tamaño y hash y mueve el archivo a ORIGINAL_DIR. Devuelve lo mismo que
+        RecepcionMultipart por archivo. Si faltan bytes la sesión sigue abierta (409); si el hash no coincide
+        los datos no sirven y la sesión se descarta (422).
+        """
+        with self._lock_de(upload_id):
+            part, datos = self._meta(upload_id)
+            esperado = sha256 or datos.get("sha256")
+            if esperado is None:
+                raise HTTPException(status_code=400, detail="Falta sha256 (en el init o al finalizar).")
+            if datos.get("sha256") and sha256 and sha256 != datos["sha256"]:
+                raise HTTPException(status_code=400, detail="sha256 no coincide con el declarado en el init.")
+            recibidos = part.stat().st_size if part.exists() else 0
+            if recibidos != datos["size"]:
+                raise HTTPException(
+                    status_code=409, detail=f"Faltan bytes: recibidos {recibidos} de {datos['size']}.",
+                    headers={"Upload-Offset": str(recibidos)},
+                )
+
+            hasher = hashlib.sha256()
+            with part.open("rb") as f:
+                while chunk := f.read(UPLOAD_CHUNK_BYTES):
+                    hasher.update(chunk)
+            digest = hasher.hexdigest()
+            if digest != esperado:
+                self.hash_mismatches += 1
+                self._olvidar(upload_id)
+                raise HTTPException(status_code=422, detail="El sha256 del archivo recibido no coincide; vuelve a subirlo.")
+
+            safe_name, original_filename = _nombre_seguro(datos["filename"])
+            original_path = ORIGINAL_DIR / safe_name
+            os.replace(part, original_path)
+            self._olvidar(upload_id)
+            self.finalized += 1
+            return original_path, safe_name, original_filename, recibidos, digest
+
+    def cancelar(self, upload_id: str) -> None:
+        with self._lock_de(upload_id):
+            self._meta(upload_id)
+            self._olvidar(upload_id)
+
+    def barrer(self, ahora: Optional[float] = None) -> int:
+        """Borra las sesiones sin actividad (ni PATCH ni init) hace más de ttl_s."""
+        limite = (time.time() if ahora is None else ahora) - self.ttl_s
+        vencidas = 0
+        for meta in self.directorio.glob("*.json"):
+            upload_id = meta.stem
+            part = meta.with_suffix(".part")
+            try:
+                actividad = max(meta.stat().st_mtime, part.stat().st_mtime if part.exists() else 0.0)
+            except OSError:
+                continue
+            if actividad >= limite:
+                continue
+            try:
+                with self._lock_de(upload_id):
+                    self._olvidar(upload_id)
+            except HTTPException:
+                continue  # la finalizaron o cancelaron recién
+            vencidas += 1
+        # .part sin .json: restos de un init cortado
+        for part in self.directorio.glob("*.part"):
+            if not part.with_suffix(".json").exists():
+                try:
+                    if part.stat().st_mtime < limite:
+                        part.unlink(missing_ok=True)
+                except OSError:
+                    pass
+        if vencidas:
+            self.expired += vencidas
+            logger.info(f"[UPLOADS] {vencidas} subidas vencidas borradas")
+        return vencidas
+
+    # ----- hilo -----
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="upload-sessions", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.barrer()
+            except Exception as e:
+                logger.warning(f"[UPLOADS] Barrido falló: {e}")
+            if self._stop.wait(self.intervalo_s):
+                return
+
+    def close(self) -> None:
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=5.0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": sum(1 for _ in self.directorio.glob("*.json")),
+            "created": self.created,
+            "finalized": self.finalized,
+            "expired": self.expired,
+            "hash_mismatches": self.hash_mismatches,
+            "ttl_s": self.ttl_s,
+        }
+
+
+_subidas = SubidasReanudables(UPLOADS_DIR, UPLOAD_SESSION_TTL_S, UPLOAD_SESSION_SWEEP_S, UPLOAD_SESSIONS_MAX)
+
+
+async def _recibir_subida(
+    request: Request,
+    upload_id: str,
+    mode_raw: str,
+    lang_raw: Optional[str],
+    formats: Tuple[str, ...],
+    sha256: Optional[str],
+) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    guardado = await run_in_threadpool(_subidas.finalizar, upload_id, sha256)
+    return _nueva_solicitud(request, guardado, mode_raw, lang_raw, formats, t0)
+
+# =========================
+#   ENDPOINT IMPLEMENTATION
+# =========================
+def _escribir_chunk(f, hasher, chunk: bytes) -> None:
+    hasher.update(chunk)
+    f.write(chunk)
+
+
+def _nombre_seguro(nombre: Optional[str]) -> Tuple[str, str]:
+    """(safe_name, original_filename) para un nombre de archivo que manda el cliente."""
+    original_filename = os.path.basename(nombre or "audio").replace(" ", "_")
+    if not original_filename:
+        original_filename = "audio"
+    # Único por upload: los archivos de media se sirven con Cache-Control immutable
+    return f"{int(time.time())}_{uuid.uuid4().hex[:8]}_{original_filename}", original_filename
+
+
+class _ArchivoEntrante:
+    """Una parte de archivo del multipart mientras llega: bytes pendientes de volcar + sha256."""
+
+    def __init__(self, campo: str, filename: str, directorio: Path, limite_mb: int):
+        self.campo = campo
+        self.safe_name, self.original_filename = _nombre_seguro(filename)
+        self.path = directorio / self.safe_name
+        self.part = self.path.with_name(self.safe_name + ".part")
+        self.limite_mb = limite_mb
+        self.hasher = hashlib.sha256()
+        self.total = 0
+        self.buf = bytearray()
+        self.completo = False
+        self.f = None
+
+    def guardado(self) -> Tuple[Path, str, str, int, str]:
+        return self.path, self.safe_name, self.original_filename, self.total, self.hasher.hexdigest()
+
+
+class RecepcionMultipart:
+    """
+    Lee un body multipart/form-data desde request.stream() y escribe cada archivo (hasheándolo)
+    directo en su directorio final, sin el spool de python-multipart ni una segunda copia.
+    Corta con 413 apenas un archivo pasa su límite o el body pasa limite_total_mb, también
+    sin Content-Length (Transfer-Encoding: chunked). destino(campo, filename, campos) decide
+    dónde va cada archivo ((directorio, limite_mb), o None para descartarlo) y recibe los campos
+    de texto ya leídos, así puede validarlos antes de que llegue el audio. Todo o nada: si algo
+    falla no quedan archivos.
+    """
+
+    def __init__(
+        self,
+        request: Request,
+        destino: Callable[[str, str, Dict[str, str]], Optional[Tuple[Path, int]]],
+        limite_total_mb: int,
+    ):
+        self.request = request
+        self.destino = destino
+        self.limite_total_mb = limite_total_mb
+        self.campos: Dict[str, str] = {}
+        self.archivos: list[Tuple[str, Tuple[Path, str, str, int, str]]] = []
+        # Archivos con bytes o cierre pendientes de volcar a disco
+        self._abiertos: list[_ArchivoEntrante] = []
+        self._parte: Any = None  # _ArchivoEntrante, bytearray (campo de texto) o None (descartada)
+        self._nombre = ""
+        self._headers: Dict[bytes, bytes] = {}
+        self._header = bytearray()
+        self._valor = bytearray()
+        self._fin = False
+
+    async def recibir(self) -> Tuple[Dict[str, str], list[Tuple[str, Tuple[Path, str, str, int, str]]]]:
+        tipo, opciones = parse_options_header(self.request.headers.get("content-type", ""))
+        boundary = opciones.get(b"boundary")
+        if tipo != b"multipart/form-data" or not boundary:
+            raise HTTPException(status_code=422, detail="Se esperaba un body multipart/form-data.")
+        parser = MultipartParser(boundary, {
+            "on_part_begin": self._al_empezar_parte,
+            "on_header_field": lambda d, a, b: self._header.extend(d[a:b]),
+            "on_header_value": lambda d, a, b: self._valor.extend(d[a:b]),
+            "on_header_end": self._al_terminar_header,
+            "on_headers_finished": self._al_terminar_headers,
+            "on_part_data": self._al_recibir_datos,
+            "on_part_end": self._al_terminar_parte,
+            "on_end": self._al_terminar,
+        })
+        limite_total = self.limite_total_mb * 1024 * 1024 + MULTIPART_OVERHEAD_BYTES
+        recibidos = 0
+        try:
+            async for chunk in self.request.stream():
+                recibidos += len(chunk)
+                if recibidos > limite_total:
+                    raise HTTPException(status_code=413, detail=f"Max {self.limite_total_mb} MB")
+                try:
+                    parser.write(chunk)
+                except MultipartParseError:
+                    raise HTTPException(status_code=400, detail="Body multipart inválido.")
+                if any(a.completo or len(a.buf) >= UPLOAD_CHUNK_BYTES for a in self._abiertos):
+                    await run_in_threadpool(self._volcar)
+            if not self._fin:
+                raise HTTPException(status_code=400, detail="Body multipart incompleto.")
+            await run_in_threadpool(self._volcar)
+        except BaseException:
+            self._descartar()
+            raise
+        return self.campos, self.archivos
+
+    def _al_empezar_parte(self) -> None:
+        self._headers = {}
+        self._parte = None
+
+    def _al_terminar_header(self) -> None:
+        self._headers[bytes(self._header).lower()] = bytes(self._valor)
+        self._header.clear()
+        self._valor.clear()
+
+    def _al_terminar_headers(self) -> None:
+        _, opciones = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._nombre = opciones.get(b"name", b"").decode("utf-8", "replace")
+        filename = opciones.get(b"filename")
+        if filename is None:
+            self._parte = bytearray()
+            return
+        filename = filename.decode("utf-8", "replace")
+        destino = self.destino(self._nombre, filename, self.campos)
+        if destino is not None:
+            self._parte = _ArchivoEntrante(self._nombre, filename, *destino)
+            self._abiertos.append(self._parte)
+
+    def _al_recibir_datos(self, datos: bytes, ini: int, fin: int) -> None:
+        parte = self._parte
+        if isinstance(parte, bytearray):
+            parte.extend(datos[ini:fin])
+            if len(parte) > MULTIPART_CAMPO_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"El campo {self._nombre} es demasiado grande.")
+        elif parte is not None:
+            parte.total += fin - ini
+            if parte.total > parte.limite_mb * 1024 * 1024:
+                raise HTTPException(status_code=413, detail=f"Max {parte.limite_mb} MB")
+            parte.buf.extend(datos[ini:fin])
+
+    def _al_terminar_parte(self) -> None:
+        parte = self._parte
+        if isinstance(parte, bytearray):
+            self.campos[self._nombre] = parte.decode("utf-8", "replace")
+        elif parte is not None:
+            parte.completo = True
+        self._parte = None
+
+    def _al_terminar(self) -> None:
+        self._fin = True
+
+    def _volcar(self) -> None:
+        # Fuera del event loop; el parser no avanza mientras tanto (se espera antes del próximo chunk)
+        for archivo in list(self._abiertos):
+            if archivo.f is None:
+                archivo.f = archivo.part.open("wb")
+            if archivo.buf:
+                archivo.hasher.update(archivo.buf)
+                archivo.f.write(archivo.buf)
+                archivo.buf.clear()
+            if archivo.completo:
+                archivo.f.close()
+                os.replace(archivo.part, archivo.path)
+                self._abiertos.remove(archivo)
+                self.archivos.append((archivo.campo, archivo.guardado()))
+
+    def _descartar(self) -> None:
+        for archivo in self._abiertos:
+            if archivo.f is not None:
+                archivo.f.close()
+            archivo.part.unlink(missing_ok=True)
+        for _, guardado in self.archivos:
+            guardado[0].unlink(missing_ok=True)
+        self._abiertos.clear()
+        self.archivos.clear()
+
+
+async def _recibir_audio(
+    request: Request,
+    campos_archivo: Tuple[str, ...],
+    directorio: Optional[Path] = None,
+    validar: Optional[Callable[[Dict[str, str]], Any]] = None,
+) -> Tuple[Dict[str, str], Tuple[Path, str, str, int, str]]:
+    """
+    Un audio (el primer archivo en alguno de campos_archivo) + los campos de texto del form.
+    validar(campos) corre antes de escribir el audio: un campo inválido no cuesta el upload.
+    """
+    elegido = False
+
+    def destino(campo: str, filename: str, campos: Dict[str, str]) -> Optional[Tuple[Path, int]]:
+        nonlocal elegido
+        if elegido or campo not in campos_archivo:
+            return None
+        if validar is not None:
+            validar(campos)
+        elegido = True
+        return directorio or ORIGINAL_DIR, MAX_FILE_SIZE_MB
+
+    campos, archivos = await RecepcionMultipart(request, destino, MAX_FILE_SIZE_MB).recibir()
+    if not archivos:
+        raise HTTPException(status_code=422, detail=f"Falta archivo ({campos_archivo[0]}).")
+    return campos, archivos[0][1]
+
+
+def _campo(campos: Dict[str, str], *nombres: str, defecto: Optional[str] = None) -> Optional[str]:
+    """Primer campo presente entre nombres (los endpoints legacy aceptan alias)."""
+    for nombre in nombres:
+        if campos.get(nombre):
+            return campos[nombre]
+    return defecto
+
+
+def _cliente_info(request: Request) -> Dict[str, Optional[str]]:
+    return {
+        "ip": request.client.host if request.client else None,
+        "user_agent": request.headers.get("user-agent"),
+    }
+
+
+async def _recibir_solicitud(
+    request: Request,
+    campos_archivo: Tuple[str, ...] = ("audio_file",),
+    campos_modo: Tuple[str, ...] = ("mode",),
+    campos_lang: Tuple[str, ...] = ("lang",),
+    modo_defecto: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Recibe el upload en streaming y arma el contexto del request que viaja hasta el worker."""
+    t0 = time.perf_counter()
+    # formats llega antes que el audio: un formato inválido no debería costar el upload
+    campos, guardado = await _recibir_audio(request, campos_archivo, validar=lambda c: norm_formatos(c.get("formats")))
+    try:
+        formats = norm_formatos(campos.get("formats"))
+        mode_raw = _campo(campos, *campos_modo, defecto=modo_defecto)
+        if mode_raw is None:
+            raise HTTPException(status_code=422, detail=f"Falta el campo {campos_modo[0]}.")
+    except BaseException:
+        guardado[0].unlink(missing_ok=True)
+        raise
+    return _nueva_solicitud(request, guardado, mode_raw, _campo(campos, *campos_lang, defecto="es"), formats, t0)
+
+
+def _nueva_solicitud(
+    request: Request,
+    guardado: Tuple[Path, str, str, int, str],
+    mode_raw: str,
+    lang_raw: Optional[str],
+    formats: Tuple[str, ...],
+    t0: float,
+) -> Dict[str, Any]:
+    original_path, safe_name, original_filename, input_bytes, sha256 = guardado
+    # Registrado desde ya: si el procesamiento falla, el original igual vence por retención
+    _retencion.registrar(original_path)
+    _etags_media.sembrar(original_path, sha256)
+    mode_code = norm_modo(mode_raw)
+    return {
+        "t0": t0,
+        "lang": norm_lang(lang_raw),
+        "mode_code": mode_code,
+        "formats": formats,
+        "original_path": original_path,
+        "safe_name": safe_name,
+        "original_filename": original_filename,
+        "input_bytes": input_bytes,
+        "sha256": sha256,
+        "cache_key": clave_cache(sha256, mode_code),
+        "cliente": _cliente_info(request),
+        "profile": pedir_perfil(request),
+    }
+
+
+def _metricas_payload(
+    sol: Dict[str, Any],
+    analysis: Dict[str, Any],
+    processed_path: Path,
+    report_path: Path,
+    outputs: Dict[str, Dict[str, Any]],
+) -> Optional[Dict[str, Any]]:
+    if not db_metrics_ready():
+        return None
+    try:
+        return {
+            "id": str(uuid.uuid4()),
+            "mode": analysis.get("modo"),
+            "client_ip_hash": _anonymize_ip(sol["cliente"].get("ip")),
+            "user_agent": sol["cliente"].get("user_agent"),
+
+            "input_filename": sol["safe_name"],
+            "input_bytes": int(sol["input_bytes"]),
+            "output_bytes": int(processed_path.stat().st_size) if processed_path.exists() else None,
+            "report_bytes": int(report_path.stat().st_size) if report_path.exists() else None,
+            "output_formats": json.dumps({fmt: o["bytes"] for fmt, o in outputs.items()}),
+
+            "duration_original_s": float(analysis.get("duracion_original_s")) if analysis.get("duracion_original_s") is not None else None,
+            "duration_processed_s": float(analysis.get("duracion_procesada_s")) if analysis.get("duracion_procesada_s") is not None else None,
+
+            "processing_ms": int(round((time.perf_counter() - sol["t0"]) * 1000.0)),
+
+            "quality_score": int(analysis.get("quality_score")) if analysis.get("quality_score") is not None else None,
+            "snr_db": float(analysis.get("snr_db")) if analysis.get("snr_db") is not None else None,
+            "sala_indice": float(analysis.get("sala_indice")) if analysis.get("sala_indice") is not None else None,
+            "clip_detectado": bool(analysis.get("clip_detectado")) if analysis.get("clip_detectado") is not None else None,
+        }
+    except Exception as e:
+        logger.warning(f"[DB_METRICS] No se pudieron preparar métricas: {e}")
+        return None
+
+
+def _salidas_entrega(
+    processed_path: Path,
+    formatos: Tuple[str, ...],
+    timings_ms: Dict[str, float],
+) -> Dict[str, Dict[str, Any]]:
+    """
+    {formato: {url, bytes}} del WAV y de cada formato pedido. Lo que no salió de la pasada DSP
+    (fallback pydub, corrección de techo, cache hit de otro pedido) se codifica acá desde el WAV.
+    """
+    faltantes = tuple(fmt for fmt in formatos if not ruta_formato(processed_path, fmt).is_file())
+    if faltantes:
+        t_enc = time.perf_counter()
+        try:
+            codificar_formatos(processed_path, faltantes)
+        except Exception as e:
+            logger.warning(f"[OUTPUT] No se pudieron codificar {', '.join(faltantes)}: {e}")
+        timings_ms["encode"] = round((time.perf_counter() - t_enc) * 1000.0, 1)
+
+    outputs: Dict[str, Dict[str, Any]] = {}
+    for fmt in ("wav", *formatos):
+        path = ruta_formato(processed_path, fmt)
+        try:
+            size = path.stat().st_size
+        except OSError:
+            continue
+        outputs[fmt] = {"url": f"/media/processed/{path.name}", "bytes": int(size)}
+    return outputs
+
+
+def _armar_respuesta(
+    sol: Dict[str, Any],
+    safe_name: str,
+    processed_path: Path,
+    analysis: Dict[str, Any],
+    timings_ms: Dict[str, float],
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """Escribe el informe en el idioma pedido y arma (respuesta, payload de métricas)."""
+    lang = sol["lang"]
+    report_name = f"{processed_path.stem}_report_{lang}.txt"
+    if sol["safe_name"] != safe_name:
+        # Cache hit: informe propio (un report_url ya entregado no cambia), en el mismo conjunto
+        # que el procesado que reutiliza, así la retención lo mantiene vivo
+        report_name = f"{processed_path.stem}_report_{lang}_{uuid.uuid4().hex[:8]}.txt"
+    report_path = REPORT_DIR / report_name
+
+    t_report = time.perf_counter()
+    report_text = construir_informe_texto(safe_name, analysis, lang)
+    part = report_path.with_name(report_name + ".part")
+    part.write_text(report_text, encoding="utf-8")
+    os.replace(part, report_path)
+    timings_ms["report"] = round((time.perf_counter() - t_report) * 1000.0, 1)
+
+    outputs = _salidas_entrega(processed_path, sol["formats"], timings_ms)
+    payload = _metricas_payload(sol, analysis, processed_path, report_path, outputs)
+    for p in (ORIGINAL_DIR / safe_name, report_path, *(ruta_formato(processed_path, fmt) for fmt in outputs)):
+        _retencion.registrar(p)
+
+    # El sha256 del upload ya se conoce: la URL del original lleva su versión y se cachea inmutable
+    original_url = f"/media/original/{safe_name}?v={sol['sha256'][:32]}"
+    processed_url = f"/media/processed/{processed_path.name}"
+    report_url = f"/media/reports/{report_name}"
+
+    analysis_html = analysis_to_html(analysis, lang)
+
+    extra: Dict[str, Any] = {}
+    peaks = {k: p for k, p in rutas_picos(processed_path).items() if p.is_file()}
+    if peaks:
+        extra["peaks"] = {k: f"/media/processed/{p.name}" for k, p in peaks.items()}
+        for p in peaks.values():
+            _retencion.registrar(p)
+
+    perfil = analysis.get("profile")
+    if perfil:
+        extra["profile"] = {
+            "url": f"/media/reports/{perfil['prof_name']}",
+            "summary_url": f"/media/reports/{perfil['summary_name']}",
+            "wall_ms": perfil["wall_ms"],
+            "tracemalloc_peak_mb": perfil["tracemalloc_peak_mb"],
+        }
+        for nombre in (perfil["prof_name"], perfil["summary_name"]):
+            _retencion.registrar(REPORT_DIR / nombre)
+
+    return {
+        # Legacy (tu app.js)
+        "original_audio_url": original_url,
+        "processed_audio_url": processed_url,
+        "report_url": report_url,
+        "analysis_html": analysis_html,
+
+        # Extra
+        "original_url": original_url,
+        "processed_url": processed_url,
+        "original_filename": sol["original_filename"],
+        "outputs": outputs,
+        "analysis": analysis,
+        "lang": lang,
+        "timings_ms": timings_ms,
+        **extra,
+    }, payload
+
+
+def _respuesta_desde_cache(sol: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+    """Si el mismo contenido+modo ya se procesó, re-renderiza informe/HTML y evita todo el DSP."""
+    t_lookup = time.perf_counter()
+    entry = _cache.obtener(sol["cache_key"])
+    if entry is None:
+        return None
+
+    # El upload recién guardado es un duplicado byte a byte del original cacheado
+    if sol["original_path"].name != entry["safe_name"]:
+        sol["original_path"].unlink(missing_ok=True)
+        _retencion.olvidar(sol["original_path"])
+
+    analysis = dict(entry["analysis"])
+    timings_ms = {"cache_lookup": round((time.perf_counter() - t_lookup) * 1000.0, 1)}
+    analysis["timings_ms"] = dict(timings_ms)
+    result, payload = _armar_respuesta(
+        sol, entry["safe_name"], PROCESSED_DIR / entry["processed_name"], analysis, timings_ms
+    )
+    if "encode" in timings_ms:
+        _cache.recalcular(sol["cache_key"])
+    observar_procesamiento(sol, analysis, timings_ms, "cache")
+    result["cache_hit"] = True
+    return result, payload
+
+
+def _ejecutar_procesamiento(
+    sol: Dict[str, Any],
+    progreso: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """
+    Parte síncrona (CPU) de un request: procesa, escribe el informe y arma la respuesta.
+    Corre en el pool de workers, nunca en el event loop. Devuelve (respuesta, payload de métricas).
+    """
+    safe_name = sol["safe_name"]
+    # Espera turno (y memoria) acá, en el hilo del job; puede vencer con 503
+    _admision.adquirir(sol["costo_mb"], sol["admitido_en"], sol.get("espera_max_s"))
+    _m_etapa_s.observar(time.monotonic() - sol["admitido_en"], "queue_wait")
+    if progreso is not None:
+        progreso({"stage": "queued", "state": "end", "percent": 0})
+    t_run = time.monotonic()
+    try:
+        processed_path, analysis = ejecutar_core(
+            sol["original_path"], sol["mode_code"], progreso=progreso, formatos=sol["formats"],
+            info=sol.get("probe"), perfil=sol["profile"],
+        )
+    except TimeoutError:
+        logger.error(f"[EXEC] Timeout procesando {safe_name} (> {TASK_TIMEOUT_S:.0f}s)")
+        _m_resultado.inc("error_504")
+        raise HTTPException(status_code=504, detail="El procesamiento tardó demasiado. Prueba con un audio más corto.")
+    except WorkerCaidoError as e:
+        logger.error(f"[EXEC] {e}")
+        _m_resultado.inc("error_500")
+        raise HTTPException(status_code=500, detail="Falló el worker de procesamiento. Intenta nuevamente.")
+    except Exception as e:
+        logger.exception(f"Error procesando audio: {e}")
+        _m_resultado.inc("error_400")
+        raise HTTPException(status_code=400, detail="No se pudo procesar el audio (formato no soportado o falta ffmpeg).")
+    finally:
+        _admision.liberar(sol["costo_mb"], time.monotonic() - t_run)
+
+    timings_ms = dict(analysis.get("timings_ms") or {})
+    if progreso is not None:
+        progreso({"stage": "report", "state": "start", "percent": PROGRESO_ETAPAS["export"]})
+    result, payload = _armar_respuesta(sol, safe_name, processed_path, analysis, timings_ms)
+    if progreso is not None:
+        progreso({"stage": "report", "state": "end", "percent": 100, "stage_ms": timings_ms.get("report")})
+
+    observar_procesamiento(sol, analysis, timings_ms, "processed")
+    _cache.guardar(sol["cache_key"], {
+        "safe_name": safe_name,
+        "processed_name": processed_path.name,
+        "analysis": {k: v for k, v in analysis.items() if k not in ("timings_ms", "profile")},
+    })
+    result["cache_hit"] = False
+    return result, payload
+
+
+async def _preparar_solicitud(
+    recibir: Callable[[], Awaitable[Dict[str, Any]]],
+) -> Tuple[Dict[str, Any], Optional[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]]:
+    """
+    Reserva lugar en la admisión (503 si está lleno), recibe el audio (upload multipart o subida
+    reanudable) y resuelve la cache. Devuelve (sol, hit); sin hit, sol ya trae el costo estimado
+    y queda en la cola de admisión.
+    """
+    _admision.reservar()
+    try:
+        sol = await recibir()
+        # Fuera del event loop: un hit puede tener que codificar formatos que no estaban.
+        # Un request perfilado siempre procesa (si no, no habría nada que perfilar)
+        hit = None if sol["profile"] else await run_in_threadpool(_respuesta_desde_cache, sol)
+        if hit is None:
+            await _admitir(sol)
+        else:
+            _admision.cancelar()
+    except BaseException:
+        _admision.cancelar()
+        raise
+    return sol, hit
+
+
+async def _analizar_impl(request: Request) -> JSONResponse:
+    """Análisis sin procesar: el upload va a un temporal que se borra al terminar (no queda media)."""
+    t0 = time.perf_counter()
+    campos, guardado = await _recibir_audio(request, ("audio_file",), Path(tempfile.gettempdir()))
+    path, _, original_filename, input_bytes, _ = guardado
+    lang = norm_lang(campos.get("lang"))
+    mode_code = norm_modo(campos.get("mode"))
+    try:
+        # Fuera del event loop, pero sin pasar por la admisión ni el pool de jobs: es barato
+        info = await run_in_threadpool(inspeccionar_entrada, path)
+        analysis = await run_in_threadpool(analizar_archivo, path, mode_code, info)
+    except HTTPException as e:
+        _m_resultado.inc(f"error_{e.status_code}")
+        raise
+    except Exception as e:
+        logger.exception(f"Error analizando audio: {e}")
+        _m_resultado.inc("error_400")
+        raise HTTPException(status_code=400, detail="No se pudo analizar el audio (formato no soportado o falta ffmpeg).")
+    finally:
+        path.unlink(missing_ok=True)
+
+    timings_ms = analysis.pop("timings_ms")
+    observar_procesamiento({"t0": t0, "input_bytes": input_bytes}, analysis, timings_ms, "analyze")
+    return JSONResponse({
+        "original_filename": original_filename,
+        "analysis": analysis,
+        "analysis_html": analysis_to_html(analysis, lang),
+        "lang": lang,
+        "timings_ms": timings_ms,
+    })
+
+
+async def _process_impl(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    recibir: Callable[[], Awaitable[Dict[str, Any]]],
+) -> JSONResponse:
+    """Camino síncrono (legacy): espera el resultado, pero el trabajo corre en el pool de jobs."""
+    sol, hit = await _preparar_solicitud(recibir)
+    if hit is not None:
+        result, payload = hit
+    else:
+        fut = _job_executor.submit(_ejecutar_procesamiento, sol)
+        result, payload = await asyncio.wrap_future(fut)
+
+    if payload is not None:
+        background_tasks.add_task(record_metrics, payload)
+
+    return JSONResponse(result)
+
+# =========================
+#   BACKEND DE EJECUCIÓN (hilos / procesos)
+# =========================
+# "thread": procesar_audio_core corre en el hilo del job (comparte el GIL).
+# "process": corre en un pool de procesos; las tareas reciben paths, no AudioSegments.
+EXEC_BACKEND = os.getenv("EXEC_BACKEND", "thread").strip().lower()
+PROCESS_WORKERS = max(1, int(os.getenv("PROCESS_WORKERS", str(os.cpu_count() or 2))))
+# Cuenta desde que un worker empieza la tarea: la espera en la cola del pool no entra
+TASK_TIMEOUT_S = float(os.getenv("TASK_TIMEOUT_S", "600"))
+# 0 = sin límite; >0 recicla cada worker tras N tareas (acota fugas de memoria)
+PROCESS_MAX_TASKS_PER_CHILD = int(os.getenv("PROCESS_MAX_TASKS_PER_CHILD", "0"))
+
+
+class WorkerCaidoError(RuntimeError):
+    pass
+
+
+class PoolProcesos:
+    """
+    ProcessPoolExecutor que se recicla solo: si un worker muere (OOM, segfault en un decoder)
+    o una tarea excede el timeout, se terminan sus procesos y se crea un pool nuevo, en vez de
+    dejar un BrokenProcessPool que tumbe todos los requests siguientes.
+    """
+
+    def __init__(self, workers: int, timeout_s: float, max_tasks_per_child: int = 0):
+        self.workers = workers
+        self.timeout_s = timeout_s
+        self.max_tasks_per_child = max_tasks_per_child
+        self.reciclajes = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _obtener(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                kwargs: Dict[str, Any] = {
+                    "max_workers": self.workers,
+                    # spawn: los workers no heredan hilos/locks del servidor
+                    "mp_context": multiprocessing.get_context("spawn"),
+                }
+                if self.max_tasks_per_child > 0:
+                    kwargs["max_tasks_per_child"] = self.max_tasks_per_child
+                self._pool = ProcessPoolExecutor(**kwargs)
+            return self._pool
+
+    def _reciclar(self, pool: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._pool is not pool:
+                return  # otro hilo ya lo recicló
+            self._pool = None
+            self.reciclajes += 1
+        for p in list((getattr(pool, "_processes", None) or {}).values()):
+            try:
+                p.terminate()
+            except Exception:
+                pass
+        pool.shutdown(wait=False, cancel_futures=True)
+        logger.warning("[EXEC] Pool de procesos reciclado.")
+
+    def ejecutar(self, fn, *args: Any) -> Any:
+        return self.mapear(fn, [args])[0]
+
+    def mapear(self, fn, tareas: list) -> list:
+        """
+        Reparte las tareas en el pool; los resultados vuelven en orden. El timeout de cada tarea
+        corre desde que un worker la empieza (no cuenta la espera en la cola ni el arranque del worker).
+        """
+        # Un reintento: si el pool se rompió o se recicló por culpa de otra tarea, estas no deberían fallar.
+        for intento in range(2):
+            pool = self._obtener()
+            inicios = [_InicioTarea() for _ in tareas]
+            futuros = []
+            try:
+                for args, inicio in zip(tareas, inicios):
+                    _canal_progreso.registrar(inicio.token, inicio)
+                    futuros.append(pool.submit(_tarea_con_inicio, _canal_progreso.cola(), inicio.token, fn, *args))
+                return [self._resultado(f, inicio) for f, inicio in zip(futuros, inicios)]
+            except FuturesTimeoutError:
+                self._reciclar(pool)
+                raise TimeoutError(f"La tarea excedió {self.timeout_s:.0f}s")
+            except (BrokenProcessPool, CancelledError) as e:
+                # CancelledError: otra tarea venció y _reciclar canceló lo que esperaba en este pool
+                self._reciclar(pool)
+                if intento == 1:
+                    raise WorkerCaidoError(f"Worker de procesamiento caído: {e!r}") from e
+            finally:
+                for f in futuros:
+                    f.cancel()
+                for inicio in inicios:
+                    _canal_progreso.quitar(inicio.token)
+        raise WorkerCaidoError("Worker de procesamiento caído")
+
+    def _resultado(self, fut, inicio: "_InicioTarea") -> Any:
+        # Sin límite mientras la tarea no arranque (cola del pool, spawn + import del worker)
+        while not inicio.evento.wait(0.25):
+            if fut.done():
+                return fut.result()
+        return fut.result(timeout=max(0.0, self.timeout_s - (time.monotonic() - inicio.t0)))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+_pool_procesos = PoolProcesos(PROCESS_WORKERS, TASK_TIMEOUT_S, PROCESS_MAX_TASKS_PER_CHILD)
+
+
+class _InicioTarea:
+    """Callback del canal de progreso que marca cuándo un worker empezó la tarea."""
+
+    def __init__(self) -> None:
+        self.token = uuid.uuid4().hex
+        self.evento = threading.Event()
+        self.t0 = 0.0
+
+    def __call__(self, ev: Dict[str, Any]) -> None:
+        self.t0 = time.monotonic()
+        self.evento.set()
+
+
+def _tarea_con_inicio(cola, token: str, fn, *args: Any) -> Any:
+    """En el worker: avisa al proceso padre que la tarea arrancó y la corre."""
+    cola.put((token, {"stage": "task", "state": "start"}))
+    return fn(*args)
+
+
+class CanalProgreso:
+    """
+    Lleva los eventos de progreso desde los workers de proceso al servidor: una cola de un
+    multiprocessing.Manager (picklable) y un hilo que los reparte al callback registrado.
+    También trae el aviso de arranque de cada tarea (PoolProcesos cuenta el timeout desde ahí).
+    Se crea con la primera tarea que corre en un pool de procesos.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._manager = None
+        self._cola = None
+        self._callbacks: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+
+    def cola(self):
+        with self._lock:
+            if self._cola is None:
+                self._manager = multiprocessing.get_context("spawn").Manager()
+                self._cola = self._manager.Queue()
+                threading.Thread(target=self._repartir, args=(self._cola,), name="progreso", daemon=True).start()
+            return self._cola
+
+    def _repartir(self, cola) -> None:
+        while True:
+            try:
+                item = cola.get()
+            except (EOFError, OSError):
+                return  # manager cerrado
+            if item is None:
+                return
+            token, ev = item
+            with self._lock:
+                cb = self._callbacks.get(token)
+            if cb is not None:
+                try:
+                    cb(ev)
+                except Exception as e:
+                    logger.debug(f"[PROGRESO] Callback falló: {e}")
+
+    def registrar(self, token: str, cb: Callable[[Dict[str, Any]], None]) -> None:
+        with self._lock:
+            self._callbacks[token] = cb
+
+    def quitar(self, token: str) -> None:
+        with self._lock:
+            self._callbacks.pop(token, None)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            manager, cola = self._manager, self._cola
+            self._manager = self._cola = None
+        if cola is not None:
+            try:
+                cola.put(None)
+            except Exception:
+                pass
+        if manager is not None:
+            manager.shutdown()
+
+
+_canal_progreso = CanalProgreso()
+
+
+def _core_en_worker(
+    original_path: Path,
+    mode_code: str,
+    formatos: Tuple[str, ...] = (),
+    info: Optional[Dict[str, Any]] = None,
+    cola=None,
+    token: Optional[str] = None,
+    perfil: bool = False,
+):
+    """Punto de entrada en el worker de proceso: reenvía el progreso por la cola del manager."""
+    progreso = None
+    if cola is not None:
+        def progreso(ev: Dict[str, Any]) -> None:
+            cola.put((token, ev))
+    # El profiling corre acá, dentro del worker: en el proceso padre no habría nada que medir
+    core = procesar_audio_core_perfilado if perfil else procesar_audio_core
+    return core(original_path, mode_code, progreso=progreso, formatos=formatos, info=info)
+
+
+def ejecutar_core(
+    original_path: Path,
+    mode_code: str,
+    progreso: Optional[Callable[[Dict[str, Any]], None]] = None,
+    formatos: Tuple[str, ...] = (),
+    info: Optional[Dict[str, Any]] = None,
+    perfil: bool = False,
+) -> Tuple[Path, Dict[str, Any]]:
+    if EXEC_BACKEND != "process":
+        core = procesar_audio_core_perfilado if perfil else procesar_audio_core
+        return core(original_path, mode_code, progreso=progreso, formatos=formatos, info=info)
+    if progreso is None:
+        return _pool_procesos.ejecutar(_core_en_worker, original_path, mode_code, formatos, info, None, None, perfil)
+
+    token = uuid.uuid4().hex
+    _canal_progreso.registrar(token, progreso)
+    try:
+        return _pool_procesos.ejecutar(
+            _core_en_worker, original_path, mode_code, formatos, info, _canal_progreso.cola(), token, perfil
+        )
+    finally:
+        _canal_progreso.quitar(token)
+
+# =========================
+#   DSP POR SEGMENTOS (un episodio en varios núcleos)
+# =========================
+# El audio recortado se parte en N segmentos que corren la cadena DSP a la vez (NumPy en el pool
+# de segmentos, ffmpeg en N procesos ffmpeg). Cada segmento arranca DSP_SEGMENT_PREROLL_S antes de
+# su tramo: el pasaaltos, la envolvente del compresor y el release de los limitadores olvidan su
+# estado inicial en mucho menos que eso, así que al llegar al tramo llevan el mismo estado que la
+# pasada serial. Las uniones se mezclan con un crossfade lineal de DSP_SEGMENT_CROSSFADE_MS.
+# 0 o 1 = apagado. Solo aplica al camino en memoria (el streaming ya procesa por bloques).
+DSP_PARALLEL_WORKERS = max(0, int(os.getenv("DSP_PARALLEL_WORKERS", "0")))
+DSP_PARALLEL_MIN_S = float(os.getenv("DSP_PARALLEL_MIN_S", "120"))
+DSP_SEGMENT_PREROLL_S = float(os.getenv("DSP_SEGMENT_PREROLL_S", "2"))
+DSP_SEGMENT_CROSSFADE_MS = float(os.getenv("DSP_SEGMENT_CROSSFADE_MS", "50"))
+# Tramo mínimo por segmento: por debajo, el pre-roll y el reparto no se amortizan
+SEGMENTO_MIN_S = 30.0
+# Cola extra de cada segmento: lookahead de los limitadores (y latencia de alimiter)
+SEGMENTO_MARGEN_S = 0.1
+
+_pool_segmentos = PoolProcesos(max(1, DSP_PARALLEL_WORKERS), TASK_TIMEOUT_S)
+
+
+def segmentos_dsp(audio: AudioSegment) -> int:
+    """Cuántos segmentos usar para este audio (0 = cadena serial)."""
+    if np is None or DSP_PARALLEL_WORKERS < 2:
+        return 0
+    dur_s = len(audio) / 1000.0
+    if dur_s < DSP_PARALLEL_MIN_S:
+        return 0
+    n = min(DSP_PARALLEL_WORKERS, int(dur_s // SEGMENTO_MIN_S))
+    return n if n >= 2 else 0
+
+
+def cortes_segmentos(total: int, n: int, frame_rate: int) -> list[Tuple[int, int, int, int, int]]:
+    """
+    (a, s, e, fin, b) por segmento, en frames: [s, e) es su tramo, [a, b) lo que procesa
+    (pre-roll antes; crossfade + margen después) y [e, fin) la cola que se mezcla con el siguiente.
+    """
+    preroll = int(round(DSP_SEGMENT_PREROLL_S * frame_rate))
+    cruce = int(round(DSP_SEGMENT_CROSSFADE_MS * frame_rate / 1000.0))
+    margen = int(round(SEGMENTO_MARGEN_S * frame_rate))
+    limites = [total * k // n for k in range(n + 1)]
+    cortes = []
+    for k in range(n):
+        s, e = limites[k], limites[k + 1]
+        fin = total if k == n - 1 else min(total, e + cruce)
+        cortes.append((max(0, s - preroll), s, e, fin, min(total, fin + margen)))
+    return cortes
+
+
+def unir_segmentos(partes: list, cortes: list, channels: int):
+    """Pega los tramos s16 (frames x canales); cada cola [e, fin) se funde con el inicio del siguiente."""
+    salida = np.empty((cortes[-1][3], channels), dtype="<i2")
+    cola = None
+    for (a, s, e, fin, b), parte in zip(cortes, partes):
+        salida[s:fin] = parte
+        if cola is not None and len(cola):
+            r = ((np.arange(len(cola)) + 0.5) / len(cola))[:, None]
+            salida[s:s + len(cola)] = np.rint(cola * (1.0 - r) + parte[: len(cola)] * r)
+        cola = parte[e - s:]
+    return salida
+
+
+def _dsp_numpy_segmento(
+    pcm_path: Path,
+    sample_width: int,
+    frame_rate: int,
+    channels: int,
+    corte: Tuple[int, int, int, int, int],
+    fade_ms: int,
+    ceiling_dbfs: float,
+):
+    """En el worker: CadenaDspNumpy sobre [a, b) del PCM crudo; devuelve el s16 de [s, fin)."""
+    a, s, e, fin, b = corte
+    ancho = sample_width * channels
+    with open(pcm_path, "rb") as f:
+        f.seek(a * ancho)
+        datos = f.read((b - a) * ancho)
+    buf = pcm_a_float32(AudioSegment(data=datos, sample_width=sample_width, frame_rate=frame_rate, channels=channels))
+    del datos
+    cadena = CadenaDspNumpy(frame_rate, channels, ceiling_dbfs)
+    cadena.pasaaltos(buf)
+    cadena.comprimir(buf)
+    cadena.fade_out(buf, fade_ms)
+    cadena.limitar_techo(buf)
+    return float32_a_s16(buf[:, s - a:fin - a])
+
+
+def dsp_numpy_segmentado(audio: AudioSegment, n: int, fade_ms: int, ceiling_dbfs: float) -> AudioSegment:
+    cortes = cortes_segmentos(int(audio.frame_count()), n, audio.frame_rate)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Los workers reciben un path (como el resto de las tareas de proceso) y leen solo su tramo
+        pcm_path = Path(tmpdir) / "entrada.pcm"
+        pcm_path.write_bytes(audio.raw_data)
+        tareas = [
+            (pcm_path, audio.sample_width, audio.frame_rate, audio.channels, corte,
+             fade_ms if k == n - 1 else 0, ceiling_dbfs)
+            for k, corte in enumerate(cortes)
+        ]
+        partes = _pool_segmentos.mapear(_dsp_numpy_segmento, tareas)
+    pcm = unir_segmentos(partes, cortes, audio.channels)
+    return AudioSegment(data=pcm.tobytes(), sample_width=2, frame_rate=audio.frame_rate, channels=audio.channels)
+
 
-    # ✅ Resumen rápido: 4 líneas máximo
-    lines.append(tr(lang, "report.quick"))
-    lines.append(f"- {score_line}")
-    lines.append(f"- {peak_line}")
-    lines.append(f"- Tip #1: {main_hint_1}")
-    lines.append(f"- Tip #2: {main_hint_2}")
-    lines.append("")
+def _ffmpeg_dsp_segmento(audio: AudioSegment, corte: Tuple[int, int, int, int, int], fade_ms: int, ceiling_dbfs: float):
+    """filtergraph_dsp sobre [a, b) (por stdin, sin copiar el tramo); devuelve el s16 de [s, fin)."""
+    a, s, e, fin, b = corte
+    ancho = audio.frame_width
+    cmd = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", _FFMPEG_PCM_FMT[audio.sample_width], "-ar", str(audio.frame_rate), "-ac", str(audio.channels),
+        "-i", "pipe:0",
+        "-af", filtergraph_dsp((b - a) / audio.frame_rate, fade_ms, ceiling_dbfs),
+        "-c:a", "pcm_s16le", "-f", "s16le", "pipe:1",
+    ]
+    try:
+        proc = subprocess.run(cmd, input=memoryview(audio.raw_data)[a * ancho:b * ancho], capture_output=True, check=True)
+    except subprocess.CalledProcessError as e:
+        err = (e.stderr or b"").decode("utf-8", "replace").strip()
+        raise RuntimeError(f"ffmpeg falló ({e.returncode}): {err[-500:]}") from e
+    y = np.frombuffer(proc.stdout, dtype="<i2").reshape(-1, audio.channels)[s - a:fin - a]
+    if len(y) != fin - s:
+        raise RuntimeError(f"ffmpeg devolvió {len(y)} frames para un tramo de {fin - s}")
+    return y
+
+
+def ffmpeg_dsp_segmentado(audio: AudioSegment, n: int, fade_ms: int, ceiling_dbfs: float) -> AudioSegment:
+    """Un ffmpeg por segmento (cada uno es su propio proceso: los hilos solo esperan la salida)."""
+    if audio.sample_width not in _FFMPEG_PCM_FMT:
+        raise ValueError(f"sample_width no soportado para pipe: {audio.sample_width}")
+    cortes = cortes_segmentos(int(audio.frame_count()), n, audio.frame_rate)
+    with ThreadPoolExecutor(max_workers=n, thread_name_prefix="dsp-seg") as ex:
+        futuros = [
+            ex.submit(_ffmpeg_dsp_segmento, audio, corte, fade_ms if k == n - 1 else 0, ceiling_dbfs)
+            for k, corte in enumerate(cortes)
+        ]
+        partes = [f.result() for f in futuros]
+    pcm = unir_segmentos(partes, cortes, audio.channels)
+    return AudioSegment(data=pcm.tobytes(), sample_width=2, frame_rate=audio.frame_rate, channels=audio.channels)
 
-    # ✅ Sección educativa (valor real sin llenar el resumen)
-    lines.append(edu_title)
-    for tip in edu:
-        lines.append(f"- {tip}")
-    lines.append("")
+# =========================
+#   JOBS (procesamiento asíncrono)
+# =========================
+# Con backend de procesos los hilos solo esperan: conviene uno por worker de proceso
+JOB_WORKERS = max(1, int(os.getenv("JOB_WORKERS", str(PROCESS_WORKERS if EXEC_BACKEND == "process" else 2))))
+# Jobs en cola + en curso admitidos antes de responder 503
+JOB_QUEUE_MAX = max(1, int(os.getenv("JOB_QUEUE_MAX", "20")))
+# Jobs terminados se olvidan tras este tiempo
+JOB_TTL_S = int(os.getenv("JOB_TTL_S", "3600"))
 
-    # Resumen general (puede quedar, pero sin sobrecargar arriba)
-    lines.append(tr(lang, "report.summary"))
-    if lang == "en":
-        lines.append(
-            f"We processed your audio in {modo} mode. "
-            f"Environment estimate: {ambiente}. "
-            f"Estimated background: {a['ruido_estimado_dbfs']} dBFS (confidence: {ruido_conf})."
+_job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+_JOBS: Dict[str, Dict[str, Any]] = {}
+_JOBS_LOCK = threading.Lock()
+
+# =========================
+#   ADMISIÓN (backpressure)
+# =========================
+# Jobs procesando a la vez y memoria estimada que pueden sumar entre todos
+ADMISSION_MAX_CONCURRENT = max(1, int(os.getenv("ADMISSION_MAX_CONCURRENT", str(JOB_WORKERS))))
+ADMISSION_MEMORY_MB = float(os.getenv("ADMISSION_MEMORY_MB", "1024"))
+# Tiempo máximo que un job admitido espera turno antes de fallar con 503
+ADMISSION_MAX_WAIT_S = float(os.getenv("ADMISSION_MAX_WAIT_S", "120"))
+# Sin duración (ffprobe), un formato con pérdida se estima como ~10x su tamaño en PCM
+ADMISSION_LOSSY_EXPANSION = float(os.getenv("ADMISSION_LOSSY_EXPANSION", "10"))
+# Copias del PCM vivas a la vez en el camino en memoria (decodificado, recortado, procesado, stdout)
+ADMISSION_PIPELINE_FACTOR = float(os.getenv("ADMISSION_PIPELINE_FACTOR", "4"))
+
+
+def estimar_costo_mb(input_bytes: int, ext: str, info: Optional[Dict[str, Any]]) -> float:
+    """Memoria pico estimada de un job (MB) según tamaño, formato y duración del input."""
+    if info and info.get("duration_s") and info.get("sample_rate") and info.get("channels"):
+        pcm_bytes = info["duration_s"] * info["sample_rate"] * info["channels"] * 2
+        streaming = PROCESSING_MODE != "memory" and np is not None and (
+            PROCESSING_MODE == "streaming" or info["duration_s"] >= STREAMING_MIN_DURATION_S
         )
+        if streaming:
+            # Por bloques: un par de bloques PCM por proceso, no importa cuánto dure el episodio
+            pcm_bytes = min(pcm_bytes, STREAM_BLOCK_S * info["sample_rate"] * info["channels"] * 2)
+    elif ext in LOSSY_EXTS:
+        pcm_bytes = input_bytes * ADMISSION_LOSSY_EXPANSION
     else:
-        lines.append(
-            f"Procesamos tu audio en modo {modo}. "
-            f"Estimación de ambiente: {ambiente}. "
-            f"Fondo estimado: {a['ruido_estimado_dbfs']} dBFS (confiabilidad: {ruido_conf})."
+        pcm_bytes = input_bytes
+    return round(pcm_bytes * ADMISSION_PIPELINE_FACTOR / (1024 * 1024), 1)
+
+
+class ControlAdmision:
+    """
+    Backpressure en dos pasos:
+    - reservar(): en el request, antes de aceptar el trabajo. Si ya hay max_pendientes jobs
+      (en cola + corriendo) responde 503 con Retry-After al toque.
+    - adquirir(): en el hilo del job. Espera (FIFO) hasta que haya un lugar de concurrencia y
+      memoria estimada libre; un job más grande que toda la capacidad corre solo.
+    Retry-After sale del promedio móvil de duración de los jobs.
+    """
+
+    def __init__(self, max_concurrentes: int, capacidad_mb: float, max_pendientes: int, espera_max_s: float):
+        self.max_concurrentes = max_concurrentes
+        self.capacidad_mb = capacidad_mb
+        self.max_pendientes = max_pendientes
+        self.espera_max_s = espera_max_s
+
+        self._cond = threading.Condition()
+        self._turnos: deque = deque()
+        self.en_cola = 0
+        self.corriendo = 0
+        self.en_uso_mb = 0.0
+        self._duracion_media_s = 30.0
+
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+
+    def retry_after_s(self) -> int:
+        with self._cond:
+            delante = self.en_cola + self.corriendo
+            return max(1, math.ceil(delante * self._duracion_media_s / self.max_concurrentes))
+
+    def _ocupado(self, detalle: str) -> HTTPException:
+        return HTTPException(
+            status_code=503,
+            detail=detalle,
+            headers={"Retry-After": str(self.retry_after_s())},
         )
-    lines.append("")
 
-    lines.append(tr(lang, "report.trim_note"))
-    lines.append("")
+    def rechazo_rapido(self) -> Optional[int]:
+        """Chequeo barato previo al upload: Retry-After si ya está lleno, None si hay lugar."""
+        with self._cond:
+            if self.en_cola + self.corriendo < self.max_pendientes:
+                return None
+            self.rejected_full += 1
+        return self.retry_after_s()
+
+    def reservar(self) -> None:
+        with self._cond:
+            if self.en_cola + self.corriendo >= self.max_pendientes:
+                self.rejected_full += 1
+                lleno = True
+            else:
+                self.en_cola += 1
+                lleno = False
+        if lleno:
+            raise self._ocupado("Servidor ocupado, intenta de nuevo en unos segundos.")
+
+    def encolar(self) -> None:
+        """Reserva sin tope para un ítem de lote: ya esperaba en su propio pool (BATCH_WORKERS)."""
+        with self._cond:
+            self.en_cola += 1
+
+    def cancelar(self) -> None:
+        """Devuelve una reserva que no llegó a encolarse (error en el upload, cache hit)."""
+        with self._cond:
+            self.en_cola -= 1
+            self._cond.notify_all()
+
+    def _entra(self, costo_mb: float) -> bool:
+        if self.corriendo >= self.max_concurrentes:
+            return False
+        return self.corriendo == 0 or self.en_uso_mb + costo_mb <= self.capacidad_mb
+
+    def adquirir(self, costo_mb: float, admitido_en: float, espera_max_s: Optional[float] = None) -> None:
+        turno = object()
+        espera_max_s = self.espera_max_s if espera_max_s is None else espera_max_s
+        deadline = admitido_en + espera_max_s
+        with self._cond:
+            self._turnos.append(turno)
+            try:
+                while not (self._turnos[0] is turno and self._entra(costo_mb)):
+                    restante = deadline - time.monotonic()
+                    if restante <= 0:
+                        self.en_cola -= 1
+                        self.rejected_timeout += 1
+                        break
+                    self._cond.wait(timeout=restante)
+                else:
+                    self.en_cola -= 1
+                    self.corriendo += 1
+                    self.en_uso_mb += costo_mb
+                    self.admitted += 1
+                    return
+            finally:
+                self._turnos.remove(turno)
+                self._cond.notify_all()
+        logger.warning(f"[ADMISSION] Job de {costo_mb:.0f} MB venció esperando turno ({espera_max_s:g}s)")
+        raise self._ocupado("Servidor ocupado, el audio no alcanzó a procesarse. Intenta de nuevo.")
+
+    def liberar(self, costo_mb: float, duracion_s: float) -> None:
+        with self._cond:
+            self.corriendo -= 1
+            self.en_uso_mb = max(0.0, self.en_uso_mb - costo_mb)
+            self._duracion_media_s = 0.8 * self._duracion_media_s + 0.2 * duracion_s
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "queued": self.en_cola,
+                "running": self.corriendo,
+                "max_concurrent": self.max_concurrentes,
+                "max_pending": self.max_pendientes,
+                "memory_in_use_mb": round(self.en_uso_mb, 1),
+                "memory_capacity_mb": self.capacidad_mb,
+                "avg_job_s": round(self._duracion_media_s, 1),
+                "admitted": self.admitted,
+                "rejected_full": self.rejected_full,
+                "rejected_timeout": self.rejected_timeout,
+            }
 
-    # Datos técnicos (opcional)
-    lines.append(tr(lang, "report.keydata"))
-    lines.append(f"- {tr(lang,'k.mode')}: {modo}")
-    lines.append(f"- {tr(lang,'k.room')}: {ambiente} (índice {a['sala_indice']})" if lang=="es" else f"- {tr(lang,'k.room')}: {ambiente} (index {a['sala_indice']})")
-    lines.append(f"- {tr(lang,'k.noise')}: {a['ruido_estimado_dbfs']} dBFS")
-    lines.append(f"- {tr(lang,'k.noise_conf')}: {ruido_conf}")
-    lines.append(f"- {tr(lang,'k.orig')}: {a['nivel_original_dbfs']} dBFS")
-    lines.append(f"- {tr(lang,'k.final')}: {a['nivel_final_dbfs']} dBFS")
-    lines.append(f"- {tr(lang,'k.snr')}: {a.get('snr_db', 0.0)} dB")
-    lines.append(f"- {tr(lang,'k.peak')}: {a.get('peak_dbfs', 0.0)} dBFS")
-    lines.append(f"- {tr(lang,'k.crest')}: {a.get('crest_factor_db', 0.0)} dB")
-    lines.append(f"- {tr(lang,'k.score')}: {a.get('quality_score','-')} / 100 ({quality_label})")
-    lines.append("")
-    lines.append(tr(lang, "report.clip_comment"))
-    lines.append(clip_desc)
-    lines.append("")
-    return "\n".join(lines)
 
+_admision = ControlAdmision(ADMISSION_MAX_CONCURRENT, ADMISSION_MEMORY_MB, JOB_QUEUE_MAX, ADMISSION_MAX_WAIT_S)
 
-def analysis_to_html(a: Dict[str, Any], lang: str) -> str:
-    lang = norm_lang(lang)
 
-    modo = a.get("modo_en") if lang == "en" else a.get("modo_es")
-    modo = modo or a.get("modo", "-")
+def _estimar_admision(sol: Dict[str, Any]) -> None:
+    """
+    Completa el contexto del request con el costo estimado (corre ffprobe: nunca en el event loop).
+    Lanza HTTPException si los metadatos ya alcanzan para rechazar el archivo (validar_entrada).
+    """
+    try:
+        info = inspeccionar_entrada(sol["original_path"])
+    except HTTPException as e:
+        _m_resultado.inc(f"error_{e.status_code}")
+        raise
+    sol["probe"] = info
+    sol["costo_mb"] = estimar_costo_mb(sol["input_bytes"], file_ext_lower(sol["original_path"]), info)
+    sol["admitido_en"] = time.monotonic()
+
+
+async def _admitir(sol: Dict[str, Any]) -> None:
+    await run_in_threadpool(_estimar_admision, sol)
+
+
+def _jobs_purgar() -> None:
+    limite = time.time() - JOB_TTL_S
+    with _JOBS_LOCK:
+        for bid in [b for b, l in _BATCHES.items() if l["status"] == "done" and (l.get("finished_at") or 0) < limite]:
+            del _BATCHES[bid]
+        # Los ítems de un lote viven lo que viva su manifiesto
+        viejos = [
+            jid for jid, j in _JOBS.items()
+            if j["status"] in ("done", "error") and (j.get("finished_at") or 0) < limite
+            and j.get("batch_id") not in _BATCHES
+        ]
+        for jid in viejos:
+            del _JOBS[jid]
 
-    quality_label = a.get("quality_label_en") if lang == "en" else a.get("quality_label_es")
-    quality_label = quality_label or a.get("quality_label", "-")
 
-    score = a.get("quality_score", "-")
-    peak = a.get("peak_dbfs", "-")
-    clip_detectado = bool(a.get("clip_detectado", False))
-    hot_signal = bool(a.get("hot_signal", False))
+def _jobs_pendientes() -> int:
+    with _JOBS_LOCK:
+        return sum(1 for j in _JOBS.values() if j["status"] in ("queued", "running"))
 
-    def li(label: str, value: Any) -> str:
-        return f"<li><strong>{html_escape(label)}:</strong> {html_escape(str(value))}</li>"
 
-    # -------------------------
-    # Tips educativos (arriba y abiertos)
-    # -------------------------
-    if lang == "en":
-        tips_title = "Tips to record better at home"
-        tips_summary = "Show tips"
-        tips = [
-            "Choose a room with soft stuff (curtains, carpet, sofa). Avoid empty rooms.",
-            "Don’t face a hard wall. Aim the mic toward a blanket/curtain 30–60 cm away.",
-            "DIY booth: record near a closet full of clothes or hang a blanket behind you.",
-            "Mic distance: 10–15 cm with a pop filter (or 15–20 cm slightly off-axis).",
-            "Reduce noise: turn off fan/AC, close windows, keep the mic away from the laptop.",
-            "Record 5–10 seconds of silence at the start to help cleanup and estimation.",
-        ]
-    else:
-        tips_title = "Tips para grabar mejor en casa"
-        tips_summary = "Ver tips"
-        tips = [
-            "Elige una pieza con cosas blandas (cortinas, alfombra, sofá). Evita piezas vacías.",
-            "No grabes mirando una pared dura. Mejor apunta el mic hacia una manta/cortina a 30–60 cm.",
-            "Cabina casera: graba cerca de un closet con ropa o cuelga una manta detrás tuyo.",
-            "Distancia al mic: 10–15 cm con pop filter (o 15–20 cm y un poco de lado).",
-            "Reduce ruido: apaga ventilador/AC, cierra ventanas, aleja el mic del notebook.",
-            "Graba 5–10 s de “silencio” al inicio para ayudar a limpieza/estimación del fondo.",
-        ]
+def _job_actualizar(job_id: str, **campos: Any) -> None:
+    with _JOBS_LOCK:
+        job = _JOBS.get(job_id)
+        if job is not None:
+            job.update(campos)
 
-    tips_html = (
-        "<details open style='margin-top:10px;'>"
-        f"<summary style='cursor:pointer; opacity:.95; font-weight:700;'>"
-        f"{html_escape(tips_summary)} — {html_escape(tips_title)}"
-        f"</summary>"
-        "<ul class='report-list' style='margin-top:10px;'>"
-        + "".join(f"<li>{html_escape(t)}</li>" for t in tips)
-        + "</ul>"
-        "</details>"
-    )
 
-    # -------------------------
-    # Resumen mínimo (3 líneas)
-    # -------------------------
-    items = []
-    items.append(li(tr(lang, "k.score"), f"{score} / 100 — {quality_label}"))
-    items.append(li(tr(lang, "k.mode"), modo))
+def _job_evento(job_id: str, ev: Dict[str, Any]) -> None:
+    with _JOBS_LOCK:
+        job = _JOBS.get(job_id)
+        if job is None:
+            return
+        ev = dict(ev, t=time.time())
+        job.setdefault("events", []).append(ev)
+        job["progress"] = {"stage": ev.get("stage"), "percent": ev.get("percent", 0)}
 
-    if lang == "en":
-        if clip_detectado or hot_signal:
-            status = f"Peak ~ {peak} dBFS. Risk of clipping: lower input gain."
-        else:
-            status = f"Peak ~ {peak} dBFS. No clear clipping detected."
-        status_label = "Status"
-    else:
-        if clip_detectado or hot_signal:
-            status = f"Pico ~ {peak} dBFS. Riesgo de clipping: baja la ganancia."
-        else:
-            status = f"Pico ~ {peak} dBFS. No se detecta clipping claro."
-        status_label = "Estado"
 
-    items.append(li(status_label, status))
+def _job_run(job_id: str, sol: Dict[str, Any]) -> None:
+    def progreso(ev: Dict[str, Any]) -> None:
+        # "queued" termina cuando la admisión le da turno al job
+        if ev.get("stage") == "queued":
+            _job_actualizar(job_id, status="running", started_at=time.time())
+        _job_evento(job_id, ev)
 
-    return (
-        "<div class='report-box'>"
-        + (f"<h3 style='margin:0 0 6px 0;'>Tips</h3>" if lang == "es"
-        else f"<h3 style='margin:0 0 6px 0;'>Tips</h3>")
-        + tips_html
-        + ("<h4 style='margin:14px 0 6px 0; opacity:.9;'>Resumen informe</h4>" if lang == "es"
-        else "<h4 style='margin:14px 0 6px 0; opacity:.9;'>Report summary</h4>")
-        + "<ul class='report-list'>"
-        + "".join(items)
-        + "</ul>"
-        + "</div>"
-    )
+    try:
+        result, payload = _ejecutar_procesamiento(sol, progreso=progreso)
+    except HTTPException as e:
+        _job_actualizar(
+            job_id, status="error", finished_at=time.time(), error=e.detail, error_status=e.status_code,
+            retry_after=(e.headers or {}).get("Retry-After"),
+        )
+        return
+    except Exception as e:
+        logger.exception(f"[JOBS] Error inesperado en job {job_id}: {e}")
+        _job_actualizar(job_id, status="error", finished_at=time.time(), error="Error interno procesando el audio.", error_status=500)
+        return
 
+    _job_actualizar(job_id, status="done", finished_at=time.time(), result=result)
+    if payload is not None:
+        record_metrics(payload)
 
-# =========================
-#   ENDPOINT IMPLEMENTATION
-# =========================
-async def _process_impl(
-    request: Request,
+
+async def _submit_job(
     background_tasks: BackgroundTasks,
-    audio_file: UploadFile,
-    mode_raw: str,
-    lang_raw: Optional[str],
-) -> JSONResponse:
-    t0 = time.perf_counter()
-    lang = norm_lang(lang_raw)
+    recibir: Callable[[], Awaitable[Dict[str, Any]]],
+) -> Dict[str, Any]:
+    _jobs_purgar()
+    sol, hit = await _preparar_solicitud(recibir)
+    return _crear_job(background_tasks, sol, hit)
 
-    raw_bytes = await audio_file.read(MAX_FILE_SIZE_BYTES + 1)
-    if len(raw_bytes) > MAX_FILE_SIZE_BYTES:
-        raise HTTPException(status_code=413, detail=f"Max {MAX_FILE_SIZE_MB} MB")
 
-    original_filename = audio_file.filename or "audio"
-    original_filename = os.path.basename(original_filename).replace(" ", "_")
-    if not original_filename:
-        original_filename = "audio"
+def _crear_job(
+    background_tasks: BackgroundTasks,
+    sol: Dict[str, Any],
+    hit: Optional[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]],
+) -> Dict[str, Any]:
+    job_id = uuid.uuid4().hex
+    job: Dict[str, Any] = {
+        "job_id": job_id,
+        "status": "queued",
+        "created_at": time.time(),
+        "original_filename": sol["original_filename"],
+        "lang": sol["lang"],
+    }
 
-    safe_name = f"{int(time.time())}_{original_filename}"
-    original_path = ORIGINAL_DIR / safe_name
-    with original_path.open("wb") as f:
-        f.write(raw_bytes)
+    # Cache hit: el job nace terminado
+    if hit is not None:
+        result, payload = hit
+        job.update(status="done", started_at=job["created_at"], finished_at=time.time(), result=result)
+        if payload is not None:
+            background_tasks.add_task(record_metrics, payload)
 
-    mode_code = "MICROFONO_EXTERNO" if str(mode_raw).strip() == "MICROFONO_EXTERNO" else "LAPTOP_CELULAR"
+    with _JOBS_LOCK:
+        _JOBS[job_id] = job
 
-    try:
-        processed_path, analysis = procesar_audio_core(original_path, mode_code)
-    except Exception as e:
-        logger.exception(f"Error procesando audio: {e}")
-        raise HTTPException(status_code=400, detail="No se pudo procesar el audio (formato no soportado o falta ffmpeg).")
+    if hit is None:
+        _job_executor.submit(_job_run, job_id, sol)
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "status_url": f"/api/jobs/{job_id}",
+        "events_url": f"/api/jobs/{job_id}/events",
+    }
 
-    report_name = f"{processed_path.stem}_report.txt"
-    report_path = REPORT_DIR / report_name
 
-    report_text = construir_informe_texto(safe_name, analysis, lang)
-    report_path.write_text(report_text, encoding="utf-8")
+def job_publico(job: Dict[str, Any]) -> Dict[str, Any]:
+    out = {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "created_at": job.get("created_at"),
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+        "original_filename": job.get("original_filename"),
+        "progress": job.get("progress") or {"stage": None, "percent": 100 if job["status"] == "done" else 0},
+    }
+    if job["status"] == "done":
+        out.update(job.get("result") or {})
+    elif job["status"] == "error":
+        out["error"] = job.get("error")
+        out["error_status"] = job.get("error_status")
+        if job.get("retry_after"):
+            out["retry_after"] = job["retry_after"]
+    return out
 
-    processing_ms = int(round((time.perf_counter() - t0) * 1000.0))
+# =========================
+#   LOTES (temporadas completas)
+# =========================
+# Episodios por lote (archivos sueltos + lo que traigan los zips)
+BATCH_MAX_ITEMS = max(1, int(os.getenv("BATCH_MAX_ITEMS", "50")))
+# Hilos que despachan ítems de lotes: cuántos compiten a la vez con los jobs interactivos en la admisión
+BATCH_WORKERS = max(1, int(os.getenv("BATCH_WORKERS", str(JOB_WORKERS))))
+# Nadie espera la respuesta de un ítem: puede esperar turno bastante más que un request interactivo
+BATCH_ITEM_MAX_WAIT_S = float(os.getenv("BATCH_ITEM_MAX_WAIT_S", "1800"))
+# Lo que se extrae de un zip (notas, carátulas, etc. se ignoran)
+AUDIO_EXTS = LOSSY_EXTS | {"wav", "wave", "flac", "aif", "aiff"}
 
-    if db_metrics_ready():
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch")
+# Bajo _JOBS_LOCK, igual que los jobs de sus ítems
+_BATCHES: Dict[str, Dict[str, Any]] = {}
+
+
+def _extraer_zip(zip_path: Path, cupo: int) -> list[Tuple[Path, str, str, int, str]]:
+    """
+    Extrae los audios de un zip a ORIGINAL_DIR, con el mismo formato de retorno que RecepcionMultipart.
+    Cada miembro se copia en chunks con el tope de un upload suelto, contando los bytes reales
+    (el tamaño declarado en el zip no es confiable). Si algo falla no deja archivos a medias.
+    """
+    guardados: list[Tuple[Path, str, str, int, str]] = []
+    part: Optional[Path] = None
+    try:
+        with zipfile.ZipFile(zip_path) as zf:
+            for miembro in zf.infolist():
+                nombre = os.path.basename(miembro.filename)
+                if miembro.is_dir() or nombre.startswith(".") or miembro.filename.startswith("__MACOSX/"):
+                    continue
+                if file_ext_lower(Path(nombre)) not in AUDIO_EXTS:
+                    continue
+                if len(guardados) >= cupo:
+                    raise HTTPException(status_code=413, detail=f"Max {BATCH_MAX_ITEMS} archivos por lote")
+                safe_name, original_filename = _nombre_seguro(nombre)
+                destino = ORIGINAL_DIR / safe_name
+                part = destino.with_name(safe_name + ".part")
+                hasher = hashlib.sha256()
+                total = 0
+                with zf.open(miembro) as origen, part.open("wb") as f:
+                    while chunk := origen.read(UPLOAD_CHUNK_BYTES):
+                        total += len(chunk)
+                        if total > MAX_FILE_SIZE_BYTES:
+                            raise HTTPException(status_code=413, detail=f"{original_filename}: max {MAX_FILE_SIZE_MB} MB")
+                        _escribir_chunk(f, hasher, chunk)
+                os.replace(part, destino)
+                part = None
+                guardados.append((destino, safe_name, original_filename, total, hasher.hexdigest()))
+    except BaseException as e:
+        if part is not None:
+            part.unlink(missing_ok=True)
+        for g in guardados:
+            g[0].unlink(missing_ok=True)
+        # RuntimeError: miembro cifrado; NotImplementedError: método de compresión no soportado
+        if isinstance(e, (zipfile.BadZipFile, RuntimeError, NotImplementedError)):
+            raise HTTPException(status_code=422, detail="No se pudo leer el zip (dañado, cifrado o con compresión no soportada).") from e
+        raise
+    return guardados
+
+
+async def _recibir_lote(request: Request) -> Tuple[Dict[str, str], list[Tuple[Path, str, str, int, str]]]:
+    """Recibe el form del lote en streaming, guarda los archivos sueltos y expande los zips; todo o nada."""
+    sueltos = 0
+
+    def destino(campo: str, filename: str, campos: Dict[str, str]) -> Optional[Tuple[Path, int]]:
+        nonlocal sueltos
+        if campo != "files":
+            return None
+        norm_formatos(campos.get("formats"))
+        if file_ext_lower(Path(filename)) == "zip":
+            # El zip va a un temporal: en media solo quedan los audios que trae
+            return Path(tempfile.gettempdir()), BATCH_MAX_TOTAL_MB
+        sueltos += 1
+        if sueltos > BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"Max {BATCH_MAX_ITEMS} archivos por lote")
+        return ORIGINAL_DIR, MAX_FILE_SIZE_MB
+
+    campos, archivos = await RecepcionMultipart(request, destino, BATCH_MAX_TOTAL_MB).recibir()
+    recibidos = [g for _, g in archivos]
+    guardados: list[Tuple[Path, str, str, int, str]] = []
+    try:
+        for i, guardado in enumerate(recibidos):
+            if file_ext_lower(Path(guardado[2])) != "zip":
+                if len(guardados) >= BATCH_MAX_ITEMS:
+                    raise HTTPException(status_code=413, detail=f"Max {BATCH_MAX_ITEMS} archivos por lote")
+                guardados.append(guardado)
+                continue
+            zip_path = guardado[0]
+            try:
+                guardados += await run_in_threadpool(_extraer_zip, zip_path, BATCH_MAX_ITEMS - len(guardados))
+            finally:
+                zip_path.unlink(missing_ok=True)
+                recibidos[i] = None
+    except BaseException:
+        for g in guardados + recibidos:
+            if g is not None:
+                g[0].unlink(missing_ok=True)
+        raise
+    if not guardados:
+        raise HTTPException(status_code=422, detail="El lote no trae archivos de audio.")
+    return campos, guardados
+
+
+def _lote_item_run(batch_id: str, job_id: str, sol: Dict[str, Any]) -> None:
+    """Un ítem en el pool de lotes: cache, costo estimado y, sin hit, el mismo camino que un job."""
+    try:
         try:
-            ip = request.client.host if request.client else None
-            ua = request.headers.get("user-agent")
-            payload = {
-                "id": str(uuid.uuid4()),
-                "mode": analysis.get("modo"),
-                "client_ip_hash": _anonymize_ip(ip),
-                "user_agent": ua,
-
-                "input_filename": safe_name,
-                "input_bytes": int(len(raw_bytes)),
-                "output_bytes": int(processed_path.stat().st_size) if processed_path.exists() else None,
-                "report_bytes": int(report_path.stat().st_size) if report_path.exists() else None,
-
-                "duration_original_s": float(analysis.get("duracion_original_s")) if analysis.get("duracion_original_s") is not None else None,
-                "duration_processed_s": float(analysis.get("duracion_procesada_s")) if analysis.get("duracion_procesada_s") is not None else None,
-
-                "processing_ms": processing_ms,
-
-                "quality_score": int(analysis.get("quality_score")) if analysis.get("quality_score") is not None else None,
-                "snr_db": float(analysis.get("snr_db")) if analysis.get("snr_db") is not None else None,
-                "sala_indice": float(analysis.get("sala_indice")) if analysis.get("sala_indice") is not None else None,
-                "clip_detectado": bool(analysis.get("clip_detectado")) if analysis.get("clip_detectado") is not None else None,
-            }
-            background_tasks.add_task(record_metrics, payload)
+            hit = None if sol["profile"] else _respuesta_desde_cache(sol)
+            if hit is None:
+                _estimar_admision(sol)
+        except HTTPException as e:
+            _job_actualizar(job_id, status="error", finished_at=time.time(), error=e.detail, error_status=e.status_code)
+            return
         except Exception as e:
-            logger.warning(f"[DB_METRICS] No se pudieron preparar métricas: {e}")
+            logger.exception(f"[BATCH] Error preparando {sol['safe_name']} del lote {batch_id}: {e}")
+            _job_actualizar(job_id, status="error", finished_at=time.time(), error="Error interno procesando el audio.", error_status=500)
+            return
+
+        if hit is not None:
+            result, payload = hit
+            ahora = time.time()
+            _job_actualizar(job_id, status="done", started_at=ahora, finished_at=ahora, result=result)
+            if payload is not None:
+                record_metrics(payload)
+            return
+
+        _admision.encolar()
+        _job_run(job_id, sol)
+    finally:
+        _lote_item_terminado(batch_id)
+
+
+def _items_lote(lote: Dict[str, Any]) -> list[Dict[str, Any]]:
+    """Estado por ítem (llamar con _JOBS_LOCK tomado)."""
+    items = []
+    for indice, job_id in enumerate(lote["job_ids"]):
+        job = _JOBS.get(job_id)
+        if job is None:
+            items.append({"index": indice, "job_id": job_id, "status": "expired", "original_filename": None})
+            continue
+        publico = job_publico(job)
+        publico.pop("analysis_html", None)
+        items.append({"index": indice, "status_url": f"/api/jobs/{job_id}", **publico})
+    return items
+
+
+def _lote_item_terminado(batch_id: str) -> None:
+    """Al terminar el último ítem escribe el informe agregado y cierra el lote."""
+    with _JOBS_LOCK:
+        lote = _BATCHES.get(batch_id)
+        if lote is None or lote.get("cerrando"):
+            return
+        if any((_JOBS.get(j) or {}).get("status") in ("queued", "running") for j in lote["job_ids"]):
+            return
+        lote["cerrando"] = True
+        items = _items_lote(lote)
+
+    report_name = f"lote_{batch_id}_report_{lote['lang']}.txt"
+    try:
+        (REPORT_DIR / report_name).write_text(informe_lote_texto(items, lote["lang"]), encoding="utf-8")
+        _retencion.registrar(REPORT_DIR / report_name)
+    except OSError as e:
+        logger.warning(f"[BATCH] No se pudo escribir el informe del lote {batch_id}: {e}")
+        report_name = None
 
-    original_url = f"/media/original/{safe_name}"
-    processed_url = f"/media/processed/{processed_path.name}"
-    report_url = f"/media/reports/{report_name}"
+    resumen = resumen_lote(items)
+    with _JOBS_LOCK:
+        lote.update(status="done", finished_at=time.time(), report_name=report_name)
+    logger.info(f"[BATCH] Lote {batch_id}: {resumen['done']}/{resumen['total']} procesados, {resumen['error']} con error")
 
-    analysis_html = analysis_to_html(analysis, lang)
 
-    return JSONResponse(
-        {
-            # Legacy (tu app.js)
-            "original_audio_url": original_url,
-            "processed_audio_url": processed_url,
-            "report_url": report_url,
-            "analysis_html": analysis_html,
-
-            # Extra
-            "original_url": original_url,
-            "processed_url": processed_url,
-            "original_filename": original_filename,
-            "analysis": analysis,
-            "lang": lang,
-        }
-    )
+async def _submit_batch(request: Request) -> Dict[str, Any]:
+    _jobs_purgar()
+    t0 = time.perf_counter()
+    campos, guardados = await _recibir_lote(request)
+    try:
+        formats = norm_formatos(campos.get("formats"))
+    except HTTPException:
+        for g in guardados:
+            g[0].unlink(missing_ok=True)
+        raise
+    mode_raw = _campo(campos, "mode", defecto="LAPTOP_CELULAR")
+    lang_raw = _campo(campos, "lang", defecto="es")
+
+    batch_id = uuid.uuid4().hex
+    ahora = time.time()
+    lote: Dict[str, Any] = {
+        "batch_id": batch_id,
+        "status": "running",
+        "created_at": ahora,
+        "mode": norm_modo(mode_raw),
+        "lang": norm_lang(lang_raw),
+        "formats": list(formats),
+        "job_ids": [],
+    }
+    tareas = []
+    for guardado in guardados:
+        sol = _nueva_solicitud(request, guardado, mode_raw, lang_raw, formats, t0)
+        sol["espera_max_s"] = BATCH_ITEM_MAX_WAIT_S
+        job_id = uuid.uuid4().hex
+        lote["job_ids"].append(job_id)
+        tareas.append((job_id, sol, {
+            "job_id": job_id,
+            "status": "queued",
+            "created_at": ahora,
+            "original_filename": sol["original_filename"],
+            "lang": sol["lang"],
+            "batch_id": batch_id,
+        }))
+
+    with _JOBS_LOCK:
+        _BATCHES[batch_id] = lote
+        for job_id, _, job in tareas:
+            _JOBS[job_id] = job
+    # En orden: el pool de lotes los toma FIFO y la admisión los intercala con los jobs interactivos
+    for job_id, sol, _ in tareas:
+        _batch_executor.submit(_lote_item_run, batch_id, job_id, sol)
+
+    logger.info(f"[BATCH] Lote {batch_id} con {len(tareas)} archivos")
+    return lote_publico(batch_id)
+
+
+def lote_publico(batch_id: str) -> Dict[str, Any]:
+    with _JOBS_LOCK:
+        lote = _BATCHES.get(batch_id)
+        if lote is None:
+            raise HTTPException(status_code=404, detail="Lote no encontrado.")
+        lote = dict(lote)
+        items = _items_lote(lote)
+    out = {
+        "batch_id": batch_id,
+        "status": lote["status"],
+        "created_at": lote["created_at"],
+        "finished_at": lote.get("finished_at"),
+        "mode": lote["mode"],
+        "lang": lote["lang"],
+        "formats": lote["formats"],
+        "status_url": f"/api/batch/{batch_id}",
+        "summary": resumen_lote(items),
+        "items": items,
+    }
+    if lote.get("report_name"):
+        out["report_url"] = f"/media/reports/{lote['report_name']}"
+    return out
 
 # =========================
 #   ENDPOINTS
 # =========================
+# Los uploads multipart se leen en streaming (RecepcionMultipart), no con File()/Form():
+# el form se documenta en cada endpoint.
 @app.post("/process")
 async def process_legacy(request: Request, background_tasks: BackgroundTasks):
-    form = await request.form()
+    # file|audio_file, modo|mode (LAPTOP_CELULAR), lang|language (es), formats
+    return await _process_impl(request, background_tasks, lambda: _recibir_solicitud(
+        request, ("file", "audio_file"), ("modo", "mode"), ("lang", "language"), "LAPTOP_CELULAR",
+    ))
+
+
+@app.post("/api/process_audio", status_code=202)
+async def process_audio(request: Request, background_tasks: BackgroundTasks):
+    # Form: audio_file, mode (obligatorio), lang (es), formats
+    # Devuelve el job_id de inmediato; el resultado se consulta en GET /api/jobs/{job_id}
+    # formats: entregas extra separadas por coma (flac, opus, mp3); el WAV sale siempre
+    return await _submit_job(background_tasks, lambda: _recibir_solicitud(request))
+
+
+@app.post("/api/analyze")
+async def analyze_audio(request: Request):
+    # Form: audio_file, mode (LAPTOP_CELULAR), lang (es)
+    # Solo puntaje y diagnóstico (clipping / ruido) del original, sin procesar ni guardar media
+    return await _analizar_impl(request)
+
+
+@app.post("/api/uploads", status_code=201)
+async def crear_subida(
+    filename: str = Form(...),
+    size: int = Form(...),
+    sha256: Optional[str] = Form(None),
+):
+    # Subida reanudable: los bytes van por PATCH a upload_url (header Upload-Offset + cuerpo crudo)
+    # y POST {upload_url}/finalize los entrega al pipeline. sha256 acá o al finalizar.
+    return await run_in_threadpool(_subidas.crear, filename, size, norm_sha256(sha256))
 
-    audio_file = form.get("file") or form.get("audio_file")
-    mode = form.get("modo") or form.get("mode") or "LAPTOP_CELULAR"
-    lang = form.get("lang") or form.get("language") or "es"
 
-    if audio_file is None or not hasattr(audio_file, "read"):
-        raise HTTPException(status_code=422, detail="Falta archivo (file).")
+@app.head("/api/uploads/{upload_id}")
+async def offset_subida(upload_id: str):
+    # Para retomar: Upload-Offset es lo que ya llegó
+    estado = await run_in_threadpool(_subidas.estado, upload_id)
+    return Response(status_code=200, headers={
+        "Upload-Offset": str(estado["offset"]),
+        "Upload-Length": str(estado["size"]),
+        "Cache-Control": "no-store",
+    })
 
-    return await _process_impl(request, background_tasks, audio_file, str(mode), str(lang))
 
+@app.get("/api/uploads/{upload_id}")
+async def estado_subida(upload_id: str):
+    return await run_in_threadpool(_subidas.estado, upload_id)
 
-@app.post("/api/process_audio")
-async def process_audio(
+
+@app.patch("/api/uploads/{upload_id}")
+async def subir_trozo(upload_id: str, request: Request):
+    try:
+        offset = int(request.headers.get("upload-offset", ""))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Falta el header Upload-Offset.")
+    # Un trozo se escribe entero o nada: si la conexión se corta acá, el cliente lo reenvía
+    datos = bytearray()
+    async for chunk in request.stream():
+        datos += chunk
+        if len(datos) > UPLOAD_SESSION_CHUNK_BYTES:
+            raise HTTPException(status_code=413, detail=f"Max {UPLOAD_SESSION_CHUNK_MB} MB por trozo")
+    nuevo = await run_in_threadpool(_subidas.escribir, upload_id, offset, datos)
+    return Response(status_code=204, headers={"Upload-Offset": str(nuevo), "Cache-Control": "no-store"})
+
+
+@app.post("/api/uploads/{upload_id}/finalize", status_code=202)
+async def finalizar_subida(
+    upload_id: str,
     request: Request,
     background_tasks: BackgroundTasks,
-    audio_file: UploadFile = File(...),
     mode: str = Form(...),
     lang: str = Form("es"),
+    formats: Optional[str] = Form(None),
+    sha256: Optional[str] = Form(None),
 ):
-    return await _process_impl(request, background_tasks, audio_file, mode, lang)
\ No newline at end of file
+    # Verifica tamaño + sha256 y sigue igual que /api/process_audio (devuelve el job)
+    _jobs_purgar()
+    formatos = norm_formatos(formats)
+    esperado = norm_sha256(sha256)
+    sol, hit = await _preparar_solicitud(
+        lambda: _recibir_subida(request, upload_id, mode, lang, formatos, esperado)
+    )
+    return _crear_job(background_tasks, sol, hit)
+
+
+@app.delete("/api/uploads/{upload_id}", status_code=204)
+async def cancelar_subida(upload_id: str):
+    await run_in_threadpool(_subidas.cancelar, upload_id)
+    return Response(status_code=204)
+
+
+@app.post("/api/batch", status_code=202)
+async def process_batch(request: Request):
+    # Form: files, mode (LAPTOP_CELULAR), lang (es), formats
+    # files: varios audios (campo repetido) y/o zips; cada ítem corre como un job (GET /api/jobs/{id})
+    # y el manifiesto con el informe agregado se consulta en GET /api/batch/{batch_id}
+    return await _submit_batch(request)
+
+
+@app.get("/api/batch/{batch_id}")
+async def get_batch(batch_id: str):
+    return lote_publico(batch_id)
+
+
+# Cada cuánto el stream SSE revisa eventos nuevos y cada cuánto manda keepalive
+SSE_POLL_S = 0.25
+SSE_KEEPALIVE_S = 15.0
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Server-Sent Events: "progress" por etapa y un evento final "done" / "error" con el job."""
+    with _JOBS_LOCK:
+        if job_id not in _JOBS:
+            raise HTTPException(status_code=404, detail="Job no encontrado.")
+
+    async def stream():
+        enviados = 0
+        ultimo_envio = time.monotonic()
+        while True:
+            with _JOBS_LOCK:
+                job = _JOBS.get(job_id)
+                snapshot = dict(job) if job is not None else None
+                nuevos = list((job or {}).get("events", [])[enviados:])
+            if snapshot is None:
+                yield "event: error\ndata: {\"error\": \"job expirado\"}\n\n"
+                return
+
+            for ev in nuevos:
+                yield f"event: progress\ndata: {json.dumps(ev)}\n\n"
+                enviados += 1
+                ultimo_envio = time.monotonic()
+
+            if snapshot["status"] in ("done", "error"):
+                yield f"event: {snapshot['status']}\ndata: {json.dumps(job_publico(snapshot), ensure_ascii=False)}\n\n"
+                return
+
+            if await request.is_disconnected():
+                return
+            if time.monotonic() - ultimo_envio > SSE_KEEPALIVE_S:
+                yield ": keepalive\n\n"
+                ultimo_envio = time.monotonic()
+            await asyncio.sleep(SSE_POLL_S)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    with _JOBS_LOCK:
+        job = _JOBS.get(job_id)
+        snapshot = dict(job) if job is not None else None
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado.")
+    return job_publico(snapshot)
+# =========================
+#   CLI (lotes locales, sin servidor HTTP)
+# =========================
+def procesar_archivo_local(path: Path, mode_code: str, formatos: Tuple[str, ...], lang: str) -> Dict[str, Any]:
+    """Un archivo de la CLI (corre en un proceso del pool): procesa, codifica y escribe su informe."""
+    t0 = time.perf_counter()
+    item: Dict[str, Any] = {"original_filename": path.name, "source": str(path)}
+    try:
+        info = inspeccionar_entrada(path)
+        processed_path, analysis = procesar_audio_core(path, mode_code, formatos=formatos, info=info)
+        faltantes = tuple(fmt for fmt in formatos if not ruta_formato(processed_path, fmt).is_file())
+        codificar_formatos(processed_path, faltantes)
+        report_path = REPORT_DIR / f"{processed_path.stem}_report_{lang}.txt"
+        report_path.write_text(construir_informe_texto(path.name, analysis, lang), encoding="utf-8")
+        item.update(
+            status="done",
+            analysis=analysis,
+            outputs={fmt: str(ruta_formato(processed_path, fmt)) for fmt in ("wav", *formatos)},
+            report=str(report_path),
+        )
+    except Exception as e:
+        logger.exception(f"[CLI] Error procesando {path}: {e}")
+        item.update(status="error", error=str(e) or type(e).__name__)
+    item["processing_s"] = round(time.perf_counter() - t0, 2)
+    return item
+
+
+def main_cli(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="main.py", description="Herramientas de línea de comandos de podcasterapp.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p = sub.add_parser("batch", help="Procesa todos los audios de un directorio en paralelo, sin levantar el servidor.")
+    p.add_argument("directorio", type=Path)
+    p.add_argument("--mode", default="LAPTOP_CELULAR", choices=["LAPTOP_CELULAR", "MICROFONO_EXTERNO"])
+    p.add_argument("--lang", default="es", choices=sorted(SUPPORTED_LANGS))
+    p.add_argument("--formats", default=None, help=f"entregas extra separadas por coma ({', '.join(FORMATOS_SALIDA)})")
+    p.add_argument("--workers", type=int, default=PROCESS_WORKERS, help="procesos en paralelo")
+    p.add_argument("--manifest", type=Path, default=None, help="escribe el manifiesto JSON acá (por defecto stdout)")
+    args = parser.parse_args(argv)
+
+    try:
+        formatos = norm_formatos(args.formats)
+    except HTTPException as e:
+        parser.error(str(e.detail))
+    if not args.directorio.is_dir():
+        parser.error(f"No es un directorio: {args.directorio}")
+
+    archivos = sorted(p for p in args.directorio.iterdir() if p.is_file() and file_ext_lower(p) in AUDIO_EXTS)
+    if not archivos:
+        parser.error(f"No hay audios en {args.directorio}")
+
+    # La salida se nombra por el stem: ep1.wav y ep1.mp3 se pisarían
+    items: list[Optional[Dict[str, Any]]] = [None] * len(archivos)
+    pendientes: Dict[int, Path] = {}
+    vistos: Dict[str, Path] = {}
+    for i, path in enumerate(archivos):
+        if path.stem in vistos:
+            items[i] = {
+                "original_filename": path.name, "source": str(path), "status": "error",
+                "error": f"Mismo nombre de salida que {vistos[path.stem].name}",
+            }
+        else:
+            vistos[path.stem] = path
+            pendientes[i] = path
+
+    logger.info(f"[CLI] {len(pendientes)} archivos con {args.workers} procesos")
+    t0 = time.perf_counter()
+    if args.workers <= 1:
+        for i, path in pendientes.items():
+            items[i] = procesar_archivo_local(path, args.mode, formatos, args.lang)
+            logger.info(f"[CLI] {path.name}: {items[i]['status']} ({items[i]['processing_s']}s)")
+    else:
+        # spawn, igual que el backend de procesos del servidor
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futuros = {pool.submit(procesar_archivo_local, path, args.mode, formatos, args.lang): i for i, path in pendientes.items()}
+            for fut in as_completed(futuros):
+                i = futuros[fut]
+                try:
+                    items[i] = fut.result()
+                except Exception as e:  # worker caído (OOM, segfault en un decoder)
+                    items[i] = {"original_filename": archivos[i].name, "source": str(archivos[i]), "status": "error", "error": str(e)}
+                logger.info(f"[CLI] {archivos[i].name}: {items[i]['status']}")
+
+    batch_id = f"{int(time.time())}_{uuid.uuid4().hex[:8]}"
+    report_path = REPORT_DIR / f"lote_{batch_id}_report_{args.lang}.txt"
+    report_path.write_text(informe_lote_texto(items, args.lang), encoding="utf-8")
+    manifiesto = {
+        "batch_id": batch_id,
+        "directory": str(args.directorio),
+        "mode": args.mode,
+        "formats": list(formatos),
+        "wall_s": round(time.perf_counter() - t0, 2),
+        "report": str(report_path),
+        "summary": resumen_lote(items),
+        "items": items,
+    }
+    texto = json.dumps(manifiesto, ensure_ascii=False, indent=2)
+    if args.manifest is not None:
+        args.manifest.write_text(texto, encoding="utf-8")
+    else:
+        print(texto)
+    return 0 if manifiesto["summary"]["error"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
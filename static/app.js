@@ -108,8 +108,26 @@ document.addEventListener("DOMContentLoaded", () => {
       // Estados / errores dinámicos
       "status.idle": "",
       "status.uploading": "Subiendo audio…",
+      "status.uploadingPct": "Subiendo audio… {percent}%",
       "status.processing": "Procesando audio…",
       "status.done": "Procesamiento completado.",
+      "status.progress": "{stage}… {percent}%",
+      "stage.queued": "En cola",
+      "stage.probe": "Revisando archivo",
+      "stage.decode": "Decodificando",
+      "stage.decode_analyze": "Decodificando y analizando",
+      "stage.analyze": "Analizando",
+      "stage.trim": "Recortando bordes",
+      "stage.highpass": "Filtrando",
+      "stage.compress": "Comprimiendo",
+      "stage.dsp": "Procesando",
+      "stage.fade": "Aplicando fade",
+      "stage.ceiling": "Ajustando techo",
+      "stage.loudness": "Normalizando loudness",
+      "stage.analyze_processed": "Revisando resultado",
+      "stage.export": "Exportando",
+      "stage.peaks": "Calculando forma de onda",
+      "stage.report": "Generando informe",
       "status.error.noServer":
         "No se pudo conectar con el servidor. Revisa tu conexión e intenta de nuevo.",
       "status.error.generic":
@@ -202,8 +220,26 @@ document.addEventListener("DOMContentLoaded", () => {
       // Status / errors
       "status.idle": "",
       "status.uploading": "Uploading audio…",
+      "status.uploadingPct": "Uploading audio… {percent}%",
       "status.processing": "Processing audio…",
       "status.done": "Processing complete.",
+      "status.progress": "{stage}… {percent}%",
+      "stage.queued": "Queued",
+      "stage.probe": "Checking file",
+      "stage.decode": "Decoding",
+      "stage.decode_analyze": "Decoding and analyzing",
+      "stage.analyze": "Analyzing",
+      "stage.trim": "Trimming edges",
+      "stage.highpass": "Filtering",
+      "stage.compress": "Compressing",
+      "stage.dsp": "Processing",
+      "stage.fade": "Applying fade",
+      "stage.ceiling": "Adjusting ceiling",
+      "stage.loudness": "Normalizing loudness",
+      "stage.analyze_processed": "Checking result",
+      "stage.export": "Exporting",
+      "stage.peaks": "Computing waveform",
+      "stage.report": "Building report",
       "status.error.noServer":
         "Couldn't reach the server. Check your connection and try again.",
       "status.error.generic":
@@ -458,6 +494,245 @@ document.addEventListener("DOMContentLoaded", () => {
     });
   }
 
+  function setProgress(ev) {
+    if (!statusEl || !ev || !ev.stage) return;
+    const stageKey = `stage.${ev.stage}`;
+    const stage = t(stageKey) === stageKey ? ev.stage : t(stageKey);
+    statusEl.textContent = t("status.progress", { stage, percent: ev.percent ?? 0 });
+  }
+
+  function showResult(data) {
+    // Backend expected keys: processed_audio_url, original_audio_url, report_url, analysis_html
+    if (playerOriginal && data.original_audio_url) playerOriginal.src = data.original_audio_url;
+    if (playerProcessed && data.processed_audio_url) playerProcessed.src = data.processed_audio_url;
+
+    lastProcessedAudioUrl = data.processed_audio_url || null;
+    lastReportUrl = data.report_url || null;
+
+    if (analysisEl) {
+      analysisEl.innerHTML = data.analysis_html || "";
+    }
+
+    if (resultSection) {
+      resultSection.classList.remove("hidden");
+      resultSection.scrollIntoView({ behavior: "smooth", block: "start" });
+    }
+
+    setStatus("status.done");
+  }
+
+  // Polling de respaldo si el navegador no soporta EventSource o se corta el stream
+  async function pollJob(statusUrl) {
+    for (;;) {
+      const resp = await fetch(statusUrl);
+      if (!resp.ok) throw new Error(resp.status >= 500 ? "server" : "bad request");
+      const job = await resp.json();
+      if (job.status === "done") return job;
+      if (job.status === "error") throw new Error(job.error_status >= 500 ? "server" : "job error");
+      if (job.progress) setProgress(job.progress);
+      await new Promise((r) => setTimeout(r, 1000));
+    }
+  }
+
+  // Progreso por Server-Sent Events: un evento "progress" por etapa y "done"/"error" al final
+  function waitForJob(job) {
+    if (!window.EventSource || !job.events_url) return pollJob(job.status_url);
+
+    return new Promise((resolve, reject) => {
+      const es = new EventSource(job.events_url);
+      let finished = false;
+
+      es.addEventListener("progress", (e) => {
+        try {
+          setProgress(JSON.parse(e.data));
+        } catch (_) {}
+      });
+
+      es.addEventListener("done", (e) => {
+        finished = true;
+        es.close();
+        resolve(JSON.parse(e.data));
+      });
+
+      es.addEventListener("error", (e) => {
+        if (finished) return;
+        finished = true;
+        es.close();
+        // Evento "error" del servidor (trae data) vs. corte de conexión (sin data)
+        if (e.data) {
+          let job = {};
+          try {
+            job = JSON.parse(e.data);
+          } catch (_) {}
+          reject(new Error(job.error_status >= 500 ? "server" : "job error"));
+        } else {
+          pollJob(job.status_url).then(resolve, reject);
+        }
+      });
+    });
+  }
+
+  // Subida reanudable: trozos por PATCH que se retoman desde el offset del servidor si la conexión se corta
+  const UPLOAD_RETRIES = 6;
+
+  function httpError(resp) {
+    const err = new Error(resp.status >= 500 ? "server" : "bad request");
+    err.status = resp.status;
+    return err;
+  }
+
+  // SHA-256 incremental: crypto.subtle.digest pide el archivo entero en memoria,
+  // así que se hashea cada trozo a medida que se lee para subirlo
+  const SHA256_K = new Uint32Array([
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
+  ]);
+
+  class Sha256 {
+    constructor() {
+      this.h = new Uint32Array([
+        0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19,
+      ]);
+      this.w = new Uint32Array(64);
+      this.pending = new Uint8Array(64);
+      this.pendingLen = 0;
+      this.length = 0;
+    }
+
+    update(bytes) {
+      let i = 0;
+      this.length += bytes.length;
+      if (this.pendingLen) {
+        i = Math.min(64 - this.pendingLen, bytes.length);
+        this.pending.set(bytes.subarray(0, i), this.pendingLen);
+        this.pendingLen += i;
+        if (this.pendingLen < 64) return;
+        this.block(this.pending, 0);
+        this.pendingLen = 0;
+      }
+      for (; i + 64 <= bytes.length; i += 64) this.block(bytes, i);
+      this.pending.set(bytes.subarray(i), 0);
+      this.pendingLen = bytes.length - i;
+    }
+
+    block(bytes, p) {
+      const w = this.w;
+      for (let j = 0; j < 16; j++, p += 4) {
+        w[j] = (bytes[p] << 24) | (bytes[p + 1] << 16) | (bytes[p + 2] << 8) | bytes[p + 3];
+      }
+      for (let j = 16; j < 64; j++) {
+        const x = w[j - 15];
+        const y = w[j - 2];
+        const s0 = ((x >>> 7) | (x << 25)) ^ ((x >>> 18) | (x << 14)) ^ (x >>> 3);
+        const s1 = ((y >>> 17) | (y << 15)) ^ ((y >>> 19) | (y << 13)) ^ (y >>> 10);
+        w[j] = w[j - 16] + s0 + w[j - 7] + s1;
+      }
+      let [a, b, c, d, e, f, g, h] = this.h;
+      for (let j = 0; j < 64; j++) {
+        const S1 = ((e >>> 6) | (e << 26)) ^ ((e >>> 11) | (e << 21)) ^ ((e >>> 25) | (e << 7));
+        const t1 = (h + S1 + ((e & f) ^ (~e & g)) + SHA256_K[j] + w[j]) | 0;
+        const S0 = ((a >>> 2) | (a << 30)) ^ ((a >>> 13) | (a << 19)) ^ ((a >>> 22) | (a << 10));
+        const t2 = (S0 + ((a & b) ^ (a & c) ^ (b & c))) | 0;
+        h = g;
+        g = f;
+        f = e;
+        e = (d + t1) | 0;
+        d = c;
+        c = b;
+        b = a;
+        a = (t1 + t2) | 0;
+      }
+      // Uint32Array reduce cada suma módulo 2^32
+      this.h[0] += a;
+      this.h[1] += b;
+      this.h[2] += c;
+      this.h[3] += d;
+      this.h[4] += e;
+      this.h[5] += f;
+      this.h[6] += g;
+      this.h[7] += h;
+    }
+
+    hex() {
+      const bits = this.length * 8;
+      const padding = new Uint8Array((this.pendingLen < 56 ? 64 : 128) - this.pendingLen);
+      padding[0] = 0x80;
+      const view = new DataView(padding.buffer);
+      view.setUint32(padding.length - 8, Math.floor(bits / 2 ** 32));
+      view.setUint32(padding.length - 4, bits >>> 0);
+      this.update(padding);
+      return Array.from(this.h, (x) => x.toString(16).padStart(8, "0")).join("");
+    }
+  }
+
+  // Devuelve la sesión y el sha256 del archivo (se manda al finalizar)
+  async function uploadResumable(file) {
+    const init = new FormData();
+    init.append("filename", file.name);
+    init.append("size", String(file.size));
+
+    const resp = await fetch("/api/uploads", { method: "POST", body: init });
+    if (!resp.ok) throw httpError(resp);
+    const session = await resp.json();
+
+    // El hash avanza en orden por el archivo; los reintentos no lo vuelven a sumar
+    const hasher = new Sha256();
+    let hashed = 0;
+    const hashUntil = async (limit) => {
+      while (hashed < limit) {
+        const end = Math.min(hashed + session.chunk_max_bytes, limit);
+        hasher.update(new Uint8Array(await file.slice(hashed, end).arrayBuffer()));
+        hashed = end;
+      }
+    };
+    // Si se retoma una sesión, lo ya subido se hashea desde el archivo local
+    await hashUntil(session.offset);
+
+    let offset = session.offset;
+    let retries = 0;
+    while (offset < file.size) {
+      const end = Math.min(offset + session.chunk_max_bytes, file.size);
+      const bytes = new Uint8Array(await file.slice(offset, end).arrayBuffer());
+      if (offset === hashed) {
+        hasher.update(bytes);
+        hashed = end;
+      }
+      try {
+        const r = await fetch(session.upload_url, {
+          method: "PATCH",
+          headers: { "Upload-Offset": String(offset), "Content-Type": "application/offset+octet-stream" },
+          body: bytes,
+        });
+        // 409: el servidor va en otro offset (ej. el trozo llegó pero se perdió la respuesta)
+        if (r.ok || r.status === 409) {
+          offset = Number(r.headers.get("Upload-Offset"));
+          retries = 0;
+          if (statusEl) statusEl.textContent = t("status.uploadingPct", { percent: Math.floor((offset / file.size) * 100) });
+          continue;
+        }
+        if (r.status < 500) throw httpError(r);
+      } catch (err) {
+        if (err.status && err.status < 500) throw err;
+      }
+
+      // Corte de red o 5xx: espera y pregunta hasta dónde llegó antes de seguir
+      if (++retries > UPLOAD_RETRIES) throw new Error("server");
+      await new Promise((r) => setTimeout(r, 1000 * 2 ** (retries - 1)));
+      try {
+        const head = await fetch(session.upload_url, { method: "HEAD" });
+        if (head.ok) offset = Number(head.headers.get("Upload-Offset"));
+      } catch (_) {}
+    }
+    await hashUntil(file.size);
+    return { session, sha256: hasher.hex() };
+  }
+
   async function processAudio() {
     clearError();
 
@@ -475,40 +750,31 @@ document.addEventListener("DOMContentLoaded", () => {
     setStatus("status.uploading");
 
     const form = new FormData();
-    form.append("file", file);
-    form.append("modo", getSelectedMode());
+    form.append("mode", getSelectedMode());
     form.append("lang", currentLang);
 
-
     try {
-      setStatus("status.processing");
-
-      const resp = await fetch("/process", { method: "POST", body: form });
+      const { session, sha256 } = await uploadResumable(file);
+      form.append("sha256", sha256);
+      const resp = await fetch(`${session.upload_url}/finalize`, { method: "POST", body: form });
       if (!resp.ok) {
+        if (resp.status === 413) {
+          setStatus("status.idle");
+          return showError("status.error.tooBig");
+        }
         if (resp.status >= 500) throw new Error("server");
         throw new Error("bad request");
       }
 
-      const data = await resp.json();
-
-      // Backend expected keys: processed_audio_url, original_audio_url, report_url, analysis_html
-      if (playerOriginal && data.original_audio_url) playerOriginal.src = data.original_audio_url;
-      if (playerProcessed && data.processed_audio_url) playerProcessed.src = data.processed_audio_url;
-
-      lastProcessedAudioUrl = data.processed_audio_url || null;
-      lastReportUrl = data.report_url || null;
-
-      if (analysisEl) {
-        analysisEl.innerHTML = data.analysis_html || "";
-      }
-
-      if (resultSection) {
-        resultSection.classList.remove("hidden");
-        resultSection.scrollIntoView({ behavior: "smooth", block: "start" });
-      }
-
-      setStatus("status.done");
+      setStatus("status.processing");
+      const job = await resp.json();
+      const data = await waitForJob(job);
+      showResult(data);
     } catch (err) {
+      if (err.status === 413) {
+        setStatus("status.idle");
+        return showError("status.error.tooBig");
+      }
       if (String(err).includes("server")) showError("status.error.noServer");
       else showError("status.error.generic");
       setStatus("status.idle");
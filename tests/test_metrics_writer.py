@@ -0,0 +1,148 @@
+"""MetricsWriter contra una conexión falsa inyectada por connect (sin Postgres)."""
+import threading
+import time
+
+import pytest
+
+import main
+
+N_COLUMNAS = len(main.METRICS_COLUMNS)
+
+
+class ConexionFalsa:
+    """Registra cada INSERT como la lista de ids de sus filas; falla mientras fallar > 0."""
+
+    def __init__(self, registro: "StandIn"):
+        self.registro = registro
+        self.cerrada = False
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        with self.registro.lock:
+            if self.registro.fallar > 0:
+                self.registro.fallar -= 1
+                raise RuntimeError("db caída")
+            assert sql.startswith("INSERT INTO request_metrics")
+            assert len(params) % N_COLUMNAS == 0
+            self.registro.inserts.append(params[::N_COLUMNAS])
+
+    def close(self):
+        self.cerrada = True
+
+
+class StandIn:
+    def __init__(self, fallar: int = 0):
+        self.fallar = fallar
+        self.lock = threading.Lock()
+        self.inserts: list = []
+        self.conexiones: list = []
+
+    def connect(self):
+        conn = ConexionFalsa(self)
+        self.conexiones.append(conn)
+        return conn
+
+    def ids(self) -> list:
+        return [i for insert in self.inserts for i in insert]
+
+
+def _writer(db: StandIn, **kwargs) -> main.MetricsWriter:
+    kwargs.setdefault("batch_size", 3)
+    kwargs.setdefault("flush_interval_s", 60.0)
+    kwargs.setdefault("buffer_max", 100)
+    return main.MetricsWriter(db.connect, **kwargs)
+
+
+def _encolar(writer: main.MetricsWriter, ids) -> None:
+    for i in ids:
+        writer.enqueue({"id": str(i), "mode": "LAPTOP_CELULAR"})
+
+
+def test_inserts_en_lotes_con_una_conexion():
+    db = StandIn()
+    writer = _writer(db)
+    _encolar(writer, range(7))
+
+    assert writer.flush() == 7
+    assert db.inserts == [["0", "1", "2"], ["3", "4", "5"], ["6"]]
+    assert len(db.conexiones) == 1
+    assert writer.stats() == {"buffered": 0, "written": 7, "batches": 3, "dropped": 0, "errors": 0}
+
+
+def test_buffer_lleno_descarta_las_mas_viejas():
+    db = StandIn()
+    writer = _writer(db, buffer_max=5)
+    _encolar(writer, range(8))
+
+    assert writer.stats()["dropped"] == 3
+    assert writer.stats()["buffered"] == 5
+    writer.flush()
+    assert db.ids() == ["3", "4", "5", "6", "7"]
+
+
+def test_falla_devuelve_las_filas_y_reconecta():
+    db = StandIn(fallar=1)
+    writer = _writer(db)
+    _encolar(writer, range(4))
+
+    assert writer.flush() == 0
+    assert writer.stats()["errors"] == 1
+    assert writer.stats()["buffered"] == 4
+    assert db.conexiones[0].cerrada
+
+    assert writer.flush() == 4
+    assert db.ids() == ["0", "1", "2", "3"]
+    assert len(db.conexiones) == 2
+
+
+def test_el_hilo_escribe_al_llenar_un_lote():
+    db = StandIn()
+    writer = _writer(db)
+    writer.start()
+    try:
+        _encolar(writer, range(3))
+        limite = time.monotonic() + 5
+        while not db.inserts and time.monotonic() < limite:
+            time.sleep(0.01)
+        assert db.inserts == [["0", "1", "2"]]
+    finally:
+        writer.close()
+
+
+def test_close_vacia_el_buffer():
+    db = StandIn()
+    writer = _writer(db)
+    writer.start()
+    # Menos de un lote y flush_interval_s largo: solo el close las escribe
+    _encolar(writer, range(2))
+    t0 = time.monotonic()
+    writer.close()
+
+    assert time.monotonic() - t0 < 5
+    assert db.ids() == ["0", "1"]
+    assert db.conexiones[-1].cerrada
+    assert writer.stats() == {"buffered": 0, "written": 2, "batches": 1, "dropped": 0, "errors": 0}
+
+
+@pytest.mark.parametrize("con_hilo", [True, False])
+def test_close_con_db_caida_cuenta_descartadas(con_hilo):
+    db = StandIn(fallar=100)
+    writer = _writer(db)
+    if con_hilo:
+        writer.start()
+    _encolar(writer, range(2))
+    writer.close()
+
+    stats = writer.stats()
+    assert stats["written"] == 0
+    assert stats["dropped"] == 2
+    assert stats["buffered"] == 0
+    assert stats["errors"] >= 1